@@ -1,240 +1,622 @@
+import json
 import os
-from flask import Flask, render_template, jsonify, session, request
-import random
-from datetime import datetime
+from flask import Blueprint, Flask, Response, render_template, jsonify, session, request
+from datetime import datetime, timezone
+from assets import asset_manifest
 from database import db
+from ledger import ledger, spin_record
+from metrics import metrics
+from snapshot_cache import SnapshotCache
+import spin_codec
+from bonus import play_round
+from bootstrap import bootstrap_command
+from startup import startup_timer
+from spin_history import spin_history
+from provenance import provenance
+from rollups import stat_rollups
+from rtp_monitor import rtp_monitor
+from stat_counters import stat_counters
+from wallet import wallets
+from games import DEFAULT_GAME, GAMES_DIR, game_registry
+from rng import rng_source
+
+# Bet of free spins banked without one (see /bonus_round)
+MIN_BET = 0.20
+
+# Upper bound on spins resolved by one /spin_batch request
+MAX_BATCH_SPINS = 100
+
+# Page size limits of /history
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+bp = Blueprint('slot', __name__)
+
+
+def create_app(config=None):
+    """
+    Build the Flask app.
+
+    Does no database I/O: the schema is created and upgraded by
+    ``bootstrap.py``, and extensions connect lazily on first use.
+    """
+    app = Flask(__name__, static_folder='static', static_url_path='/static')
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
+
+    # Configure SQLAlchemy
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    if not (app.config["SQLALCHEMY_DATABASE_URI"] or "").startswith("sqlite"):
+        # Wallet updates are short single statements; keep connections pooled per worker
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        })
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # /statistics is served from a per-worker snapshot at most this old (seconds);
+    # STATS_CACHE_FILE additionally shares the snapshot between workers
+    app.config["STATS_CACHE_TTL"] = float(os.environ.get("STATS_CACHE_TTL", 2.0))
+    app.config["STATS_CACHE_FILE"] = os.environ.get("STATS_CACHE_FILE")
+
+    # /metrics: METRICS_SAMPLE_RATE of the requests are timed, METRICS_ENABLED=0
+    # removes the instrumentation entirely
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") != "0"
+    app.config["METRICS_SAMPLE_RATE"] = float(os.environ.get("METRICS_SAMPLE_RATE", 1.0))
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR")
+
+    # Spin ledger batches that still fail after their retries are saved here
+    # for `python ledger.py replay` (default: instance/ledger-spool)
+    app.config["LEDGER_SPOOL_DIR"] = os.environ.get("LEDGER_SPOOL_DIR")
+
+    # Spin RNG: "secure" (buffered os.urandom) or "seeded" (deterministic, RNG_SEED) for tests
+    app.config["RNG_BACKEND"] = os.environ.get("RNG_BACKEND", "secure")
+    app.config["RNG_SEED"] = os.environ.get("RNG_SEED")
+
+    # Game definitions (games/*.json); /spin plays DEFAULT_GAME unless a game is requested
+    app.config["GAMES_DIR"] = os.environ.get("GAMES_DIR", GAMES_DIR)
+    app.config["DEFAULT_GAME"] = os.environ.get("DEFAULT_GAME", DEFAULT_GAME)
+
+    # /statistics/series: minute rollups kept ROLLUP_MINUTE_RETENTION_HOURS, hour
+    # rollups ROLLUP_HOUR_RETENTION_DAYS, day rollups for good
+    app.config["ROLLUP_MINUTE_RETENTION_HOURS"] = int(os.environ.get("ROLLUP_MINUTE_RETENTION_HOURS", 48))
+    app.config["ROLLUP_HOUR_RETENTION_DAYS"] = int(os.environ.get("ROLLUP_HOUR_RETENTION_DAYS", 90))
+
+    # /rtp_monitor: live RTP and hit rate against the reel model, alerting
+    # RTP_MONITOR_Z standard errors out once a series has RTP_MONITOR_MIN_SPINS
+    app.config["RTP_MONITOR_Z"] = float(os.environ.get("RTP_MONITOR_Z", 4.0))
+    app.config["RTP_MONITOR_MIN_SPINS"] = int(os.environ.get("RTP_MONITOR_MIN_SPINS", 10000))
+    app.config["RTP_MONITOR_CHECK_INTERVAL"] = float(os.environ.get("RTP_MONITOR_CHECK_INTERVAL", 60))
+    app.config["RTP_MONITOR_REFERENCE_SPINS"] = int(os.environ.get("RTP_MONITOR_REFERENCE_SPINS", 200_000))
+
+    # SPIN_PROVENANCE=1 derives grids from per-wallet seeds and counters and
+    # stores only the counter in the ledger (see provenance.py)
+    app.config["SPIN_PROVENANCE"] = os.environ.get("SPIN_PROVENANCE", "0") == "1"
+
+    if config:
+        app.config.update(config)
+
+    # Initialize extensions
+    db.init_app(app)
+    ledger.init_app(app)
+    spin_history.init_app(app)
+    wallets.init_app(app)
+    stat_counters.init_app(app)
+    stat_rollups.init_app(app)
+    metrics.init_app(app)
+    rtp_monitor.init_app(app)
+    provenance.init_app(app)
+    rng_source.init_app(app)
+    game_registry.init_app(app)
+    stats_cache.ttl = app.config["STATS_CACHE_TTL"]
+    stats_cache.shared_path = app.config["STATS_CACHE_FILE"]
+
+    app.register_blueprint(bp)
+    asset_manifest.init_app(app)
+    app.cli.add_command(bootstrap_command)
+    startup_timer.install(app)
+    return app
+
+@bp.route('/')
+def index():
+    balance = wallets.get(session.get('wallet_id'))
+    if balance is None:
+        # Carry over balances from sessions that still hold them in the cookie
+        session['wallet_id'] = wallets.create(session.pop('credits', None), session.pop('bonus_spins', 0))
+        balance = wallets.get(session['wallet_id'])
+    return render_template('index.html', credits=balance['credits'])
+
+class InvalidRequest(Exception):
+    """A rejected request; the routes answer 400 with the message as ``error``."""
+
+# The request-independent halves of the routes below; asgi.py runs the same
+# functions with async I/O in between
+
+def requested_bet(form):
+    bet = float(form.get('bet', MIN_BET))
+    if bet < MIN_BET or bet > 100:
+        raise InvalidRequest('Invalid bet amount')
+    return bet
+
+def requested_game(form, bonus=False):
+    """The game named by the ``game`` form field (default game if absent)."""
+    try:
+        game = game_registry.get(form.get('game') or None)
+    except KeyError:
+        raise InvalidRequest('Unknown game') from None
+    if bonus and game.bonus is None:
+        raise InvalidRequest('This game has no free spins')
+    return game
+
+def resolve_spin(game, bet, draws=None):
+    """Draw and evaluate one spin: ``(result, line_wins, winnings)``. No I/O."""
+    with metrics.phase('rng'):
+        result = game.spin(draws.rng(0) if draws else None)
+    with metrics.phase('evaluate'):
+        line_wins = game.wins(result, bet)
+        winnings = sum_line_wins(line_wins)
+    return result, line_wins, winnings
+
+def finish_spin(wallet_id, game, bet, draws, spin_result, balance):
+    """Count and record a settled spin; returns the ``/spin`` response body."""
+    if balance is None:
+        raise InvalidRequest('Insufficient credits')
+    result, line_wins, winnings = spin_result
+    metrics.count_spin('spin', winnings)
+    rtp_monitor.observe(game.name, bet, winnings)
+
+    # Audit record, written in the background
+    ledger.record(spin_record(bet, winnings, result, sum(1 for w in line_wins if w), wallet_id,
+                              reference=draws.reference(0) if draws else None))
+
+    response = {
+        'result': result,
+        'winnings': winnings,
+        'credits': balance['credits']
+    }
+    if draws:
+        response.update(counter=draws.counter(0), game_version=game.version)
+    return response
+
+@bp.route('/spin', methods=['POST'])
+def spin():
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
+        return jsonify({'error': 'Session expired'}), 400
 
-# create the app
-app = Flask(__name__, static_folder='static', static_url_path='/static')
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-
-# Configure SQLAlchemy
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    try:
+        bet = requested_bet(request.form)
+        game = requested_game(request.form)
 
-# Initialize extensions
-db.init_app(app)
+        with metrics.phase('rng'):
+            draws = provenance.reserve(wallet_id, game)
+        spin_result = resolve_spin(game, bet, draws)
 
-with app.app_context():
-    # Make sure to import the models here or their tables won't be created
-    from models import SpinResult, Statistics  # noqa: F401
+        # Deduct the bet and add the winnings in one conditional update
+        with metrics.phase('wallet'):
+            balance = wallets.adjust(wallet_id, spin_result[2] - bet, required=bet)
+        return jsonify(finish_spin(wallet_id, game, bet, draws, spin_result, balance))
 
-    try:
-        # Create all tables
-        db.create_all()
-
-        # Initialize statistics if needed
-        if not Statistics.query.first():
-            initial_stats = Statistics()
-            db.session.add(initial_stats)
-            db.session.commit()
-            print("Database initialized successfully")
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Database initialization error: {e}")
-
-@app.route('/')
-def index():
-    if 'credits' not in session:
-        session['credits'] = 1000
-    if 'bonus_spins' not in session:
-        session['bonus_spins'] = 0
-    return render_template('index.html', credits=session['credits'])
+        print(f"Error during spin: {str(e)}")
+        metrics.count_error()
+        return jsonify({'error': 'An error occurred during spin'}), 400
 
-@app.route('/spin', methods=['POST'])
-def spin():
-    if 'credits' not in session:
+def batch_request(form):
+    """``(bet, count, game, stops)`` of a ``/spin_batch`` form; ``stops`` are ``play_batch`` limits."""
+    bet = requested_bet(form)
+    count = int(form.get('count', 10))
+    if count < 1 or count > MAX_BATCH_SPINS:
+        raise InvalidRequest('Invalid spin count')
+    game = requested_game(form)
+    # Stop conditions (0 / missing disables a limit)
+    stops = {
+        'loss_limit': float(form.get('loss_limit', 0)),
+        'win_limit': float(form.get('single_win_limit', 0)),
+        'stop_on_bonus': form.get('stop_on_bonus', '').lower() in ('1', 'true', 'on'),
+    }
+    return bet, count, game, stops
+
+def check_batch_start(balance, bet):
+    if balance is None:
+        raise InvalidRequest('Session expired')
+    if balance['credits'] < bet:
+        raise InvalidRequest('Insufficient credits')
+
+def finish_batch(game, bet, spins, records, balance):
+    """Count and record a settled batch; returns the credits left."""
+    if balance is None:
+        raise InvalidRequest('Insufficient credits')
+    for spin_result in spins:
+        metrics.count_spin('spin_batch', spin_result['winnings'])
+        rtp_monitor.observe(game.name, bet, spin_result['winnings'])
+    ledger.record_many(records)
+    return balance['credits']
+
+def batch_lines(spins, stop_reason, credits):
+    """The newline-delimited JSON body of ``/spin_batch``."""
+    for spin_result in spins:
+        yield json.dumps(spin_result) + '\n'
+    yield json.dumps({
+        'done': True,
+        'spins': len(spins),
+        'stop_reason': stop_reason,
+        'credits': credits
+    }) + '\n'
+
+@bp.route('/spin_batch', methods=['POST'])
+def spin_batch():
+    """
+    Resolve up to ``count`` autoplay spins in one request.
+
+    The wallet is updated once for the whole batch and the per-spin results
+    (same format as ``/spin``) are streamed back as newline-delimited JSON,
+    followed by a summary line with the stop reason.
+    """
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
         return jsonify({'error': 'Session expired'}), 400
 
     try:
-        bet = float(request.form.get('bet', 0.20))
-        if bet < 0.20 or bet > 100:
-            return jsonify({'error': 'Invalid bet amount'}), 400
-        if session['credits'] < bet:
-            return jsonify({'error': 'Insufficient credits'}), 400
-
-        # Deduct bet
-        session['credits'] = session['credits'] - bet
-
-        # Define symbols and their weights
-        regular_symbols = {
-            'wooden_a': 20,    # Most common
-            'wooden_k': 18,
-            'wooden_arch': 16,
-            'snake': 14,
-            'gorilla': 12,
-            'jaguar': 10,
-            'crocodile': 8,
-            'gator': 6,
-            'leopard': 4,
-            'dragon': 2,       # Rarest
-            'sloth': 1         # Scatter
-        }
-
-        # Define wild symbols (только для барабанов 2, 3, 4)
-        wild_symbols = {
-            'wild_2x': 2,
-            'wild_3x': 2,
-            'wild_5x': 1
-        }
-
-        # Create weighted symbol lists
-        regular_weighted_symbols = []
-        for symbol, weight in regular_symbols.items():
-            regular_weighted_symbols.extend([symbol] * weight)
-
-        wild_weighted_symbols = []
-        for symbol, weight in wild_symbols.items():
-            wild_weighted_symbols.extend([symbol] * weight)
-
-        # Generate result
-        result = []
-        for reel_index in range(5):
-            reel = []
-            for _ in range(3):
-                # Только для барабанов 2, 3, 4 (индексы 1, 2, 3) добавляем возможность выпадения wild
-                if reel_index in [1, 2, 3]:
-                    # 20% шанс на wild символ
-                    if random.random() < 0.20:
-                        symbol = random.choice(wild_weighted_symbols)
-                    else:
-                        symbol = random.choice(regular_weighted_symbols)
-                else:
-                    # Для барабанов 1 и 5 только обычные символы
-                    symbol = random.choice(regular_weighted_symbols)
-                reel.append(symbol)
-            result.append(reel)
-
-        # Calculate winnings based on paylines and wild multipliers
-        winnings = calculate_winnings(result, bet)
-
-        # Add winnings
-        session['credits'] = session['credits'] + winnings
-
-        return jsonify({
-            'result': result,
-            'winnings': winnings,
-            'credits': session['credits']
-        })
-
+        bet, count, game, stops = batch_request(request.form)
+        with metrics.phase('wallet'):
+            balance = wallets.get(wallet_id, fresh=True)
+        check_batch_start(balance, bet)
+
+        start_credits = balance['credits']
+        # A stop condition can end the batch early: hand out only the
+        # counters of the spins played, with the wallet update
+        draws = provenance.reserve(wallet_id, game, 0)
+        spins, records, required, credits, stop_reason = play_batch(
+            game, bet, count, start_credits, wallet_id, draws=draws, **stops)
+
+        # Debit and credit the whole batch at once; fails if the balance
+        # was spent concurrently below what the batch needed
+        with metrics.phase('wallet'):
+            provenance.advance(wallet_id, draws, len(spins))
+            balance = wallets.adjust(wallet_id, credits - start_credits, required=required)
+        credits = finish_batch(game, bet, spins, records, balance)
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error during spin: {str(e)}")
+        print(f"Error during spin batch: {str(e)}")
+        metrics.count_error()
         return jsonify({'error': 'An error occurred during spin'}), 400
 
-def calculate_winnings(result, bet):
-    paylines = [
-        # Horizontal lines
-        [(0,0), (1,0), (2,0), (3,0), (4,0)],  # Top
-        [(0,1), (1,1), (2,1), (3,1), (4,1)],  # Middle
-        [(0,2), (1,2), (2,2), (3,2), (4,2)],  # Bottom
-        # V-shaped lines
-        [(0,0), (1,1), (2,2), (3,1), (4,0)],  # V
-        [(0,2), (1,1), (2,0), (3,1), (4,2)],  # Inverted V
-        # Zigzag lines
-        [(0,0), (1,1), (2,0), (3,1), (4,0)],
-        [(0,2), (1,1), (2,2), (3,1), (4,2)]
-    ]
+    return Response(batch_lines(spins, stop_reason, credits), mimetype='application/x-ndjson')
+
+def play_batch(game, bet, count, start_credits, wallet_id, loss_limit=0, win_limit=0,
+               stop_on_bonus=False, draws=None):
+    """
+    Play up to ``count`` spins from ``start_credits`` until a stop condition.
+
+    Returns ``(spins, ledger_records, required, credits, stop_reason)``;
+    ``required`` is the smallest starting balance that covers every bet of
+    the batch. Touches neither the wallet nor the database. With ``draws``
+    the spins are derived from its counters, one per spin played.
+    """
+    credits = start_credits
+    required = 0
+    spins = []
+    records = []
+    stop_reason = 'completed'
+    for i in range(count):
+        if credits < bet:
+            stop_reason = 'insufficient_credits'
+            break
+
+        required = max(required, start_credits - credits + bet)
+        credits -= bet
+        with metrics.phase('rng'):
+            result = game.spin(draws.rng(i) if draws else None)
+        with metrics.phase('evaluate'):
+            line_wins = game.wins(result, bet)
+            winnings = sum_line_wins(line_wins)
+        credits += winnings
+        spin_result = {'result': result, 'winnings': winnings, 'credits': credits}
+        if draws:
+            spin_result['counter'] = draws.counter(i)
+        spins.append(spin_result)
+        records.append(spin_record(bet, winnings, result, sum(1 for w in line_wins if w), wallet_id,
+                                   reference=draws.reference(i) if draws else None))
+
+        if loss_limit and start_credits - credits >= loss_limit:
+            stop_reason = 'loss_limit'
+            break
+        if win_limit and winnings >= win_limit:
+            stop_reason = 'single_win'
+            break
+        if stop_on_bonus and game.triggers_bonus(result):
+            stop_reason = 'bonus'
+            break
+    return spins, records, required, credits, stop_reason
+
+@bp.route('/games')
+def list_games():
+    return jsonify({
+        'default': game_registry.default,
+        'games': [game.describe() for game in game_registry],
+    })
 
-    winnings = 0
-    for line in paylines:
-        symbols = [result[x][y] for x, y in line]
-
-        # Get base symbol (first non-wild symbol)
-        base_symbol = next((s for s in symbols if not s.startswith('wild_') and s != 'sloth'), None)
-
-        if base_symbol:
-            # Calculate multiplier from wilds
-            multiplier = 1
-            wild_count = 0
-            for symbol in symbols:
-                if symbol.startswith('wild_'):
-                    wild_count += 1
-                    if symbol == 'wild_2x':
-                        multiplier *= 2
-                    elif symbol == 'wild_3x':
-                        multiplier *= 3
-                    elif symbol == 'wild_5x':
-                        multiplier *= 5
-
-            # Check if we have a winning combination
-            if all(s == base_symbol or s.startswith('wild_') for s in symbols):
-                # Calculate base win amount based on symbol value
-                symbol_values = {
-                    'wooden_a': 2,
-                    'wooden_k': 3,
-                    'wooden_arch': 4,
-                    'snake': 5,
-                    'gorilla': 6,
-                    'jaguar': 8,
-                    'crocodile': 10,
-                    'gator': 15,
-                    'leopard': 20,
-                    'dragon': 50
-                }
-
-                base_value = symbol_values.get(base_symbol, 0)
-                line_win = bet * base_value * multiplier
-                winnings += line_win
+def calculate_line_wins(result, bet, game=None):
+    """Win of every payline, in payline order (0 for losing lines)."""
+    return (game or game_registry.get()).wins(result, bet)
 
+def sum_line_wins(line_wins):
+    winnings = 0
+    for line_win in line_wins:
+        if line_win:
+            winnings += line_win
     return winnings
 
-@app.route('/statistics')
+def calculate_winnings(result, bet, game=None):
+    return sum_line_wins(calculate_line_wins(result, bet, game))
+
+def load_statistics():
+    with metrics.phase('statistics_query'):
+        stats = stat_counters.totals()
+    return format_statistics(stats)
+
+def format_statistics(stats):
+    """``(data, last_modified)`` of ``/statistics`` from the merged counters."""
+    data = {
+        'total_spins': stats['total_spins'],
+        'total_wins': stats['total_wins'],
+        'win_rate': round((stats['total_wins'] / stats['total_spins'] * 100) if stats['total_spins'] > 0 else 0, 2),
+        'biggest_win': stats['biggest_win'],
+        'total_bet': stats['total_bet'],
+        'total_won': stats['total_won'],
+        'rtp': round((stats['total_won'] / stats['total_bet'] * 100) if stats['total_bet'] > 0 else 0, 2),
+        'total_bonus_games': stats['total_bonus_games']
+    }
+    last_updated = stats['last_updated']
+    return data, last_updated.replace(tzinfo=timezone.utc) if last_updated else None
+
+stats_cache = SnapshotCache(load_statistics)
+
+def snapshot_body(snapshot):
+    return dict(snapshot.data, snapshot_age=round(snapshot.age, 3))
+
+def snapshot_headers(response, snapshot):
+    """Validators and cache headers of a ``/statistics`` response."""
+    # The body carries snapshot_age, so the validator is weak
+    response.set_etag(snapshot.version, weak=True)
+    response.last_modified = snapshot.last_modified
+    response.headers['Age'] = str(int(snapshot.age))
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/statistics')
 def get_statistics():
-    stats = Statistics.query.first()
-    if not stats:
-        stats = Statistics()
-        db.session.add(stats)
-        db.session.commit()
+    snapshot = stats_cache.get()
+    return snapshot_headers(jsonify(snapshot_body(snapshot)), snapshot).make_conditional(request)
 
+@bp.route('/statistics/series')
+def get_statistics_series():
+    """Spins, bets, wins and RTP per ``step`` over the last ``window`` (e.g. 1h by 1m)."""
+    try:
+        with metrics.phase('series_query'):
+            series = stat_rollups.series(request.args.get('window', '1h'), request.args.get('step', '1m'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(series)
+
+@bp.route('/history')
+def get_history():
+    """
+    The caller's spin history, newest first, paged by an opaque ``cursor``.
+
+    ``min_bet``, ``max_bet`` and ``wins_only`` narrow the page. Other
+    wallets are only readable with ``python spin_history.py history``.
+    """
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
+        return jsonify({'error': 'Session expired'}), 400
+    requested = request.args.get('wallet_id', type=int)
+    if requested is not None and requested != wallet_id:
+        return jsonify({'error': 'Invalid wallet'}), 400
+
+    try:
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+        if limit < 1 or limit > MAX_HISTORY_PAGE_SIZE:
+            return jsonify({'error': 'Invalid page size'}), 400
+        min_bet = request.args.get('min_bet', type=float)
+        max_bet = request.args.get('max_bet', type=float)
+        wins_only = request.args.get('wins_only', '').lower() in ('1', 'true', 'on')
+
+        with metrics.phase('history_query'):
+            rows, next_cursor = spin_history.page(limit, request.args.get('cursor'), wallet_id,
+                                                  min_bet, max_bet, wins_only)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with metrics.phase('history_replay'):
+        spins = [history_entry(row) for row in rows]
     return jsonify({
-        'total_spins': stats.total_spins,
-        'total_wins': stats.total_wins,
-        'win_rate': round((stats.total_wins / stats.total_spins * 100) if stats.total_spins > 0 else 0, 2),
-        'biggest_win': stats.biggest_win,
-        'total_bet': stats.total_bet,
-        'total_won': stats.total_won,
-        'rtp': round((stats.total_won / stats.total_bet * 100) if stats.total_bet > 0 else 0, 2),
-        'total_bonus_games': stats.total_bonus_games
+        'spins': spins,
+        'next_cursor': next_cursor
     })
 
-@app.route('/buy_freespins', methods=['POST'])
+def history_entry(row):
+    entry = {
+        'id': row.id,
+        'timestamp': row.timestamp.isoformat(),
+        'bet': row.bet_amount,
+        'winnings': row.win_amount,
+        # Derived spins are regenerated from their counter
+        'result': provenance.regenerate(row.wallet_id, row.result_codes, row.is_bonus_spin),
+        'winning_lines': row.winning_lines,
+        'is_bonus_spin': row.is_bonus_spin
+    }
+    if spin_codec.is_derived(row.result_codes):
+        version_id, counter = spin_codec.decode_derived(row.result_codes)
+        entry.update(counter=counter, game_version=provenance.game_version(version_id).version)
+    return entry
+
+@bp.route('/provenance')
+def get_provenance():
+    """Hash of the caller's current server seed, its client seed and the next counter."""
+    current = provenance.current(session.get('wallet_id'))
+    if current is None:
+        return jsonify({'error': 'Session expired'}), 400
+    return jsonify(dict(current, enabled=provenance.enabled))
+
+@bp.route('/provenance/rotate', methods=['POST'])
+def rotate_provenance():
+    """Reveal the caller's server seed and start a new one with an optional ``client_seed``."""
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
+        return jsonify({'error': 'Session expired'}), 400
+    try:
+        return jsonify(provenance.rotate(wallet_id, request.form.get('client_seed', '')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/replay')
+def replay_spin():
+    """
+    Regenerate one of the caller's derived spins from its ``counter``.
+
+    ``game_version`` (default: the default game as loaded now) and ``bonus``
+    select the definition and reels it was played with.
+    """
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
+        return jsonify({'error': 'Session expired'}), 400
+    counter = request.args.get('counter', type=int)
+    if counter is None or counter < 0:
+        return jsonify({'error': 'Invalid counter'}), 400
+    bonus = request.args.get('bonus', '').lower() in ('1', 'true', 'on')
+    try:
+        return jsonify(provenance.replay_counter(wallet_id, counter, request.args.get('game_version'), bonus))
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 400
+
+@bp.route('/startup')
+def get_startup():
+    return jsonify(startup_timer.report())
+
+@bp.route('/ledger/stats')
+def get_ledger_stats():
+    return jsonify(ledger.stats())
+
+def play_bonus_round(game, bet, banked_spins=0, draws=None):
+    with metrics.phase('rng'):
+        return play_round(game, bet, spins=banked_spins or None, draws=draws)
+
+def settle_bonus_round(wallet_id, game, bet, cost=0, banked_spins=0):
+    """
+    Play a free-spin round and settle it with one wallet update.
+
+    ``cost`` is debited and ``banked_spins`` are taken from the wallet in the
+    same update as the round's winnings are credited. Returns ``(round,
+    balance)``; balance is None when the wallet could not cover it.
+    """
+    with metrics.phase('rng'):
+        # The round's length is only known once played: lock the wallet's next
+        # counter now and hand out as many as it used with the wallet update
+        draws = provenance.reserve(wallet_id, game, 0)
+    played = play_bonus_round(game, bet, banked_spins, draws)
+    with metrics.phase('wallet'):
+        provenance.advance(wallet_id, draws, len(played.spins))
+        balance = wallets.adjust(wallet_id, played.total_win - cost,
+                                 bonus_spins=-banked_spins, required=cost)
+    if balance is not None:
+        record_bonus_round(wallet_id, played, cost)
+    return played, balance
+
+def record_bonus_round(wallet_id, played, cost):
+    """Count a settled round and queue its spins on the ledger."""
+    for winnings, _, _, _ in played.records:
+        metrics.count_spin('bonus', winnings)
+    # Free spins carry no bet; the purchase is booked once, as the bet of the
+    # round's first spin, so the totals and the rollups both see it. The
+    # spins share one timestamp, which is how an audit finds the round
+    stat_counters.add(total_bonus_games=1)
+    timestamp = datetime.utcnow()
+    ledger.record_many([
+        spin_record(cost if i == 0 else 0, winnings, result, winning_lines, wallet_id,
+                    is_bonus_spin=True, timestamp=timestamp, bonus_spins_awarded=awarded,
+                    reference=played.reference(i))
+        for i, (winnings, result, winning_lines, awarded) in enumerate(played.records)
+    ])
+
+def purchase_request(form):
+    """``(game, bet, cost)`` of a ``/buy_freespins`` form."""
+    bet = requested_bet(form)
+    game = requested_game(form, bonus=True)
+    return game, bet, bet * game.bonus['cost']
+
+def banked_round_spins(game, balance):
+    """How many of the wallet's banked free spins ``/bonus_round`` plays."""
+    if balance is None:
+        raise InvalidRequest('Session expired')
+    if not balance['bonus_spins']:
+        raise InvalidRequest('No free spins')
+    return min(balance['bonus_spins'], game.bonus['max_spins'])
+
+def bonus_response(played, balance, error, **fields):
+    """Body of a settled round; ``error`` when the wallet could not cover it."""
+    if balance is None:
+        raise InvalidRequest(error)
+    return dict(played.to_json(), credits=balance['credits'],
+                bonus_spins_remaining=balance['bonus_spins'], **fields)
+
+@bp.route('/buy_freespins', methods=['POST'])
 def buy_freespins():
-    if 'credits' not in session:
+    """Buy a free-spin round and play it at once; the response carries every spin."""
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
         return jsonify({'error': 'Session expired'}), 400
 
     try:
-        bet = float(request.form.get('bet', 0.20))
-        cost = bet * 10
-
-        if session['credits'] < cost:
-            return jsonify({'error': 'Insufficient credits'}), 400
-
-        # Deduct the cost
-        session['credits'] = session['credits'] - cost
-
-        # Award 10 free spins
-        bonus_spins = 10
-        session['bonus_spins'] = session.get('bonus_spins', 0) + bonus_spins
-
-        # Update statistics
-        stats = Statistics.query.first()
-        if stats:
-            stats.total_bonus_games += 1
-            stats.total_bet += cost
-            db.session.commit()
-
-        return jsonify({
-            'credits': session['credits'],
-            'bonus_spins_awarded': bonus_spins,
-            'bonus_spins_remaining': session['bonus_spins']
-        })
+        game, bet, cost = purchase_request(request.form)
+        played, balance = settle_bonus_round(wallet_id, game, bet, cost=cost)
+        return jsonify(bonus_response(played, balance, 'Insufficient credits',
+                                      bonus_spins_awarded=game.bonus['spins']))
 
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error buying free spins: {str(e)}")
+        metrics.count_error()
         return jsonify({'error': 'An error occurred while buying free spins'}), 400
 
+@bp.route('/bonus_round', methods=['POST'])
+def bonus_round():
+    """
+    Play the free spins banked in the wallet as one round.
+
+    Banked spins were bought before rounds were played on purchase and do
+    not remember their bet, so they play at the minimum bet.
+    """
+    wallet_id = session.get('wallet_id')
+    if wallet_id is None:
+        return jsonify({'error': 'Session expired'}), 400
+
+    try:
+        game = requested_game(request.form, bonus=True)
+        banked = banked_round_spins(game, wallets.get(wallet_id, fresh=True))
+        played_round, balance = settle_bonus_round(wallet_id, game, MIN_BET, banked_spins=banked)
+        # A None balance means a concurrent request spent the spins
+        return jsonify(bonus_response(played_round, balance, 'No free spins'))
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error during bonus round: {str(e)}")
+        metrics.count_error()
+        return jsonify({'error': 'An error occurred during the bonus round'}), 400
+
 if __name__ == "__main__":
+    from bootstrap import bootstrap
+
+    app = create_app()
+    bootstrap(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,378 @@
+"""
+ASGI entry point: the same app served from an event loop.
+
+::
+
+    pip install '.[asgi]'
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+The routes that wait on the database (``/spin``, ``/spin_batch``,
+``/buy_freespins``, ``/bonus_round`` and ``/statistics``) are served by a
+Quart app on an async SQLAlchemy engine (aiosqlite / asyncpg) with its own
+sized pool, so a worker keeps serving other players during every round trip
+instead of blocking on it. Resolving spins is CPU-bound and runs on a small
+thread pool (``SPIN_THREADS``) so it never stalls the loop. Every other route
+(the page, ``/history``, ``/games``, ``/metrics``, static assets) is the Flask
+app from ``create_app``, called on threads through ``WSGIBridge``.
+
+Responses are the same JSON as in the sync mode. Both halves sign sessions
+with the same key and cookie format, so a cookie works on either half and
+across a switch between ``main:app`` and ``asgi:app``. The spin ledger and
+the statistics counters keep their background threads on the sync engine.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from quart import Quart, Response, g, jsonify, request, session
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import (
+    MIN_BET,
+    InvalidRequest,
+    banked_round_spins,
+    batch_lines,
+    batch_request,
+    bonus_response,
+    check_batch_start,
+    create_app,
+    finish_batch,
+    finish_spin,
+    format_statistics,
+    play_batch,
+    play_bonus_round,
+    purchase_request,
+    record_bonus_round,
+    requested_bet,
+    requested_game,
+    resolve_spin,
+    snapshot_body,
+    snapshot_headers,
+    stats_cache,
+)
+from metrics import metrics
+from provenance import provenance
+from stat_counters import stat_counters
+from startup import startup_timer
+from wallet import wallets
+
+# Served natively by the Quart half; everything else goes to Flask
+ASYNC_ROUTES = frozenset(('/spin', '/spin_batch', '/buy_freespins', '/bonus_round', '/statistics'))
+
+# Async drivers substituted for the sync ones of DATABASE_URL
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """The async-driver equivalent of a sync SQLAlchemy URL."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    if driver is None:
+        raise ValueError(f"No async driver known for {url.drivername!r}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=driver)
+
+
+class WSGIBridge:
+    """
+    Serve a WSGI app from ASGI, one request per pool thread.
+
+    Request and response bodies are buffered, which suits the small pages
+    and JSON documents left on the Flask half.
+    """
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        body = BytesIO()
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(
+            self.executor, self._call, self._environ(scope, body))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if path.startswith(root_path):
+            path = path[len(root_path):]
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            if key in environ:
+                value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+            environ[key] = value
+        return environ
+
+    def _call(self, environ):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], content
+
+
+class SlotASGI:
+    """Routes ``ASYNC_ROUTES`` and lifespan events to Quart, the rest to Flask."""
+
+    def __init__(self, quart_app, flask_app, wsgi_threads):
+        self.quart_app = quart_app
+        self.flask_app = flask_app
+        self.wsgi = WSGIBridge(flask_app.wsgi_app, wsgi_threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] not in ASYNC_ROUTES:
+            await self.wsgi(scope, receive, send)
+        else:
+            await self.quart_app(scope, receive, send)
+
+
+def create_asgi_app(config=None):
+    """Build the Flask app and the async Quart routes in front of it."""
+    flask_app = create_app(config)
+
+    # Async pool: ASYNC_DATABASE_URL, or DATABASE_URL with the async driver
+    flask_app.config.setdefault("ASYNC_DATABASE_URL", os.environ.get("ASYNC_DATABASE_URL"))
+    flask_app.config.setdefault("ASYNC_DB_POOL_SIZE", int(os.environ.get("DB_POOL_SIZE", 10)))
+    flask_app.config.setdefault("ASYNC_DB_MAX_OVERFLOW", int(os.environ.get("DB_MAX_OVERFLOW", 20)))
+    # Threads resolving spins, and threads serving the Flask routes
+    flask_app.config.setdefault("SPIN_THREADS", int(os.environ.get("SPIN_THREADS", 2)))
+    flask_app.config.setdefault("WSGI_THREADS", int(os.environ.get("WSGI_THREADS", 8)))
+
+    quart_app = Quart(__name__)
+    quart_app.secret_key = flask_app.secret_key
+    # Same cookie name, lifetime and flags, so sessions are shared
+    for key, value in flask_app.config.items():
+        if key.startswith('SESSION_COOKIE_') or key in ('PERMANENT_SESSION_LIFETIME', 'SECRET_KEY_FALLBACKS'):
+            quart_app.config[key] = value
+
+    url = flask_app.config["ASYNC_DATABASE_URL"] or async_database_url(flask_app.config["SQLALCHEMY_DATABASE_URI"])
+    engine_options = {"pool_pre_ping": True, "pool_recycle": 300}
+    url_parts = make_url(url)
+    if url_parts.get_backend_name() != 'sqlite':
+        engine_options.update({
+            "pool_size": flask_app.config["ASYNC_DB_POOL_SIZE"],
+            "max_overflow": flask_app.config["ASYNC_DB_MAX_OVERFLOW"],
+        })
+    elif url_parts.database not in (None, '', ':memory:'):
+        # SQLite runs one writer at a time; more connections only add
+        # busy-wait retries (seconds of tail latency under load)
+        engine_options.update({"pool_size": 1, "max_overflow": 0})
+    spin_pool = ThreadPoolExecutor(max_workers=flask_app.config["SPIN_THREADS"], thread_name_prefix='spin')
+    state = {}
+
+    @quart_app.before_serving
+    async def open_engine():
+        # Async connections belong to the loop that opened them
+        state['engine'] = create_async_engine(url, **engine_options)
+        state['sessions'] = async_sessionmaker(state['engine'], class_=AsyncSession, expire_on_commit=False)
+
+    @quart_app.after_serving
+    async def close_engine():
+        await state['engine'].dispose()
+
+    def db_session():
+        return state['sessions']()
+
+    async def run_cpu(function, *args, **kwargs):
+        # The copied context carries the request's metrics sampling decision
+        call = functools.partial(contextvars.copy_context().run, function, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(spin_pool, call)
+
+    if metrics.enabled:
+        @quart_app.before_request
+        async def start_metrics():
+            g.metrics_started = metrics.start_request()
+
+        @quart_app.after_request
+        async def finish_metrics(response):
+            metrics.end_request(request.path, request.method, response.status_code,
+                                g.pop('metrics_started', None))
+            return response
+
+    # Each handler does the async I/O between the shared steps of app.py
+
+    @quart_app.route('/spin', methods=['POST'])
+    async def spin():
+        wallet_id = session.get('wallet_id')
+        if wallet_id is None:
+            return jsonify({'error': 'Session expired'}), 400
+
+        try:
+            form = await request.form
+            bet = requested_bet(form)
+            game = requested_game(form)
+
+            async with db_session() as db:
+                # Without provenance this touches no connection
+                with metrics.phase('rng'):
+                    draws = await provenance.reserve_async(db, wallet_id, game)
+                spin_result = await run_cpu(resolve_spin, game, bet, draws)
+
+                with metrics.phase('wallet'):
+                    balance = await wallets.adjust_async(db, wallet_id, spin_result[2] - bet, required=bet)
+            return jsonify(finish_spin(wallet_id, game, bet, draws, spin_result, balance))
+
+        except InvalidRequest as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            print(f"Error during spin: {str(e)}")
+            metrics.count_error(request.path)
+            return jsonify({'error': 'An error occurred during spin'}), 400
+
+    @quart_app.route('/spin_batch', methods=['POST'])
+    async def spin_batch():
+        wallet_id = session.get('wallet_id')
+        if wallet_id is None:
+            return jsonify({'error': 'Session expired'}), 400
+
+        try:
+            bet, count, game, stops = batch_request(await request.form)
+            async with db_session() as db:
+                with metrics.phase('wallet'):
+                    balance = await wallets.get_async(db, wallet_id, fresh=True)
+                check_batch_start(balance, bet)
+
+                start_credits = balance['credits']
+                draws = await provenance.reserve_async(db, wallet_id, game, 0)
+                spins, records, required, credits, stop_reason = await run_cpu(
+                    play_batch, game, bet, count, start_credits, wallet_id, draws=draws, **stops)
+
+                with metrics.phase('wallet'):
+                    await provenance.advance_async(db, wallet_id, draws, len(spins))
+                    balance = await wallets.adjust_async(db, wallet_id, credits - start_credits,
+                                                         required=required)
+            credits = finish_batch(game, bet, spins, records, balance)
+
+        except InvalidRequest as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            print(f"Error during spin batch: {str(e)}")
+            metrics.count_error(request.path)
+            return jsonify({'error': 'An error occurred during spin'}), 400
+
+        async def generate():
+            for line in batch_lines(spins, stop_reason, credits):
+                yield line.encode('utf-8')
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    async def settle_bonus_round(wallet_id, game, bet, cost=0, banked_spins=0):
+        async with db_session() as db:
+            with metrics.phase('rng'):
+                draws = await provenance.reserve_async(db, wallet_id, game, 0)
+            played = await run_cpu(play_bonus_round, game, bet, banked_spins, draws)
+            with metrics.phase('wallet'):
+                await provenance.advance_async(db, wallet_id, draws, len(played.spins))
+                balance = await wallets.adjust_async(db, wallet_id, played.total_win - cost,
+                                                     bonus_spins=-banked_spins, required=cost)
+        if balance is not None:
+            record_bonus_round(wallet_id, played, cost)
+        return played, balance
+
+    @quart_app.route('/buy_freespins', methods=['POST'])
+    async def buy_freespins():
+        wallet_id = session.get('wallet_id')
+        if wallet_id is None:
+            return jsonify({'error': 'Session expired'}), 400
+
+        try:
+            game, bet, cost = purchase_request(await request.form)
+            played, balance = await settle_bonus_round(wallet_id, game, bet, cost=cost)
+            return jsonify(bonus_response(played, balance, 'Insufficient credits',
+                                          bonus_spins_awarded=game.bonus['spins']))
+
+        except InvalidRequest as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            print(f"Error buying free spins: {str(e)}")
+            metrics.count_error(request.path)
+            return jsonify({'error': 'An error occurred while buying free spins'}), 400
+
+    @quart_app.route('/bonus_round', methods=['POST'])
+    async def bonus_round():
+        wallet_id = session.get('wallet_id')
+        if wallet_id is None:
+            return jsonify({'error': 'Session expired'}), 400
+
+        try:
+            game = requested_game(await request.form, bonus=True)
+            async with db_session() as db:
+                balance = await wallets.get_async(db, wallet_id, fresh=True)
+            banked = banked_round_spins(game, balance)
+            played_round, balance = await settle_bonus_round(wallet_id, game, MIN_BET, banked_spins=banked)
+            return jsonify(bonus_response(played_round, balance, 'No free spins'))
+
+        except InvalidRequest as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            print(f"Error during bonus round: {str(e)}")
+            metrics.count_error(request.path)
+            return jsonify({'error': 'An error occurred during the bonus round'}), 400
+
+    async def load_statistics():
+        with metrics.phase('statistics_query'):
+            async with db_session() as db:
+                stats = await stat_counters.totals_async(db)
+        return format_statistics(stats)
+
+    @quart_app.route('/statistics')
+    async def get_statistics():
+        snapshot = await stats_cache.get_async(load_statistics)
+        return await snapshot_headers(jsonify(snapshot_body(snapshot)), snapshot).make_conditional(request)
+
+    return SlotASGI(quart_app, flask_app, flask_app.config["WSGI_THREADS"])
+
+
+with startup_timer.phase('create_app'):
+    app = create_asgi_app()
@@ -0,0 +1,101 @@
+"""
+Serving side of ``build_assets.py``.
+
+``asset_url('js/slot.js')`` returns the fingerprinted URL from
+``static/dist/manifest.json`` (or the plain ``/static`` URL when the asset
+was not built). Fingerprinted files are served from ``/static/dist`` with a
+one-year immutable ``Cache-Control`` and, when the client accepts it, as the
+prebuilt brotli or gzip variant; nothing is compressed per request.
+"""
+import json
+import mimetypes
+import os
+
+from flask import Blueprint, request, send_from_directory, url_for
+
+# One year, the conventional maximum for immutable assets
+IMMUTABLE_MAX_AGE = 31536000
+
+# Content-Encoding token -> file suffix written by build_assets.py
+ENCODINGS = (('br', 'br'), ('gzip', 'gz'))
+
+bp = Blueprint('assets', __name__)
+
+
+class AssetManifest:
+    """Lazily loaded logical-path -> fingerprinted-path map."""
+
+    def __init__(self, app=None):
+        self.dist_dir = None
+        self.assets = {}
+        self.encodings = {}
+        self._mtime = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist_dir = os.path.join(app.static_folder, 'dist')
+        app.jinja_env.globals['asset_url'] = asset_url
+        app.jinja_env.globals['asset_map'] = self.public_map
+        app.register_blueprint(bp)
+
+    def _refresh(self):
+        path = os.path.join(self.dist_dir, 'manifest.json')
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self.assets, self.encodings, self._mtime = {}, {}, None
+            return
+        # Reload only after a rebuild
+        if mtime != self._mtime:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.assets = data.get('assets', {})
+            self.encodings = data.get('encodings', {})
+            self._mtime = mtime
+
+    def lookup(self, path):
+        self._refresh()
+        return self.assets.get(path)
+
+    def public_map(self, prefix=''):
+        """Logical path -> URL for every built asset under ``prefix`` (for scripts)."""
+        self._refresh()
+        return {path: url_for('assets.fingerprinted', filename=hashed)
+                for path, hashed in self.assets.items() if path.startswith(prefix)}
+
+    def encodings_for(self, filename):
+        self._refresh()
+        return self.encodings.get(filename, ())
+
+
+asset_manifest = AssetManifest()
+
+
+def asset_url(path):
+    hashed = asset_manifest.lookup(path)
+    if hashed is None:
+        return url_for('static', filename=path)
+    return url_for('assets.fingerprinted', filename=hashed)
+
+
+@bp.route('/static/dist/<path:filename>')
+def fingerprinted(filename):
+    available = asset_manifest.encodings_for(filename)
+    served, encoding = filename, None
+    for token, suffix in ENCODINGS:
+        if suffix in available and request.accept_encodings[token]:
+            served, encoding = f"{filename}.{suffix}", token
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(asset_manifest.dist_dir, served, mimetype=mimetype,
+                                   max_age=IMMUTABLE_MAX_AGE)
+    # The name changes with the content, so the file itself never does
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if available:
+        response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,288 @@
+"""
+Benchmarks for the game math and the HTTP routes, with regression gates.
+
+Measures:
+
+- ``evaluate``: ``calculate_winnings`` per grid
+- ``spin``: grid generation with the seeded (Mersenne Twister) backend
+- ``spin_secure``: grid generation with the buffered CSPRNG ``/spin`` uses
+- ``http_spin``, ``http_buy_freespins``, ``http_statistics``: the routes
+  end to end through the Flask test client against in-memory SQLite
+
+Results are written as JSON together with machine metadata and compared with
+``bench_baseline.json``. The run fails (exit code 1) when a benchmark's
+throughput drops more than ``--tolerance`` below the baseline, or when the RTP
+of the fixed-seed run differs from the baseline's. That RTP is a pure function
+of the seed, the reel weights and the payout code, so any difference means
+the game math changed. An intentional change is accepted by re-recording the
+baseline::
+
+    python bench.py                       # compare with the baseline
+    python bench.py --quick               # fewer iterations, for a smoke check
+    python bench.py --output results.json
+    python bench.py --update-baseline     # after an intentional change
+
+Throughput only compares meaningfully on similar machines. A mismatch in
+the recorded machine is reported but does not fail the run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, 'bench_baseline.json')
+RESULTS_VERSION = 1
+
+# Relative throughput loss that fails the run
+DEFAULT_TOLERANCE = 0.20
+
+# Fixed-seed RTP run: spins and seed
+RTP_SEED = 20250225
+RTP_SPINS = 200_000
+# RTP values are sums of exact multiples of the bet, so only float noise is allowed
+RTP_TOLERANCE = 1e-9
+# Standard errors the fixed-seed RTP may be from the exact one, whatever the baseline says
+RTP_MAX_Z = 4.0
+
+BET = 1.0
+
+
+def machine_info():
+    info = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'cpu': platform.processor() or None,
+    }
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    info['cpu'] = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                        capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['commit'] = None
+    return info
+
+
+def measure(operation, number, repeat):
+    """
+    Run ``operation`` ``number`` times per round for ``repeat`` rounds.
+
+    ``operation`` is called with the iteration index. The best round is
+    least disturbed by other load, so it is the one that is gated.
+    """
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for i in range(number):
+            operation(i)
+        rounds.append(time.perf_counter() - started)
+    best = min(rounds)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'ops_per_sec': number / best,
+        'median_ops_per_sec': number / statistics.median(rounds),
+        'us_per_op': best / number * 1e6,
+    }
+
+
+def bench_math(scale):
+    from app import calculate_winnings
+    from rng import SecureRandom
+    from spin_engine import engine as spin_engine
+
+    rng = random.Random(RTP_SEED)
+    secure = SecureRandom()
+    grids = [spin_engine.spin(rng) for _ in range(10_000)]
+    number = int(20_000 * scale)
+    return {
+        'evaluate': measure(lambda i: calculate_winnings(grids[i % len(grids)], BET), number, 5),
+        'spin': measure(lambda i: spin_engine.spin(rng), number, 5),
+        'spin_secure': measure(lambda i: spin_engine.spin(secure), number, 5),
+    }
+
+
+def rtp_check(spins=RTP_SPINS, seed=RTP_SEED):
+    """RTP of a fixed-seed run through ``spin`` and ``calculate_winnings``."""
+    from app import calculate_winnings
+    from rtp import analyze
+    from spin_engine import engine as spin_engine
+
+    rng = random.Random(seed)
+    total = 0.0
+    total_sq = 0.0
+    for _ in range(spins):
+        win = calculate_winnings(spin_engine.spin(rng), BET)
+        total += win
+        total_sq += win * win
+    rtp = total / spins
+    standard_error = ((total_sq / spins - rtp * rtp) / spins) ** 0.5
+    theoretical = float(analyze(distribution=False).rtp)
+    return {
+        'seed': seed,
+        'spins': spins,
+        'rtp': rtp,
+        'theoretical_rtp': theoretical,
+        'z': (rtp - theoretical) / standard_error if standard_error else 0.0,
+    }
+
+
+def bench_http(scale):
+    from sqlalchemy.pool import StaticPool
+
+    from app import create_app
+    from bootstrap import bootstrap
+
+    app = create_app({
+        # One shared connection keeps the in-memory database alive
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'poolclass': StaticPool,
+                                      'connect_args': {'check_same_thread': False}},
+        'WALLET_STARTING_CREDITS': 1e12,
+        # Park the write-behind flushers so they never share the connection
+        # with the timed requests; their cost is off the request path anyway
+        'LEDGER_QUEUE_SIZE': 10_000_000,
+        'LEDGER_BATCH_SIZE': 10_000_000,
+        'LEDGER_FLUSH_INTERVAL': 3600.0,
+        'STAT_FLUSH_INTERVAL': 3600.0,
+        'METRICS_DIR': tempfile.mkdtemp(prefix='bench-metrics-'),
+        # bootstrap stores the RTP monitor's references in this throwaway
+        # database; a short simulation keeps that setup out of the run time
+        'RTP_MONITOR_REFERENCE_SPINS': 10_000,
+    })
+    bootstrap(app)
+    client = app.test_client()
+    client.get('/')
+
+    def post(path, data):
+        def request(i):
+            response = client.post(path, data=data)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(True)}")
+        return request
+
+    def get(path):
+        def request(i):
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+        return request
+
+    number = int(500 * scale)
+    return {
+        'http_spin': measure(post('/spin', {'bet': BET}), number, 3),
+        'http_buy_freespins': measure(post('/buy_freespins', {'bet': BET}), number, 3),
+        'http_statistics': measure(get('/statistics'), number, 3),
+    }
+
+
+def run(scale=1.0, rtp_spins=RTP_SPINS):
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'benchmarks': {},
+    }
+    results['benchmarks'].update(bench_math(scale))
+    results['benchmarks'].update(bench_http(scale))
+    results['rtp'] = rtp_check(rtp_spins)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return ``(report_lines, failures)`` for ``results`` against ``baseline``."""
+    lines = []
+    failures = []
+    ours, theirs = results['machine'], baseline.get('machine', {})
+    for key in ('cpu', 'python', 'implementation'):
+        if ours.get(key) != theirs.get(key):
+            lines.append(f"note: baseline {key} was {theirs.get(key)!r}, this run {ours.get(key)!r}")
+
+    lines.append(f"{'benchmark':<22}{'ops/s':>14}{'baseline':>14}{'change':>10}")
+    for name, result in results['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if reference is None:
+            lines.append(f"{name:<22}{result['ops_per_sec']:>14,.0f}{'-':>14}{'new':>10}")
+            continue
+        change = result['ops_per_sec'] / reference['ops_per_sec'] - 1
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            failures.append(f"{name} is {-change:.1%} slower than the baseline (tolerance {tolerance:.0%})")
+        lines.append(f"{name:<22}{result['ops_per_sec']:>14,.0f}{reference['ops_per_sec']:>14,.0f}"
+                     f"{change:>+10.1%}{flag}")
+
+    rtp, reference = results['rtp'], baseline.get('rtp')
+    lines.append(f"RTP (seed {rtp['seed']}, {rtp['spins']:,} spins): {rtp['rtp']:.6%}, "
+                 f"exact {rtp['theoretical_rtp']:.6%}, z = {rtp['z']:+.2f}")
+    if abs(rtp['z']) > RTP_MAX_Z:
+        failures.append(f"fixed-seed RTP is {rtp['z']:+.2f} standard errors from the exact RTP")
+    if reference is not None:
+        if (reference['seed'], reference['spins']) != (rtp['seed'], rtp['spins']):
+            lines.append(f"note: baseline RTP run used seed {reference['seed']}, "
+                         f"{reference['spins']:,} spins; not compared")
+        elif abs(rtp['rtp'] - reference['rtp']) > RTP_TOLERANCE:
+            failures.append(f"fixed-seed RTP drifted from {reference['rtp']:.9%} to {rtp['rtp']:.9%}")
+        if abs(rtp['theoretical_rtp'] - reference['theoretical_rtp']) > RTP_TOLERANCE:
+            failures.append(f"exact RTP changed from {reference['theoretical_rtp']:.9%} "
+                            f"to {rtp['theoretical_rtp']:.9%}")
+    return lines, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game math and HTTP routes")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative throughput loss (default 0.20)")
+    parser.add_argument('--output', help="write the results JSON here")
+    parser.add_argument('--update-baseline', action='store_true', help="record this run as the baseline")
+    parser.add_argument('--quick', action='store_true', help="a tenth of the iterations")
+    args = parser.parse_args(argv)
+
+    results = run(scale=0.1 if args.quick else 1.0)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        sys.exit(f"No baseline at {args.baseline}; record one with --update-baseline")
+
+    lines, failures = compare(results, baseline, args.tolerance)
+    print("\n".join(lines))
+    if failures:
+        print("\nFAILED")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
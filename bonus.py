@@ -0,0 +1,92 @@
+"""
+Free-spin rounds resolved on the server in one call.
+
+``play_round`` plays every spin of a round on the game's bonus reels,
+including retriggers and the accumulating win multiplier (see the ``bonus``
+section of ``games.py``), and returns the outcomes for the client to animate.
+The caller then credits the round's total with a single wallet update and
+queues the spins on the ledger together, instead of one request, one wallet
+update and one ledger record per free spin.
+"""
+
+
+class BonusRound:
+    """Outcome of one free-spin round."""
+
+    def __init__(self, awarded, draws=None):
+        self.awarded = awarded
+        self.draws = draws
+        self.spins = []
+        self.records = []
+        self.total_win = 0
+        self.retriggers = 0
+
+    def to_json(self):
+        return {
+            'spins_awarded': self.awarded,
+            'spins_played': len(self.spins),
+            'retriggers': self.retriggers,
+            'total_win': self.total_win,
+            'spins': self.spins,
+        }
+
+    def reference(self, index):
+        """Ledger reference of a derived spin, None for a stored one."""
+        return self.draws.reference(index) if self.draws is not None else None
+
+
+def play_round(game, bet, spins=None, rng=None, draws=None):
+    """
+    Play a free-spin round of ``game`` at ``bet``.
+
+    ``spins`` defaults to the game's award. Each spin pays its line (or
+    ways) wins times the current multiplier; the multiplier then grows by
+    its step after a winning spin, up to its maximum. Landing the retrigger
+    scatters adds spins until the round reaches ``max_spins``.
+
+    ``BonusRound.records`` holds ``(winnings, result, winning_lines,
+    spins_awarded)`` per spin for the ledger. With ``draws`` (see
+    ``provenance.py``) spin ``i`` is derived from the draws' counter ``i``
+    instead of drawn from ``rng``; the caller hands out the counters played.
+    """
+    bonus = game.bonus
+    engine = game.bonus_engine
+    awarded = bonus['spins'] if spins is None else spins
+    round_ = BonusRound(awarded, draws)
+
+    remaining = min(awarded, bonus['max_spins'])
+    played = 0
+    multiplier = bonus['multiplier_start']
+    while remaining:
+        remaining -= 1
+        result = engine.spin(draws.rng(played) if draws is not None else rng)
+        line_wins = game.wins(result, bet)
+        winnings = 0
+        for line_win in line_wins:
+            if line_win:
+                winnings += line_win
+        winnings *= multiplier
+        played += 1
+
+        retrigger = 0
+        if bonus['retrigger_scatters'] and game.scatter_count(result) >= bonus['retrigger_scatters']:
+            retrigger = min(bonus['retrigger_spins'], bonus['max_spins'] - played - remaining)
+            if retrigger:
+                remaining += retrigger
+                round_.retriggers += 1
+
+        spin = {
+            'result': result,
+            'winnings': winnings,
+            'multiplier': multiplier,
+            'spins_awarded': retrigger,
+            'spins_remaining': remaining,
+        }
+        if draws is not None:
+            spin['counter'] = draws.counter(played - 1)
+        round_.spins.append(spin)
+        round_.records.append((winnings, result, sum(1 for w in line_wins if w), retrigger))
+        round_.total_win += winnings
+        if winnings and multiplier < bonus['multiplier_max']:
+            multiplier = min(multiplier + bonus['multiplier_step'], bonus['multiplier_max'])
+    return round_
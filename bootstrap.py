@@ -0,0 +1,64 @@
+"""
+Create, upgrade and seed the database; run once per deploy, not per worker.
+
+    python bootstrap.py
+    flask --app main bootstrap
+
+Workers never touch the schema themselves, so this has to run before the
+first worker starts (the deployment build step does it).
+"""
+import time
+
+import click
+
+
+def bootstrap(app):
+    """Run every schema step inside ``app``; returns ``[(step, ms)]``."""
+    from database import db
+    import models  # noqa: F401  (registers the tables)
+    import spin_codec
+    from provenance import provenance
+    from rtp_monitor import rtp_monitor
+    from spin_history import spin_history
+    from stat_counters import stat_counters
+
+    steps = [
+        ('create tables', db.create_all),
+        ('spin codec columns', lambda: spin_codec.prepare_schema(db.engine)),
+        ('provenance columns', lambda: provenance.prepare_schema(db.engine)),
+        ('game versions', provenance.register_games),
+        ('spin partitions', spin_history.maintain),
+        ('statistics shards', stat_counters.ensure_shards),
+        ('rtp references', rtp_monitor.store_references),
+    ]
+    timings = []
+    with app.app_context():
+        for name, step in steps:
+            started = time.perf_counter()
+            step()
+            timings.append((name, (time.perf_counter() - started) * 1000))
+    return timings
+
+
+@click.command('bootstrap')
+def bootstrap_command():
+    """Create and upgrade the database schema."""
+    from flask import current_app
+
+    report(bootstrap(current_app._get_current_object()))
+
+
+def report(timings):
+    for name, ms in timings:
+        print(f"  {name:<20}{ms:>10.1f}ms")
+    print("Database initialized successfully")
+
+
+def main():
+    from app import create_app
+
+    report(bootstrap(create_app()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Fingerprint static assets and precompress them.
+
+Every file under ``static/`` (except the output directory) is copied to
+``static/dist/`` with a content hash in its name, e.g. ``js/slot.js`` ->
+``js/slot.3f2a1b9c0d.js``. ``static/dist/manifest.json`` maps the logical path
+to the hashed one; ``assets.asset_url`` uses it to emit URLs that can be
+cached forever. Text formats also get ``.gz`` and ``.br`` siblings, compressed
+once here at maximum level, so the server never compresses per request.
+
+Run after ``build_sprites.py`` so the atlases are fingerprinted too::
+
+    python build_assets.py
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+HASH_LENGTH = 10
+
+# Already-compressed formats gain nothing from gzip/brotli
+COMPRESSIBLE = {'.js', '.css', '.json', '.svg', '.html', '.txt', '.map', '.wasm'}
+SKIP = {'.md'}
+
+# Variants smaller than this fraction of the original are kept
+MIN_SAVING = 0.95
+
+
+def fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(relpath, digest):
+    stem, ext = os.path.splitext(relpath)
+    return f"{stem}.{digest}{ext}"
+
+
+def iter_sources():
+    for directory, subdirs, files in os.walk(STATIC_DIR):
+        if os.path.abspath(directory) == DIST_DIR:
+            subdirs[:] = []
+            continue
+        subdirs[:] = [d for d in subdirs if os.path.join(directory, d) != DIST_DIR]
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in SKIP:
+                continue
+            path = os.path.join(directory, filename)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'), path
+
+
+def write_variants(path):
+    """Write ``.gz`` and (if available) ``.br`` next to ``path``; returns their names."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = []
+    encoders = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        encoders.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+    except ImportError:
+        pass
+    for suffix, encode in encoders:
+        compressed = encode(data)
+        if len(compressed) < len(data) * MIN_SAVING:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            variants.append(suffix.lstrip('.'))
+    return variants
+
+
+def build():
+    started = time.perf_counter()
+    os.makedirs(DIST_DIR, exist_ok=True)
+
+    manifest = {}
+    encodings = {}
+    written = 0
+    for relpath, path in iter_sources():
+        target_rel = hashed_name(relpath, fingerprint(path))
+        target = os.path.join(DIST_DIR, target_rel)
+        # Same name means same content, so an existing file is already current
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target + '.tmp')
+            os.replace(target + '.tmp', target)
+            written += 1
+            if os.path.splitext(relpath)[1].lower() in COMPRESSIBLE:
+                write_variants(target)
+        manifest[relpath] = target_rel
+        variants = [enc for enc in ('br', 'gz') if os.path.exists(f"{target}.{enc}")]
+        if variants:
+            encodings[target_rel] = variants
+
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'assets': manifest, 'encodings': encodings}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+    # Remove generations that are no longer referenced
+    live = set(manifest.values())
+    live |= {f"{name}.{enc}" for name, encs in encodings.items() for enc in encs}
+    live.add(os.path.basename(MANIFEST_PATH))
+    removed = 0
+    for directory, _, files in os.walk(DIST_DIR):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if os.path.relpath(path, DIST_DIR).replace(os.sep, '/') not in live:
+                os.remove(path)
+                removed += 1
+
+    print(f"Fingerprinted {len(manifest)} assets ({written} new, {removed} stale removed, "
+          f"{len(encodings)} precompressed) in {time.perf_counter() - started:.2f}s")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static assets")
+    parser.add_argument('--clean', action='store_true', help="delete static/dist first")
+    args = parser.parse_args(argv)
+    if args.clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    build()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Build the symbol sprite atlases used by ``static/js/slot.js``.
+
+Every symbol source image is fitted into a square tile at each size in
+``TIERS``. The tiles of a tier are packed into one atlas, which is written
+as AVIF (when Pillow supports it), WebP and PNG. ``static/sprites/manifest.json``
+records the atlas files and the tile rectangles; the client picks the
+smallest tier that covers its drawing size and the best format it can
+decode.
+
+The build is incremental: tiles are cached under ``build/sprites`` keyed by
+the source's content hash, so only changed sources are resized again, and
+atlases are only re-encoded when one of their tiles changed. Resizing and
+encoding run in a process pool.
+
+    python build_sprites.py [--force] [--workers N]
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(ROOT, 'static', 'sprites')
+CACHE_DIR = os.path.join(ROOT, 'build', 'sprites')
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, 'manifest.json')
+MANIFEST_VERSION = 1
+
+# Symbol name -> source image, relative to static/images/symbols
+SYMBOL_SOURCES = {
+    'wooden_a': 'wooden_a.png',
+    'wooden_k': 'wooden_k.png',
+    'wooden_arch': 'wooden_arch.png',
+    'snake': 'snake.png',
+    'gorilla': 'gorilla.png',
+    'jaguar': 'jaguar.png',
+    'crocodile': 'crocodile.png',
+    'gator': 'gator.png',
+    'leopard': 'leopard.png',
+    'dragon': 'dragon.png',
+    'sloth': 'Picsart_25-02-25_16-45-12-270.png',
+    'wild_2x': 'Picsart_25-02-25_16-49-31-091.png',
+    'wild_3x': 'Picsart_25-02-25_18-10-53-970.png',
+    'wild_5x': 'Picsart_25-02-25_18-12-23-513.png',
+}
+SOURCE_DIR = os.path.join(ROOT, 'static', 'images', 'symbols')
+
+# Tile edge in px; symbols are drawn at 60-180 px, so 1x/2x/3x of 64
+TIERS = (64, 128, 192)
+
+# Format -> Pillow save options
+FORMATS = {
+    'avif': {'quality': 60},
+    'webp': {'quality': 82, 'method': 6},
+    'png': {'optimize': True},
+}
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tile_path(name, source_hash, size):
+    return os.path.join(CACHE_DIR, f"{name}-{size}-{source_hash[:12]}.png")
+
+
+def render_tile(source, destination, size):
+    """Fit ``source`` into a transparent ``size`` x ``size`` tile."""
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image = image.convert('RGBA')
+        # reducing_gap shrinks the multi-megapixel sources by integer steps
+        # before the LANCZOS pass, which is much faster than LANCZOS alone
+        image.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+        tile = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        tile.paste(image, ((size - image.width) // 2, (size - image.height) // 2))
+    tmp_path = f"{destination}.tmp.png"
+    tile.save(tmp_path, optimize=True)
+    os.replace(tmp_path, destination)
+    return destination
+
+
+def atlas_layout(names, size):
+    """Place ``names`` on a near-square grid of ``size`` px tiles."""
+    columns = max(1, math.ceil(math.sqrt(len(names))))
+    rows = max(1, math.ceil(len(names) / columns))
+    frames = {name: {'x': (i % columns) * size, 'y': (i // columns) * size, 'w': size, 'h': size}
+              for i, name in enumerate(names)}
+    return (columns * size, rows * size), frames
+
+
+def encode_atlas(tiles, frames, dimensions, destination, image_format):
+    from PIL import Image
+
+    atlas = Image.new('RGBA', dimensions, (0, 0, 0, 0))
+    for name, path in tiles.items():
+        with Image.open(path) as tile:
+            atlas.paste(tile, (frames[name]['x'], frames[name]['y']))
+    tmp_path = f"{destination}.tmp"
+    atlas.save(tmp_path, format=image_format.upper(), **FORMATS[image_format])
+    os.replace(tmp_path, destination)
+    return destination, os.path.getsize(destination)
+
+
+def available_formats():
+    from PIL import features
+
+    return [fmt for fmt in FORMATS if fmt == 'png' or features.check(fmt)]
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def build(force=False, workers=None):
+    started = time.perf_counter()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    sources = {}
+    for name, filename in SYMBOL_SOURCES.items():
+        path = os.path.join(SOURCE_DIR, filename)
+        if os.path.exists(path):
+            sources[name] = (path, file_hash(path))
+        else:
+            print(f"  missing source for {name}: {filename} (client falls back)")
+    names = sorted(sources)
+    formats = available_formats()
+
+    previous = None if force else load_manifest()
+    source_hashes = {name: digest for name, (_, digest) in sources.items()}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Resize only tiles whose source changed (or whose cache was cleared)
+        jobs = []
+        for name in names:
+            path, digest = sources[name]
+            for size in TIERS:
+                destination = tile_path(name, digest, size)
+                if force or not os.path.exists(destination):
+                    jobs.append(pool.submit(render_tile, path, destination, size))
+        for job in jobs:
+            job.result()
+        print(f"  resized {len(jobs)} tiles, {len(names) * len(TIERS) - len(jobs)} cached")
+
+        tiers = {}
+        encodes = []
+        for size in TIERS:
+            dimensions, frames = atlas_layout(names, size)
+            files = {fmt: f"atlas-{size}.{fmt}" for fmt in formats}
+            unchanged = (
+                previous is not None
+                and previous.get('sources') == source_hashes
+                and str(size) in previous.get('tiers', {})
+                and previous['tiers'][str(size)]['files'] == files
+                and all(os.path.exists(os.path.join(OUTPUT_DIR, f)) for f in files.values())
+            )
+            tiers[str(size)] = {
+                'size': size,
+                'width': dimensions[0],
+                'height': dimensions[1],
+                'files': files,
+                'bytes': previous['tiers'][str(size)].get('bytes', {}) if unchanged else {},
+                'frames': frames,
+            }
+            if unchanged:
+                continue
+            tiles = {name: tile_path(name, sources[name][1], size) for name in names}
+            for fmt, filename in files.items():
+                encodes.append((size, fmt, pool.submit(
+                    encode_atlas, tiles, frames, dimensions, os.path.join(OUTPUT_DIR, filename), fmt)))
+        for size, fmt, job in encodes:
+            _, nbytes = job.result()
+            tiers[str(size)]['bytes'][fmt] = nbytes
+        print(f"  encoded {len(encodes)} atlases")
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'formats': formats,
+        'symbols': names,
+        'sources': source_hashes,
+        'tiers': tiers,
+    }
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+    # Drop cached tiles of sources that changed since
+    live = {os.path.basename(tile_path(name, sources[name][1], size)) for name in names for size in TIERS}
+    for filename in os.listdir(CACHE_DIR):
+        if filename.endswith('.png') and filename not in live:
+            os.remove(os.path.join(CACHE_DIR, filename))
+
+    source_bytes = sum(os.path.getsize(path) for path, _ in sources.values())
+    print(f"Sprites for {len(names)} symbols in {time.perf_counter() - started:.2f}s "
+          f"(sources {source_bytes / 1e6:.1f} MB)")
+    for size, tier in tiers.items():
+        sizes = ', '.join(f"{fmt} {nbytes / 1024:.0f} KB" for fmt, nbytes in sorted(tier['bytes'].items()))
+        print(f"  {size:>4}px  {sizes}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build symbol sprite atlases")
+    parser.add_argument('--force', action='store_true', help="ignore caches and rebuild everything")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args(argv)
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("build_sprites.py needs Pillow: pip install pillow")
+    build(args.force, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import numpy as np
+
+from game_config import PAYLINES, SCATTER_SYMBOL, SYMBOL_VALUES, WILD_MULTIPLIERS
+from spin_engine import engine as spin_engine
+
+# Grids scored per chunk; keeps the (chunk, lines, reels) temporaries small
+CHUNK_SIZE = 1 << 16
+
+
+class BatchEvaluator:
+    """
+    Vectorized equivalent of ``app.calculate_winnings``.
+
+    Grids are integer-coded arrays of shape ``(N, reels, rows)`` using the
+    symbol codes of ``SpinEngine``. Payline coordinates and the per-symbol
+    properties (match mask, wild multiplier, pay value) are precomputed as arrays,
+    so scoring a batch is a handful of gathers and reductions.
+    """
+
+    def __init__(self, symbols, paylines, symbol_values, wild_multipliers, scatter_symbol):
+        self.symbols = tuple(symbols)
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+
+        # Anything named wild_* substitutes, as in calculate_winnings
+        is_wild = [s.startswith('wild_') for s in self.symbols]
+        base_symbols = [code for code, s in enumerate(self.symbols)
+                        if not is_wild[code] and s != scatter_symbol]
+
+        # Each base symbol owns one bit; a wild carries every bit and the
+        # scatter none. AND-ing a line's masks leaves exactly the base
+        # symbol's bit when the line wins, 0 when it is broken and the full
+        # mask when it is all wilds (no base symbol, no win).
+        full_mask = (1 << len(base_symbols)) - 1
+        match_mask = np.zeros(len(self.symbols), dtype=np.uint16)
+        for bit, code in enumerate(base_symbols):
+            match_mask[code] = 1 << bit
+        match_mask[np.array(is_wild)] = full_mask
+        self.match_mask = match_mask
+
+        self.base_by_mask = np.full(full_mask + 1, -1, dtype=np.int64)
+        for bit, code in enumerate(base_symbols):
+            self.base_by_mask[1 << bit] = code
+        self.value_by_mask = np.zeros(full_mask + 1, dtype=np.int64)
+        for bit, code in enumerate(base_symbols):
+            self.value_by_mask[1 << bit] = symbol_values.get(self.symbols[code], 0)
+
+        self.wild_multiplier = np.array(
+            [wild_multipliers.get(s, 1) if wild else 1 for s, wild in zip(self.symbols, is_wild)],
+            dtype=np.int64)
+        self.pay_value = np.array([symbol_values.get(s, 0) for s in self.symbols], dtype=np.int64)
+
+        self.line_reels = np.array([[x for x, _ in line] for line in paylines], dtype=np.intp)
+        self.line_rows = np.array([[y for _, y in line] for line in paylines], dtype=np.intp)
+
+    @classmethod
+    def from_config(cls):
+        return cls(spin_engine.symbols, PAYLINES, SYMBOL_VALUES, WILD_MULTIPLIERS, SCATTER_SYMBOL)
+
+    @property
+    def line_count(self):
+        return len(self.line_reels)
+
+    def encode(self, results):
+        """Convert grids of symbol names (as returned by ``/spin``) to codes."""
+        codes = self.codes
+        return np.array([[[codes[s] for s in reel] for reel in result] for result in results],
+                        dtype=np.uint8)
+
+    def line_outcomes(self, grids):
+        """
+        Score every payline of every grid.
+
+        Returns ``(base, multiplier, pays)``, each of shape ``(N, lines)``:
+        the winning symbol code (-1 for losing lines), the product of the
+        wild multipliers on the line (1 for losing lines) and the line win as
+        a bet multiple.
+        """
+        grids = np.asarray(grids)
+        masks = np.take(self.match_mask, grids)[:, self.line_reels, self.line_rows]
+        line_mask = np.bitwise_and.reduce(masks, axis=2)
+        base = self.base_by_mask[line_mask]
+        pays = self.value_by_mask[line_mask]
+
+        # Wins are sparse, so multipliers are only gathered for winning lines
+        multiplier = np.ones(pays.shape, dtype=np.int64)
+        hit_grid, hit_line = np.nonzero(pays)
+        if len(hit_grid):
+            cells = grids[hit_grid[:, None], self.line_reels[hit_line], self.line_rows[hit_line]]
+            multiplier[hit_grid, hit_line] = self.wild_multiplier[cells].prod(axis=1)
+            pays *= multiplier
+        return base, multiplier, pays
+
+    def evaluate(self, grids, bet=1.0):
+        """Return the ``(N,)`` total win of each grid for ``bet``."""
+        grids = np.asarray(grids)
+        bet = np.asarray(bet, dtype=np.float64)
+        winnings = np.empty(len(grids), dtype=np.float64)
+        for start in range(0, len(grids), CHUNK_SIZE):
+            stop = start + CHUNK_SIZE
+            chunk_bet = bet if bet.ndim == 0 else bet[start:stop]
+            winnings[start:stop] = self._evaluate_chunk(grids[start:stop], chunk_bet)
+        return winnings
+
+    def _evaluate_chunk(self, grids, bet):
+        base, multiplier, pays = self.line_outcomes(grids)
+        won = pays > 0
+        values = self.pay_value[base]
+        # Same operation order as calculate_winnings (bet * value * multiplier,
+        # summed line by line) so the float results are bit-identical
+        winnings = np.zeros(len(grids), dtype=np.float64)
+        for line in range(self.line_count):
+            line_win = bet * values[:, line] * multiplier[:, line]
+            winnings += np.where(won[:, line], line_win, 0.0)
+        return winnings
+
+
+evaluator = BatchEvaluator.from_config()
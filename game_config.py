@@ -0,0 +1,30 @@
+"""
+Default game, shared by the Flask routes and the game-math tools.
+
+The definition itself lives in ``games/tropical.json``; see ``games.py`` for
+the format. The names below are the parts the exact RTP calculator, the batch
+evaluator and the simulator work with (full-line pays only).
+"""
+import os
+
+from games import DEFAULT_GAME, GAMES_DIR, load_game
+
+GAME = load_game(os.path.join(GAMES_DIR, f'{DEFAULT_GAME}.json'))
+
+REEL_COUNT = GAME.reel_count
+ROW_COUNT = GAME.row_count
+
+SYMBOLS = GAME.symbols
+REEL_WEIGHTS = GAME.reel_weights
+
+SCATTER_SYMBOL = GAME.scatter_symbol
+
+WILD_MULTIPLIERS = GAME.wild_multipliers
+
+# Base win amount (bet multiple) for a full line of the symbol
+SYMBOL_VALUES = GAME.full_line_values()
+
+PAYLINES = GAME.paylines
+
+# Scatters on one grid that count as a bonus trigger (autoplay stops on it)
+BONUS_TRIGGER_SCATTERS = GAME.bonus_trigger
@@ -0,0 +1,543 @@
+"""
+Game definitions: reels, wilds, paytable and paylines loaded from ``games/*.json``.
+
+A definition is validated when it is loaded and compiled into plain lookup
+tables. Evaluating a grid is then a few table lookups and integer
+operations, with no per-line walk:
+
+- Payline games keep, per reel, a bitset of the lines that pass through
+  each combination of rows. For each candidate symbol the bitsets of its
+  matching cells are AND-ed reel by reel, so all lines are evaluated at
+  once and the cost barely depends on the number of lines. Only winning
+  lines are visited to collect their wild multipliers.
+- Ways games (``"ways": true``, 243 ways on 5x3) multiply, reel by reel, the
+  number of matching cells (weighted by wild multipliers) instead of
+  enumerating the paths.
+
+Lines and ways pay left to right. The run length decides the paytable entry
+(``"paytable": {"dragon": {"3": 5, "4": 20, "5": 50}}``). The first non-wild
+symbol of a run is its base symbol. Runs made only of wilds pay nothing.
+Scatters neither pay on lines nor are substituted.
+
+An optional ``"bonus"`` object configures the free-spin round played by
+``bonus.py``: the number of spins, the bonus reels (a partial shorthand such
+as ``{"wild_chance": 0.35}`` overrides the base reels), retriggers, an
+accumulating win multiplier, a cap on the spins of one round and the price
+of a bought round in bets.
+
+Any number of games can be loaded side by side; ``game_registry`` serves the
+ones in ``GAMES_DIR`` to the app.
+"""
+import hashlib
+import json
+import os
+import re
+from fractions import Fraction
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GAMES_DIR = os.path.join(ROOT, 'games')
+DEFAULT_GAME = 'tropical'
+
+_NAME = re.compile(r'^[a-z0-9_]+$')
+
+
+class GameConfigError(ValueError):
+    """A game definition that cannot be played."""
+
+
+def _require(condition, message):
+    if not condition:
+        raise GameConfigError(message)
+
+
+def reel_weight_table(regular_symbols, wild_symbols, wild_reels, wild_chance, reel_count):
+    """
+    Build integer weights per reel over the combined symbol list.
+
+    A wild reel picks a wild with probability ``wild_chance`` and a regular
+    symbol otherwise; both branches are folded into one integer table so a
+    cell needs a single draw instead of two.
+    """
+    regular = list(regular_symbols.values())
+    wild = list(wild_symbols.values())
+    regular_total = sum(regular)
+    wild_total = sum(wild)
+
+    chance = Fraction(wild_chance).limit_denominator(10000)
+    # P(regular s) = (1 - chance) * w / regular_total
+    # P(wild s)    = chance * w / wild_total
+    regular_scale = (1 - chance) * wild_total
+    wild_scale = chance * regular_total
+    denominator = regular_scale.denominator * wild_scale.denominator
+    regular_scale = int(regular_scale * denominator)
+    wild_scale = int(wild_scale * denominator)
+
+    plain_reel = tuple(regular) + (0,) * len(wild)
+    wild_reel = tuple(w * regular_scale for w in regular) + tuple(w * wild_scale for w in wild)
+
+    return [wild_reel if reel_index in wild_reels else plain_reel
+            for reel_index in range(reel_count)]
+
+
+class LineEvaluator:
+    """Payline wins from per-reel line bitsets; see the module docstring."""
+
+    def __init__(self, game):
+        self.game = game
+        self.line_count = len(game.paylines)
+        self.all_lines = (1 << self.line_count) - 1
+        # line_bits[reel][row_mask]: lines whose cell on ``reel`` is one of the rows in row_mask
+        self.line_bits = [
+            [sum(1 << l for l, line in enumerate(game.paylines) if row_mask >> line[reel][1] & 1)
+             for row_mask in range(1 << game.row_count)]
+            for reel in range(game.reel_count)
+        ]
+        self.line_rows = [tuple(row for _, row in line) for line in game.paylines]
+
+    def evaluate(self, grid, bet):
+        """Win of every payline (0 for losing lines), in payline order."""
+        game = self.game
+        is_wild = game.is_wild
+        pays = game.pays
+        line_bits = self.line_bits
+        reel_count = len(grid)
+
+        reel_masks = []
+        wild_masks = []
+        for reel in grid:
+            masks = {}
+            wild = 0
+            for row, code in enumerate(reel):
+                if is_wild[code]:
+                    wild |= 1 << row
+                else:
+                    masks[code] = masks.get(code, 0) | 1 << row
+            reel_masks.append(masks)
+            wild_masks.append(wild)
+
+        # A run can only start on reel 0, with the symbol itself or a wild
+        if wild_masks[0]:
+            candidates = {code for masks in reel_masks for code in masks if pays[code]}
+        else:
+            candidates = [code for code in reel_masks[0] if pays[code]]
+
+        wins = [0] * self.line_count
+        if not candidates:
+            return wins
+
+        # Lines whose first k cells are all wild, per k; they have no base symbol yet
+        wild_runs = []
+        alive = self.all_lines
+        for reel_index in range(reel_count):
+            alive &= line_bits[reel_index][wild_masks[reel_index]]
+            wild_runs.append(alive)
+
+        min_length = game.min_length
+        for code in candidates:
+            runs = []
+            alive = self.all_lines
+            for reel_index in range(reel_count):
+                alive &= line_bits[reel_index][reel_masks[reel_index].get(code, 0) | wild_masks[reel_index]]
+                if not alive:
+                    break
+                runs.append(alive)
+            if len(runs) < min_length:
+                continue
+            code_pays = pays[code]
+            longer = 0
+            for length in range(len(runs), min_length - 1, -1):
+                # Lines whose run is exactly ``length`` long and not all wild
+                exact = runs[length - 1] & ~longer & ~wild_runs[length - 1]
+                longer = runs[length - 1]
+                value = code_pays[length]
+                if not exact or not value:
+                    continue
+                while exact:
+                    low = exact & -exact
+                    line = low.bit_length() - 1
+                    exact ^= low
+                    multiplier = 1
+                    for reel_index, row in enumerate(self.line_rows[line][:length]):
+                        multiplier *= game.wild_multiplier[grid[reel_index][row]]
+                    wins[line] = bet * value * multiplier
+        return wins
+
+
+class WaysEvaluator:
+    """Ways wins from per-reel matching-cell counts; see the module docstring."""
+
+    def __init__(self, game):
+        self.game = game
+        self.paying = [code for code in range(len(game.symbols)) if game.pays[code]]
+        self.slot = {code: index for index, code in enumerate(self.paying)}
+
+    @property
+    def line_count(self):
+        return len(self.paying)
+
+    def evaluate(self, grid, bet):
+        """Win of every paying symbol (0 when it does not win), in symbol order."""
+        game = self.game
+        is_wild = game.is_wild
+        wild_multiplier = game.wild_multiplier
+        pays = game.pays
+
+        reel_counts = []
+        wild_sums = []
+        for reel in grid:
+            counts = {}
+            wild = 0
+            for code in reel:
+                if is_wild[code]:
+                    wild += wild_multiplier[code]
+                else:
+                    counts[code] = counts.get(code, 0) + 1
+            reel_counts.append(counts)
+            wild_sums.append(wild)
+
+        if wild_sums[0]:
+            candidates = {code for counts in reel_counts for code in counts if pays[code]}
+        else:
+            candidates = [code for code in reel_counts[0] if pays[code]]
+
+        wins = [0] * len(self.paying)
+        for code in candidates:
+            # Ways through the first ``length`` reels, each weighted by the
+            # product of its wild multipliers, minus the all-wild ones
+            ways = 1
+            wild_ways = 1
+            length = 0
+            for counts, wild in zip(reel_counts, wild_sums):
+                matching = counts.get(code, 0) + wild
+                if not matching:
+                    break
+                ways *= matching
+                wild_ways *= wild
+                length += 1
+            value = pays[code][length]
+            if value and ways > wild_ways:
+                wins[self.slot[code]] = bet * value * (ways - wild_ways)
+        return wins
+
+
+class Game:
+    """A validated, compiled game definition."""
+
+    def __init__(self, definition, source='<definition>'):
+        self.source = source
+        self.definition = definition
+        _require(isinstance(definition, dict), f"{source}: a game definition is a JSON object")
+
+        self.name = definition.get('name')
+        _require(isinstance(self.name, str) and _NAME.match(self.name),
+                 f"{source}: 'name' must be lowercase letters, digits and underscores")
+        self.title = definition.get('title', self.name)
+        # Identifies this exact definition (key order matters: it orders symbols);
+        # derived spins are replayed against it
+        self.version = hashlib.sha256(
+            json.dumps(definition, separators=(',', ':')).encode('utf-8')).hexdigest()[:16]
+        self.reel_count = definition.get('reels')
+        self.row_count = definition.get('rows')
+        for key, value in (('reels', self.reel_count), ('rows', self.row_count)):
+            _require(isinstance(value, int) and value > 0, f"{source}: '{key}' must be a positive integer")
+
+        symbols = definition.get('symbols')
+        _require(isinstance(symbols, list) and symbols and all(isinstance(s, str) for s in symbols),
+                 f"{source}: 'symbols' must be a non-empty list of names")
+        _require(len(set(symbols)) == len(symbols), f"{source}: 'symbols' has duplicates")
+        self.symbols = tuple(symbols)
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+
+        wilds = definition.get('wilds', {})
+        self._check_symbols(wilds, 'wilds')
+        _require(all(isinstance(m, int) and m >= 1 for m in wilds.values()),
+                 f"{source}: wild multipliers must be integers >= 1")
+        self.wild_multipliers = dict(wilds)
+        self.is_wild = [s in wilds for s in self.symbols]
+        self.wild_multiplier = [wilds.get(s, 1) for s in self.symbols]
+
+        scatter = definition.get('scatter')
+        self.scatter_symbol = None
+        self.bonus_trigger = None
+        if scatter is not None:
+            _require(isinstance(scatter, dict) and scatter.get('symbol') in self.codes,
+                     f"{source}: 'scatter.symbol' must be one of the symbols")
+            _require(scatter['symbol'] not in wilds, f"{source}: the scatter cannot be a wild")
+            self.scatter_symbol = scatter['symbol']
+            self.bonus_trigger = scatter.get('bonus_trigger')
+            _require(self.bonus_trigger is None or (isinstance(self.bonus_trigger, int) and self.bonus_trigger > 0),
+                     f"{source}: 'scatter.bonus_trigger' must be a positive integer")
+
+        self.reel_weights = self._compile_reels(definition.get('reel_weights'))
+
+        paytable = definition.get('paytable')
+        _require(isinstance(paytable, dict) and paytable, f"{source}: 'paytable' must be a non-empty object")
+        self._check_symbols(paytable, 'paytable')
+        # pays[code][length] -> bet multiple (per line or per way)
+        self.pays = [None] * len(self.symbols)
+        for symbol, by_length in paytable.items():
+            _require(symbol not in wilds and symbol != self.scatter_symbol,
+                     f"{source}: wilds and the scatter cannot be in the paytable ({symbol})")
+            _require(isinstance(by_length, dict) and by_length, f"{source}: paytable[{symbol}] must be an object")
+            row = [0] * (self.reel_count + 1)
+            for length, value in by_length.items():
+                _require(str(length).isdigit() and 1 <= int(length) <= self.reel_count,
+                         f"{source}: paytable[{symbol}] lengths must be 1..{self.reel_count}")
+                _require(isinstance(value, (int, float)) and value >= 0,
+                         f"{source}: paytable[{symbol}][{length}] must be a non-negative number")
+                row[int(length)] = value
+            if any(row):
+                self.pays[self.codes[symbol]] = row
+        _require(any(self.pays), f"{source}: the paytable needs at least one non-zero pay")
+        self.min_length = min(length for row in self.pays if row for length, v in enumerate(row) if v)
+
+        ways = definition.get('ways', False)
+        paylines = definition.get('paylines')
+        _require(bool(ways) != (paylines is not None), f"{source}: give either 'paylines' or 'ways': true")
+        if ways:
+            self.mode = 'ways'
+            self.paylines = []
+            self.evaluator = WaysEvaluator(self)
+        else:
+            _require(isinstance(paylines, list) and paylines, f"{source}: 'paylines' must be a non-empty list")
+            for line in paylines:
+                _require(isinstance(line, list) and len(line) == self.reel_count
+                         and all(isinstance(row, int) and 0 <= row < self.row_count for row in line),
+                         f"{source}: payline {line} must give one row (0..{self.row_count - 1}) per reel")
+            _require(len({tuple(line) for line in paylines}) == len(paylines), f"{source}: duplicate paylines")
+            self.mode = 'lines'
+            # (reel, row) pairs, the format the game-math tools use
+            self.paylines = [[(reel, row) for reel, row in enumerate(line)] for line in paylines]
+            self.evaluator = LineEvaluator(self)
+
+        self.bonus = self._compile_bonus(definition.get('bonus'))
+        self._engine = None
+        self._bonus_engine = None
+
+    def _check_symbols(self, mapping, key):
+        _require(isinstance(mapping, dict), f"{self.source}: '{key}' must be an object")
+        unknown = [s for s in mapping if s not in self.codes]
+        _require(not unknown, f"{self.source}: '{key}' names unknown symbols {unknown}")
+
+    def _compile_bonus(self, spec):
+        """Free-spin round settings, or None for a game without one."""
+        if spec is None:
+            return None
+        source = self.source
+        _require(isinstance(spec, dict), f"{source}: 'bonus' must be an object")
+
+        def positive_int(key, value, minimum=1):
+            _require(isinstance(value, int) and value >= minimum,
+                     f"{source}: 'bonus.{key}' must be an integer >= {minimum}")
+            return value
+
+        bonus = {'spins': positive_int('spins', spec.get('spins'))}
+        # Price of a bought round, in bets (one bet per spin by default)
+        bonus['cost'] = spec.get('cost', bonus['spins'])
+        _require(isinstance(bonus['cost'], (int, float)) and bonus['cost'] > 0,
+                 f"{source}: 'bonus.cost' must be a positive number")
+        reels = spec.get('reel_weights')
+        base_reels = self.definition.get('reel_weights')
+        if reels is None:
+            bonus['reel_weights'] = self.reel_weights
+        else:
+            # A partial shorthand overrides the base game's (e.g. just a higher wild_chance)
+            if isinstance(reels, dict) and isinstance(base_reels, dict):
+                reels = dict(base_reels, **reels)
+            bonus['reel_weights'] = self._compile_reels(reels)
+
+        retrigger = spec.get('retrigger')
+        if retrigger is None:
+            bonus['retrigger_scatters'] = bonus['retrigger_spins'] = 0
+        else:
+            _require(isinstance(retrigger, dict) and self.scatter_symbol is not None,
+                     f"{source}: 'bonus.retrigger' needs a scatter and must be an object")
+            bonus['retrigger_scatters'] = positive_int('retrigger.scatters', retrigger.get('scatters'))
+            bonus['retrigger_spins'] = positive_int('retrigger.spins', retrigger.get('spins'))
+
+        multiplier = spec.get('multiplier', {})
+        _require(isinstance(multiplier, dict), f"{source}: 'bonus.multiplier' must be an object")
+        bonus['multiplier_start'] = positive_int('multiplier.start', multiplier.get('start', 1))
+        bonus['multiplier_step'] = positive_int('multiplier.step', multiplier.get('step', 0), minimum=0)
+        bonus['multiplier_max'] = positive_int('multiplier.max', multiplier.get('max', bonus['multiplier_start']),
+                                               minimum=bonus['multiplier_start'])
+        # Retriggers stop adding spins here, so a round always ends
+        bonus['max_spins'] = positive_int('max_spins', spec.get('max_spins', bonus['spins'] * 5),
+                                          minimum=bonus['spins'])
+        return bonus
+
+    def _compile_reels(self, spec):
+        """Per-reel weight tuples aligned with ``symbols``."""
+        source = self.source
+        if isinstance(spec, dict):
+            # Shorthand: base weights everywhere, wilds mixed in on some reels
+            base, wilds = spec.get('base', {}), spec.get('wilds', {})
+            self._check_symbols(base, 'reel_weights.base')
+            self._check_symbols(wilds, 'reel_weights.wilds')
+            _require(list(base) + list(wilds) == list(self.symbols),
+                     f"{source}: 'reel_weights' base + wilds must list the symbols in order")
+            wild_reels = spec.get('wild_reels', [])
+            _require(all(isinstance(r, int) and 0 <= r < self.reel_count for r in wild_reels),
+                     f"{source}: 'reel_weights.wild_reels' must be reel indexes")
+            chance = spec.get('wild_chance', 0)
+            _require(isinstance(chance, (int, float)) and 0 <= chance < 1,
+                     f"{source}: 'reel_weights.wild_chance' must be in [0, 1)")
+            weights = reel_weight_table(base, wilds, set(wild_reels), chance, self.reel_count)
+        else:
+            _require(isinstance(spec, list) and len(spec) == self.reel_count,
+                     f"{source}: 'reel_weights' must be one object per reel or the wild-chance shorthand")
+            weights = []
+            for index, reel in enumerate(spec):
+                self._check_symbols(reel, f"reel_weights[{index}]")
+                weights.append(tuple(reel.get(s, 0) for s in self.symbols))
+        for index, reel in enumerate(weights):
+            _require(all(isinstance(w, int) and w >= 0 for w in reel) and sum(reel) > 0,
+                     f"{source}: reel {index} needs non-negative integer weights with a positive total")
+        return [tuple(reel) for reel in weights]
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                definition = json.load(f)
+        except ValueError as e:
+            raise GameConfigError(f"{path}: invalid JSON: {e}") from e
+        return cls(definition, source=os.path.basename(path))
+
+    @property
+    def engine(self):
+        """The ``SpinEngine`` drawing this game's grids (built on first use)."""
+        if self._engine is None:
+            from spin_engine import SpinEngine
+
+            self._engine = SpinEngine.from_game(self)
+        return self._engine
+
+    @property
+    def bonus_engine(self):
+        """The ``SpinEngine`` for free spins (the bonus reels; built on first use)."""
+        if self._bonus_engine is None:
+            from spin_engine import SpinEngine
+
+            self._bonus_engine = SpinEngine(self.symbols, self.bonus['reel_weights'], self.row_count)
+        return self._bonus_engine
+
+    @property
+    def line_count(self):
+        """Paylines, or paying symbols for a ways game (the length of ``wins``)."""
+        return self.evaluator.line_count
+
+    def spin(self, rng=None):
+        return self.engine.spin(rng)
+
+    def wins_codes(self, grid, bet):
+        return self.evaluator.evaluate(grid, bet)
+
+    def wins(self, result, bet):
+        """Wins per payline (or per paying symbol for ways) of a grid of names."""
+        codes = self.codes
+        return self.evaluator.evaluate([[codes[s] for s in reel] for reel in result], bet)
+
+    def scatter_count(self, result):
+        if self.scatter_symbol is None:
+            return 0
+        return sum(reel.count(self.scatter_symbol) for reel in result)
+
+    def triggers_bonus(self, result):
+        return self.bonus_trigger is not None and self.scatter_count(result) >= self.bonus_trigger
+
+    def full_line_values(self):
+        """
+        ``{symbol: value}`` for games that pay full lines only.
+
+        That is the model of the exact RTP calculator and the batch evaluator;
+        other games raise ``GameConfigError``.
+        """
+        _require(self.mode == 'lines', f"{self.name}: not a payline game")
+        values = {}
+        for code, row in enumerate(self.pays):
+            if row:
+                _require(not any(row[:self.reel_count]),
+                         f"{self.name}: pays runs shorter than a full line")
+                values[self.symbols[code]] = row[self.reel_count]
+        return values
+
+    def describe(self):
+        """Public description, as served by ``/games``."""
+        data = {
+            'name': self.name,
+            'title': self.title,
+            'reels': self.reel_count,
+            'rows': self.row_count,
+            'symbols': list(self.symbols),
+            'wilds': self.wild_multipliers,
+            'scatter': self.scatter_symbol,
+            'bonus_trigger': self.bonus_trigger,
+            'paytable': {self.symbols[code]: {str(length): value for length, value in enumerate(row) if value}
+                         for code, row in enumerate(self.pays) if row},
+        }
+        if self.bonus is not None:
+            data['bonus'] = {key: self.bonus[key] for key in
+                             ('spins', 'cost', 'retrigger_scatters', 'retrigger_spins', 'multiplier_start',
+                              'multiplier_step', 'multiplier_max', 'max_spins')}
+        if self.mode == 'ways':
+            data['ways'] = self.row_count ** self.reel_count
+        else:
+            data['paylines'] = [[row for _, row in line] for line in self.paylines]
+        return data
+
+
+def load_game(path):
+    return Game.load(path)
+
+
+class GameRegistry:
+    """The games served by the app, loaded and validated at startup."""
+
+    def __init__(self, app=None):
+        self.directory = GAMES_DIR
+        self.default = DEFAULT_GAME
+        self._games = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('GAMES_DIR', self.directory)
+        self.default = app.config.get('DEFAULT_GAME', self.default)
+        # Fail at startup, not on the first spin of a broken game
+        self.load()
+
+    def load(self):
+        import spin_codec
+
+        games = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+            game = Game.load(os.path.join(self.directory, filename))
+            _require(game.name not in games, f"{filename}: game '{game.name}' is defined twice")
+            # Spins are stored with the shared binary codec
+            dictionary = spin_codec.SYMBOL_DICTIONARIES[spin_codec.CODEC_VERSION]
+            _require((game.reel_count, game.row_count) == (spin_codec.REEL_COUNT, spin_codec.ROW_COUNT),
+                     f"{filename}: the app stores {spin_codec.REEL_COUNT}x{spin_codec.ROW_COUNT} grids only")
+            _require(set(game.symbols) <= set(dictionary),
+                     f"{filename}: symbols {sorted(set(game.symbols) - set(dictionary))} "
+                     f"are not in spin codec version {spin_codec.CODEC_VERSION}")
+            games[game.name] = game
+        _require(self.default in games, f"default game '{self.default}' not found in {self.directory}")
+        self._games = games
+        return games
+
+    def get(self, name=None):
+        """The game called ``name`` (the default for None); KeyError if unknown."""
+        if self._games is None:
+            self.load()
+        return self._games[name or self.default]
+
+    def __iter__(self):
+        if self._games is None:
+            self.load()
+        return iter(self._games.values())
+
+
+game_registry = GameRegistry()
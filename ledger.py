@@ -0,0 +1,363 @@
+"""
+Write-behind ledger for spin results.
+
+``/spin`` only puts a record on a bounded in-memory queue; a background thread
+per worker drains it and bulk-inserts the rows into the monthly partitions of
+``spin_history``, closing a batch when it reaches ``LEDGER_BATCH_SIZE``
+records or when ``LEDGER_FLUSH_INTERVAL`` seconds have passed since its first
+record. The same transaction bumps the running totals and the time-bucketed
+rollups (``rollups.py``).
+
+A flush that fails (a locked SQLite file, a PostgreSQL failover) is retried
+``LEDGER_RETRIES`` times with a doubling backoff. A batch that still cannot be
+written is spooled as JSON lines to ``LEDGER_SPOOL_DIR`` and written back,
+counters and rollups included, by ``python ledger.py replay``.
+
+A record that finds the queue full for ``LEDGER_PUT_TIMEOUT`` seconds is
+dropped, but its totals still go to ``stat_counters.add`` and its rollups to
+``stat_rollups.add``, so ``/statistics`` only misses the row itself.
+"""
+import argparse
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+import spin_codec
+from database import db
+from rollups import stat_rollups
+from spin_history import spin_history
+from stat_counters import stat_counters
+
+# Put on the queue by shutdown() so a flusher blocked in get() wakes up at once
+_WAKE = object()
+
+
+def spin_record(bet, winnings, result, winning_lines, wallet_id=None, is_bonus_spin=False,
+                timestamp=None, bonus_spins_awarded=0, reference=None):
+    """
+    Build a spin ledger row (as a dict) from a resolved spin.
+
+    A derived spin passes its ``reference`` (see ``provenance.py``), which is
+    stored instead of the grid.
+    """
+    return {
+        'timestamp': timestamp or datetime.utcnow(),
+        'wallet_id': wallet_id,
+        'bet_amount': bet,
+        'win_amount': winnings,
+        'result_codes': reference or spin_codec.encode(result),
+        'bonus_spins_awarded': bonus_spins_awarded,
+        'is_bonus_spin': is_bonus_spin,
+        'is_respin': False,
+        'winning_lines': winning_lines,
+    }
+
+
+def _dump_row(row):
+    return dict(row, timestamp=row['timestamp'].isoformat(), result_codes=row['result_codes'].hex())
+
+
+def _load_row(data):
+    return dict(data, timestamp=datetime.fromisoformat(data['timestamp']),
+                result_codes=bytes.fromhex(data['result_codes']))
+
+
+class SpinLedger:
+    """Bounded queue plus a background flusher that bulk-inserts spin records."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_queue = 10000
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.put_timeout = 0.005
+        self.retries = 5
+        self.retry_backoff = 0.1
+        self.spool_dir = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._reset_counters()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_queue = app.config.get('LEDGER_QUEUE_SIZE', self.max_queue)
+        self.batch_size = app.config.get('LEDGER_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('LEDGER_FLUSH_INTERVAL', self.flush_interval)
+        # How long a request may block on a full queue before the record is dropped
+        self.put_timeout = app.config.get('LEDGER_PUT_TIMEOUT', self.put_timeout)
+        # A failing flush is retried after LEDGER_RETRY_BACKOFF seconds, doubling
+        # each time; a batch still failing after LEDGER_RETRIES goes to the spool
+        self.retries = app.config.get('LEDGER_RETRIES', self.retries)
+        self.retry_backoff = app.config.get('LEDGER_RETRY_BACKOFF', self.retry_backoff)
+        self.spool_dir = app.config.get('LEDGER_SPOOL_DIR') or os.path.join(app.instance_path, 'ledger-spool')
+        atexit.register(self.shutdown)
+
+    def _reset_counters(self):
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+        self.spooled = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def _ensure_started(self):
+        # Threads and queues do not survive a fork, so each worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._stopping.clear()
+            self._reset_counters()
+            self._thread = threading.Thread(target=self._run, name='spin-ledger', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def record(self, row):
+        """Queue one record; returns False when it had to be dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            self._drop(row)
+            return False
+        self.enqueued += 1
+        return True
+
+    def _drop(self, row):
+        # The spin is settled, so /statistics and its series still count it
+        self.dropped += 1
+        win = row['win_amount']
+        stat_counters.add({'biggest_win': win}, total_spins=1, total_wins=1 if win > 0 else 0,
+                          total_bet=row['bet_amount'], total_won=win)
+        stat_rollups.add([row])
+
+    def record_many(self, rows):
+        return sum(self.record(row) for row in rows)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            if stat_rollups.pending:
+                self._flush_dropped()
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        if first is _WAKE:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                row = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if row is _WAKE:
+                break
+            batch.append(row)
+        return batch
+
+    def _write(self, batch):
+        """Insert a batch with its counter and rollup deltas in one transaction."""
+        wins = [row['win_amount'] for row in batch]
+        with self.app.app_context():
+            try:
+                for table, rows in spin_history.route(batch).items():
+                    db.session.execute(insert(table), rows)
+                stat_counters.apply(
+                    {
+                        'total_spins': len(batch),
+                        'total_wins': sum(1 for win in wins if win > 0),
+                        'total_bet': sum(row['bet_amount'] for row in batch),
+                        'total_won': sum(wins),
+                    },
+                    {'biggest_win': max(wins)},
+                )
+                stat_rollups.apply(batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            # The batch is committed, so a failed compaction must not retry it
+            try:
+                stat_rollups.maybe_compact()
+            except Exception as e:
+                print(f"Error compacting statistics rollups: {e}")
+                db.session.rollback()
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"Error flushing spin ledger (attempt {attempt + 1}): {e}")
+                    if attempt == self.retries:
+                        self._spool(batch)
+                        return
+                    self.retried += 1
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+                else:
+                    self.flushed += len(batch)
+                    return
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    def _flush_dropped(self):
+        with self.app.app_context():
+            stat_rollups.flush()
+
+    def _spool(self, batch):
+        """Save a batch that could not be written for ``replay_spool``."""
+        name = f"spins-{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}.jsonl"
+        path = os.path.join(self.spool_dir, name)
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                for row in batch:
+                    f.write(json.dumps(_dump_row(row)) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            print(f"Error spooling {len(batch)} spin ledger records: {e}")
+            self.failed += len(batch)
+            return
+        print(f"Spooled {len(batch)} spin ledger records to {path}")
+        self.spooled += len(batch)
+
+    def spool_files(self):
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(os.path.join(self.spool_dir, name) for name in os.listdir(self.spool_dir)
+                      if name.endswith('.jsonl'))
+
+    def replay_spool(self):
+        """
+        Write spooled batches back, oldest first; returns the records replayed.
+
+        Each file is claimed by renaming it, so several replays can run at
+        once, and removed once its batch is committed. A batch that fails
+        again is put back and the error raised.
+        """
+        replayed = 0
+        for path in self.spool_files():
+            claimed = path + '.replaying'
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed) as f:
+                batch = [_load_row(json.loads(line)) for line in f if line.strip()]
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                os.rename(claimed, path)
+                raise
+            os.remove(claimed)
+            replayed += len(batch)
+        return replayed
+
+    def flush_pending(self):
+        """Synchronously write everything currently queued."""
+        if self._pid != os.getpid():
+            return
+        batch = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is _WAKE:
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        if stat_rollups.pending:
+            self._flush_dropped()
+
+    def shutdown(self, timeout=5.0):
+        """Stop the flusher and write what is left; registered with atexit."""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(_WAKE)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self.flush_pending()
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'queue_capacity': self.max_queue,
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'retried': self.retried,
+            'spooled': self.spooled,
+            'flushes': self.flushes,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+
+ledger = SpinLedger()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spin ledger tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('spool', help="list batches waiting in LEDGER_SPOOL_DIR")
+    commands.add_parser('replay', help="write spooled batches back to the database")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    create_app()
+    if args.command == 'spool':
+        for path in ledger.spool_files():
+            with open(path) as f:
+                print(f"{sum(1 for _ in f):>8,}  {path}")
+    else:
+        print(f"Replayed {ledger.replay_spool():,} spin records")
+
+
+if __name__ == "__main__":
+    main()
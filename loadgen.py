@@ -0,0 +1,404 @@
+"""
+Local load generator: boots the app under gunicorn (or uvicorn for the ASGI
+mode) and drives it with virtual players.
+
+Each player keeps its own cookie session. A player opens the page (which
+creates the wallet), then picks ``/spin``, ``/buy_freespins`` or
+``/statistics`` according to its profile, with think time in between. After
+a while it leaves, and a new session takes its place. The report gives
+throughput and p50/p95/p99/p99.9 latency per route. With several worker
+counts (``--workers 1,2,4``) the same load runs against a fresh server for
+each count, and the scaling curve is printed at the end.
+
+Only the standard library is used: the HTTP client is a minimal asyncio
+HTTP/1.1 client, so the harness runs offline. The target is a throwaway
+SQLite file by default, or any database given with ``--database-url`` (e.g. a
+local PostgreSQL)::
+
+    python loadgen.py --workers 1,2,4 --players 50 --duration 20
+    python loadgen.py --database-url postgresql://localhost/slot --think-scale 0
+    python loadgen.py --url http://127.0.0.1:5000   # an already running server
+    python loadgen.py --server sync,asgi --think-scale 0   # main:app against asgi:app
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Route weights and think time range (seconds) of each player type
+PROFILES = {
+    'casual': {'weights': {'spin': 80, 'statistics': 15, 'buy_freespins': 5}, 'think': (0.5, 2.0)},
+    'autoplay': {'weights': {'spin': 100}, 'think': (0.0, 0.05)},
+    'spectator': {'weights': {'statistics': 90, 'spin': 10}, 'think': (1.0, 3.0)},
+}
+
+# Share of players per profile
+MIXES = {
+    'default': {'casual': 70, 'autoplay': 20, 'spectator': 10},
+    'spin': {'autoplay': 100},
+    'casual': {'casual': 100},
+}
+
+# Actions per session before a player leaves and a new one arrives
+SESSION_LENGTH = (20, 200)
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+BET = 0.2
+
+
+class HTTPClient:
+    """One keep-alive connection with a cookie jar; reconnects when the server closes."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = None
+        self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def request(self, method, path, form=None):
+        """Send one request; returns ``(status, body)``."""
+        return await asyncio.wait_for(self._request(method, path, form), self.timeout)
+
+    async def _request(self, method, path, form):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = urlencode(form).encode() if form is not None else b''
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                   "Connection: keep-alive", f"Content-Length: {len(body)}"]
+        if form is not None:
+            headers.append("Content-Type: application/x-www-form-urlencoded")
+        if self.cookies:
+            headers.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        self._writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        length = None
+        chunked = False
+        close = False
+        while True:
+            line = (await self._reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding' and 'chunked' in value.lower():
+                chunked = True
+            elif name == 'connection' and value.lower() == 'close':
+                close = True
+            elif name == 'set-cookie':
+                for key, morsel in SimpleCookie(value).items():
+                    self.cookies[key] = morsel.value
+
+        if chunked:
+            parts = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                parts.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            data = b''.join(parts)
+        elif length is not None:
+            data = await self._reader.readexactly(length)
+        else:
+            data = await self._reader.read()
+            close = True
+        if close:
+            # gunicorn's sync workers close after every response
+            await self.close()
+        return status, data
+
+
+class Recorder:
+    """Latencies and outcomes per route, ignoring everything before ``started``."""
+
+    def __init__(self, started):
+        self.started = started
+        self.latencies = {}
+        self.errors = {}
+        self.rejected = {}
+
+    def add(self, route, began, elapsed, status=None, error=None):
+        if began < self.started:
+            return
+        if error is not None:
+            self.errors.setdefault(route, {}).setdefault(error, 0)
+            self.errors[route][error] += 1
+            return
+        if status >= 400:
+            # e.g. 'Insufficient credits': answered, but not a served action
+            self.rejected[route] = self.rejected.get(route, 0) + 1
+        self.latencies.setdefault(route, []).append(elapsed)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-p * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def player(client_factory, recorder, profile, rng, deadline, think_scale):
+    routes = list(profile['weights'])
+    weights = list(profile['weights'].values())
+    think_low, think_high = profile['think']
+    actions = {
+        'spin': ('POST', '/spin', {'bet': BET}),
+        'buy_freespins': ('POST', '/buy_freespins', {'bet': BET}),
+        'statistics': ('GET', '/statistics', None),
+    }
+
+    async def call(route, method, path, form):
+        began = time.perf_counter()
+        try:
+            status, _ = await client.request(method, path, form)
+        except asyncio.TimeoutError:
+            recorder.add(route, began, None, error='timeout')
+            await client.close()
+            return False
+        except (OSError, ConnectionError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+            recorder.add(route, began, None, error=type(e).__name__)
+            await client.close()
+            return False
+        recorder.add(route, began, time.perf_counter() - began, status)
+        return True
+
+    while time.perf_counter() < deadline:
+        # A new visitor: fresh cookie jar, and the page creates the wallet
+        client = client_factory()
+        if await call('index', 'GET', '/', None):
+            for _ in range(rng.randint(*SESSION_LENGTH)):
+                if time.perf_counter() >= deadline:
+                    break
+                route = rng.choices(routes, weights)[0]
+                await call(route, *actions[route])
+                if think_scale:
+                    await asyncio.sleep(rng.uniform(think_low, think_high) * think_scale)
+        await client.close()
+
+
+async def drive(host, port, players, duration, warmup, mix, think_scale, seed, timeout, ramp):
+    rng = random.Random(seed)
+    profile_names = list(MIXES[mix])
+    profile_weights = list(MIXES[mix].values())
+    now = time.perf_counter()
+    recorder = Recorder(now + warmup)
+    deadline = now + warmup + duration
+
+    async def start(index):
+        # Stagger arrivals so the first second is not one burst of sessions
+        await asyncio.sleep(ramp * index / max(players, 1))
+        profile = PROFILES[rng.choices(profile_names, profile_weights)[0]]
+        await player(lambda: HTTPClient(host, port, timeout), recorder, profile,
+                     random.Random(rng.random()), deadline, think_scale)
+
+    await asyncio.gather(*(start(i) for i in range(players)))
+    return recorder, duration
+
+
+def summarize(recorder, duration):
+    routes = {}
+    total = 0
+    for route in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = sorted(recorder.latencies.get(route, []))
+        errors = sum(recorder.errors.get(route, {}).values())
+        total += len(latencies)
+        routes[route] = {
+            'requests': len(latencies),
+            'rps': len(latencies) / duration,
+            'rejected': recorder.rejected.get(route, 0),
+            'errors': errors,
+            'error_kinds': recorder.errors.get(route, {}),
+            'latency_ms': {f"p{p:g}": round(percentile(latencies, p) * 1000, 2) if latencies else None
+                           for p in PERCENTILES},
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        }
+    every = sorted(v for values in recorder.latencies.values() for v in values)
+    return {
+        'duration': duration,
+        'requests': total,
+        'rps': total / duration,
+        'errors': sum(r['errors'] for r in routes.values()),
+        'latency_ms': {f"p{p:g}": round(percentile(every, p) * 1000, 2) if every else None
+                       for p in PERCENTILES},
+        'routes': routes,
+    }
+
+
+def format_summary(summary, label):
+    out = [f"=== {label}: {summary['requests']:,} requests, {summary['rps']:,.1f} req/s, "
+           f"{summary['errors']} errors ==="]
+    header = f"{'route':<16}{'req/s':>10}{'rejected':>10}{'errors':>8}"
+    header += ''.join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES) + "   (ms)"
+    out.append(header)
+    for route, stats in summary['routes'].items():
+        line = f"{route:<16}{stats['rps']:>10.1f}{stats['rejected']:>10}{stats['errors']:>8}"
+        line += ''.join(f"{_ms(stats['latency_ms'][f'p{p:g}']):>10}" for p in PERCENTILES)
+        out.append(line)
+    return "\n".join(out)
+
+
+def _ms(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(port, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1.0) as sock:
+                sock.sendall(b"GET /startup HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                if sock.recv(64).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server did not answer on port {port} within {timeout:.0f}s")
+
+
+def boot(workers, database_url, gunicorn_args, log, server='sync'):
+    """
+    Bootstrap the database and start the server; returns ``(process, port)``.
+
+    ``sync`` is ``main:app`` under gunicorn, ``asgi`` is ``asgi:app`` under uvicorn.
+    """
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, 'bootstrap.py'], cwd=ROOT, env=env, check=True,
+                   stdout=log, stderr=subprocess.STDOUT)
+    port = free_port()
+    if server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning', 'asgi:app']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f"127.0.0.1:{port}",
+                   *gunicorn_args, 'main:app']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_until_ready(port, process)
+    except Exception:
+        process.kill()
+        raise
+    return process, port
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the app with simulated players")
+    parser.add_argument('--workers', default='1', help="worker counts, e.g. 1,2,4")
+    parser.add_argument('--server', default='sync',
+                        help="serving modes to run: sync (gunicorn main:app), asgi (uvicorn asgi:app) "
+                             "or both, e.g. sync,asgi")
+    parser.add_argument('--players', type=int, default=50, help="concurrent virtual players")
+    parser.add_argument('--duration', type=float, default=20.0, help="measured seconds per run")
+    parser.add_argument('--warmup', type=float, default=3.0, help="unmeasured seconds before that")
+    parser.add_argument('--ramp', type=float, default=2.0, help="seconds over which players arrive")
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--think-scale', type=float, default=1.0,
+                        help="multiplier for think times; 0 drives the server flat out")
+    parser.add_argument('--timeout', type=float, default=10.0, help="per-request timeout")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', help="default: a fresh SQLite file per run")
+    parser.add_argument('--url', help="drive an already running server instead of booting one")
+    parser.add_argument('--gunicorn-arg', action='append', default=[],
+                        help="extra gunicorn argument (repeatable), e.g. --gunicorn-arg=--threads=4")
+    parser.add_argument('--log', default=os.path.join(tempfile.gettempdir(), 'loadgen-gunicorn.log'))
+    parser.add_argument('--json', help="write the results here")
+    args = parser.parse_args(argv)
+
+    def run(host, port):
+        recorder, duration = asyncio.run(drive(
+            host, port, args.players, args.duration, args.warmup, args.mix, args.think_scale,
+            args.seed, args.timeout, args.ramp))
+        return summarize(recorder, duration)
+
+    results = {'params': {k: v for k, v in vars(args).items() if k not in ('json', 'log')}, 'runs': {}}
+    if args.url:
+        target = urlsplit(args.url)
+        summary = run(target.hostname, target.port or 80)
+        results['runs'][args.url] = summary
+        print(format_summary(summary, args.url))
+    else:
+        servers = args.server.split(',')
+        with open(args.log, 'a', encoding='utf-8') as log:
+            for server in servers:
+                for workers in [int(w) for w in args.workers.split(',')]:
+                    database_url = args.database_url
+                    if database_url is None:
+                        path = os.path.join(tempfile.mkdtemp(prefix='loadgen-'), 'slot.db')
+                        database_url = f"sqlite:///{path}"
+                    process, port = boot(workers, database_url, args.gunicorn_arg, log, server)
+                    try:
+                        summary = run('127.0.0.1', port)
+                    finally:
+                        stop(process)
+                    # Keys stay plain worker counts when only one mode runs
+                    key = f"{server}:{workers}" if len(servers) > 1 else str(workers)
+                    results['runs'][key] = summary
+                    print(format_summary(summary, f"{server}, {workers} worker{'s' if workers > 1 else ''}"))
+                    print()
+
+        if len(results['runs']) > 1:
+            print("=== Scaling ===")
+            print(f"{'run':>8}{'req/s':>12}{'speedup':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+            base_rps = next(iter(results['runs'].values()))['rps']
+            for workers, summary in results['runs'].items():
+                speedup = summary['rps'] / base_rps if base_rps else 0.0
+                print(f"{workers:>8}{summary['rps']:>12.1f}{speedup:>9.2f}x"
+                      f"{_ms(summary['latency_ms']['p50']):>10}{_ms(summary['latency_ms']['p99']):>10}"
+                      f"{summary['errors']:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,14 @@
-from app import app
+from startup import startup_timer
+
+with startup_timer.phase('imports'):
+    from app import create_app
+
+with startup_timer.phase('create_app'):
+    app = create_app()
 
 if __name__ == "__main__":
+    from bootstrap import bootstrap
+
+    # Local runs bootstrap themselves; deployments run bootstrap.py once at build
+    bootstrap(app)
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,576 @@
+"""
+Hot-path instrumentation exported in the Prometheus text format at ``/metrics``.
+
+Counters and histogram buckets are plain Python numbers in the worker, so an
+update costs well under a microsecond and involves no I/O. A background
+thread copies them every ``METRICS_SYNC_INTERVAL`` seconds into a
+memory-mapped file per worker under ``METRICS_DIR``. ``/metrics`` sums the
+files of all workers, so whichever worker answers the scrape reports the
+totals of all of them.
+
+A worker holds an ``flock`` on its file for as long as it lives. When a
+collector can take that lock, the owner has exited, and the collector folds
+the file into ``archive.db``. Totals therefore survive worker restarts and
+stay monotonic, and the number of files stays bounded.
+
+Updates take no lock: CPython does not switch threads inside the ``+=`` of
+an update, and the sync thread only reads.
+
+Phase and request timings are taken for a ``METRICS_SAMPLE_RATE`` fraction
+of requests. Counts and the win distribution are always exact.
+``METRICS_ENABLED=0`` turns everything off.
+"""
+import bisect
+import fcntl
+import json
+import math
+import mmap
+import os
+import atexit
+import random
+import struct
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Blueprint, Response, request
+from flask.sessions import SessionInterface
+
+_USED = struct.Struct('<Q')
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+INITIAL_FILE_SIZE = 64 * 1024
+ARCHIVE_NAME = 'archive.db'
+
+# Seconds; rng/evaluate take microseconds, DB round trips milliseconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Credits
+WIN_BUCKETS = (0, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# Whether the current request was picked for timing
+_sampled = ContextVar('metrics_sampled', default=True)
+
+bp = Blueprint('metrics', __name__)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _key(name, labels, suffix=''):
+    return json.dumps([name, suffix, labels], separators=(',', ':'))
+
+
+def read_values(path):
+    """Entries of a metrics file as ``{key: value}``."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    values = {}
+    if len(data) < _USED.size:
+        return values
+    used = min(_USED.unpack_from(data, 0)[0], len(data))
+    pos = _USED.size
+    while pos + _KEY_LENGTH.size <= used:
+        length = _KEY_LENGTH.unpack_from(data, pos)[0]
+        key_end = pos + _KEY_LENGTH.size + length
+        value_pos = _align(key_end)
+        if value_pos + _VALUE.size > used:
+            break
+        values[data[pos + _KEY_LENGTH.size:key_end].decode('utf-8')] = _VALUE.unpack_from(data, value_pos)[0]
+        pos = value_pos + _VALUE.size
+    return values
+
+
+def write_values(path, values):
+    """Write ``{key: value}`` as a metrics file, atomically."""
+    chunks = []
+    size = _USED.size
+    for key, value in values.items():
+        encoded = key.encode('utf-8')
+        entry = bytearray(_align(_KEY_LENGTH.size + len(encoded)) + _VALUE.size)
+        _KEY_LENGTH.pack_into(entry, 0, len(encoded))
+        entry[_KEY_LENGTH.size:_KEY_LENGTH.size + len(encoded)] = encoded
+        _VALUE.pack_into(entry, len(entry) - _VALUE.size, value)
+        chunks.append(entry)
+        size += len(entry)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_USED.pack(size))
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+class _ProcessFile:
+    """Append-only ``key -> double`` map in a file owned by one process."""
+
+    def __init__(self, path):
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # A collector may have archived and unlinked the file of a dead
+            # process with the same pid while we waited for the lock
+            try:
+                if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        self.path = path
+        self._fd = fd
+        # Totals left behind by an earlier process with this pid; ours are added on top
+        self.base = read_values(path) if os.fstat(fd).st_size else {}
+        size = max(os.fstat(fd).st_size, INITIAL_FILE_SIZE)
+        os.ftruncate(fd, size)
+        self._mm = mmap.mmap(fd, size)
+        self.offsets = {}
+        pos = _USED.size
+        for key in self.base:
+            pos = _align(pos + _KEY_LENGTH.size + len(key.encode('utf-8')))
+            self.offsets[key] = pos
+            pos += _VALUE.size
+        self.used = pos
+        if not self.base:
+            _USED.pack_into(self._mm, 0, self.used)
+
+    def set(self, key, value):
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self._allocate(key)
+        _VALUE.pack_into(self._mm, offset, self.base.get(key, 0.0) + value)
+
+    def _allocate(self, key):
+        encoded = key.encode('utf-8')
+        offset = _align(self.used + _KEY_LENGTH.size + len(encoded))
+        end = offset + _VALUE.size
+        if end > len(self._mm):
+            new_size = len(self._mm) * 2
+            while new_size < end:
+                new_size *= 2
+            os.ftruncate(self._fd, new_size)
+            self._mm.resize(new_size)
+        _KEY_LENGTH.pack_into(self._mm, self.used, len(encoded))
+        self._mm[self.used + _KEY_LENGTH.size:self.used + _KEY_LENGTH.size + len(encoded)] = encoded
+        _VALUE.pack_into(self._mm, offset, 0.0)
+        # Publish the entry only once it is complete, so readers never see half of it
+        _USED.pack_into(self._mm, 0, end)
+        self.used = end
+        self.offsets[key] = offset
+        return offset
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self.registry.register(_CounterChild(
+                self.registry, _key(self.name, list(zip(self.labelnames, map(str, values))))))
+        return child
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _CounterChild:
+    __slots__ = ('registry', 'key', 'value')
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        if self.registry.enabled:
+            self.value += amount
+
+    def reset(self):
+        self.value = 0.0
+
+    def samples(self):
+        return [(self.key, self.value)]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            labels = list(zip(self.labelnames, map(str, values)))
+            child = self._children[values] = self.registry.register(
+                _HistogramChild(self.registry, self.name, labels, self.buckets))
+        return child
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class _HistogramChild:
+    """Buckets are stored per bucket (not cumulative); the count is their sum."""
+
+    __slots__ = ('registry', 'bounds', 'bucket_keys', 'sum_key', 'counts', 'total')
+
+    def __init__(self, registry, name, labels, buckets):
+        self.registry = registry
+        self.bounds = buckets
+        self.bucket_keys = [_key(name, labels, f"bucket:{_format(bound)}") for bound in buckets]
+        self.bucket_keys.append(_key(name, labels, 'bucket:+Inf'))
+        self.sum_key = _key(name, labels, 'sum')
+        self.reset()
+
+    def observe(self, value):
+        if self.registry.enabled:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.total += value
+
+    def reset(self):
+        self.counts = [0] * len(self.bucket_keys)
+        self.total = 0.0
+
+    def samples(self):
+        return list(zip(self.bucket_keys, self.counts)) + [(self.sum_key, self.total)]
+
+    def time(self):
+        return _Timer(self)
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else f"{float(value):.1f}"
+
+
+class Metrics:
+    """Registry of the app's counters and histograms, one file per worker."""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.sample_rate = 1.0
+        self.sync_interval = 1.0
+        self.directory = os.path.join(tempfile.gettempdir(), 'slot-metrics')
+        self.families = []
+        self.children = []
+        self.lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._thread = None
+        self._stopping = threading.Event()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+        self.requests = self.counter(
+            'slot_http_requests_total', 'HTTP responses by route, method and status.',
+            ('route', 'method', 'status'))
+        self.request_duration = self.histogram(
+            'slot_http_request_duration_seconds', 'Request handling time (sampled).', ('route',))
+        self.phase_duration = self.histogram(
+            'slot_phase_duration_seconds', 'Time spent in a hot-path phase (sampled).', ('phase',))
+        self.errors = self.counter(
+            'slot_errors_total', 'Requests that failed with an exception, by route.', ('route',))
+        self.spins = self.counter(
+            'slot_spins_total', 'Resolved spins; rate() gives spins per second.', ('route',))
+        self.win_amount = self.histogram(
+            'slot_win_amount_credits', 'Winnings per spin in credits.', (), WIN_BUCKETS)
+        self._wins = self.win_amount.labels()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self.sample_rate = app.config.get('METRICS_SAMPLE_RATE', self.sample_rate)
+        self.sync_interval = app.config.get('METRICS_SYNC_INTERVAL', self.sync_interval)
+        self.directory = app.config.get('METRICS_DIR') or self.directory
+        app.register_blueprint(bp)
+        if not self.enabled:
+            return
+        atexit.register(self.shutdown)
+        app.session_interface = _TimedSessionInterface(app.session_interface, self)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def counter(self, name, documentation, labelnames=()):
+        family = Counter(self, name, documentation, labelnames)
+        self.families.append(family)
+        return family
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        family = Histogram(self, name, documentation, labelnames, buckets)
+        self.families.append(family)
+        return family
+
+    def register(self, child):
+        with self.lock:
+            self.children.append(child)
+        return child
+
+    # Recording
+
+    def _after_fork(self):
+        # What the parent counted stays in the parent's file; the child
+        # starts from zero, writes its own file and does not keep the
+        # parent's locked
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._pid = None
+        self._thread = None
+        self.lock = threading.Lock()
+        for child in self.children:
+            child.reset()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='metrics-sync', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stopping.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Error syncing metrics: {e}")
+
+    def sync(self):
+        """Copy this worker's totals into its file."""
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = _ProcessFile(os.path.join(self.directory, f"worker-{os.getpid()}.db"))
+        # Copy under the lock, write outside it
+        with self.lock:
+            samples = [sample for child in self.children for sample in child.samples()]
+        for key, value in samples:
+            self._file.set(key, value)
+
+    def shutdown(self):
+        self._stopping.set()
+        if self._pid == os.getpid() and self.children:
+            self.sync()
+
+    def phase(self, name):
+        """Context manager timing ``name`` when the current request is sampled."""
+        if not self.enabled or not _sampled.get():
+            return _NULL_TIMER
+        return _Timer(self.phase_duration.labels(name))
+
+    def count_spin(self, route, winnings):
+        self.spins.labels(route).inc()
+        self._wins.observe(winnings)
+
+    def count_error(self, route=None):
+        self.errors.labels(route or _route()).inc()
+
+    def start_request(self):
+        """Make the sampling decision for a request; returns its start time when sampled."""
+        self._ensure_started()
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        _sampled.set(sampled)
+        return time.perf_counter() if sampled else None
+
+    def end_request(self, route, method, status, started=None):
+        """Count a finished request served outside Flask (see ``asgi.py``)."""
+        self.requests.labels(route, method, status).inc()
+        if status >= 500:
+            self.errors.labels(route).inc()
+        if started is not None:
+            self.request_duration.labels(route).observe(time.perf_counter() - started)
+
+    def _begin_request(self):
+        # Called when the session is opened, the first step of a request
+        request.environ['metrics.started'] = self.start_request()
+
+    def _after_request(self, response):
+        route = _route()
+        self.requests.labels(route, request.method, response.status_code).inc()
+        if response.status_code >= 500:
+            self.errors.labels(route).inc()
+        return response
+
+    def _teardown_request(self, exc=None):
+        # Runs after the session cookie was written, so it is part of the time
+        started = request.environ.pop('metrics.started', None)
+        if started is not None:
+            self.request_duration.labels(_route()).observe(time.perf_counter() - started)
+
+    # Collection
+
+    def collect(self):
+        """Sum the files of all workers, archiving those of exited ones."""
+        # Include what this worker counted since its last sync
+        self.sync()
+        os.makedirs(self.directory, exist_ok=True)
+        lock_fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            self._archive_exited()
+            totals = {}
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.db'):
+                    continue
+                try:
+                    values = read_values(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    continue
+                for key, value in values.items():
+                    totals[key] = totals.get(key, 0.0) + value
+            return totals
+        finally:
+            os.close(lock_fd)
+
+    def _archive_exited(self):
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        for filename in os.listdir(self.directory):
+            if not filename.startswith('worker-') or not filename.endswith('.db'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Owner still running
+                    continue
+                archive = read_values(archive_path) if os.path.exists(archive_path) else {}
+                for key, value in read_values(path).items():
+                    archive[key] = archive.get(key, 0.0) + value
+                write_values(archive_path, archive)
+                os.unlink(path)
+            finally:
+                os.close(fd)
+
+    def render(self):
+        """All families in the Prometheus text exposition format."""
+        samples = {}
+        for key, value in self.collect().items():
+            name, suffix, labels = json.loads(key)
+            samples.setdefault(name, {}).setdefault(tuple(map(tuple, labels)), {})[suffix] = value
+
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for labels, values in sorted(samples.get(family.name, {}).items()):
+                if family.type == 'counter':
+                    lines.append(f"{family.name}{_labels(labels)} {_number(values.get('', 0.0))}")
+                    continue
+                cumulative = 0.0
+                for bound in family.buckets + (math.inf,):
+                    cumulative += values.get(f"bucket:{_format(bound)}", 0.0)
+                    lines.append(f"{family.name}_bucket{_labels(labels + (('le', _format(bound)),))} "
+                                 f"{_number(cumulative)}")
+                lines.append(f"{family.name}_sum{_labels(labels)} {_number(values.get('sum', 0.0))}")
+                lines.append(f"{family.name}_count{_labels(labels)} {_number(cumulative)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _route():
+    rule = request.url_rule
+    # Unmatched paths share one label so 404 probes cannot add series
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class _TimedSessionInterface(SessionInterface):
+    """Times loading (verifying) and saving (signing) the session cookie."""
+
+    def __init__(self, inner, registry):
+        self.inner = inner
+        self.registry = registry
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        self.registry._begin_request()
+        with self.registry.phase('session_load'):
+            return self.inner.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with self.registry.phase('session_save'):
+            return self.inner.save_session(app, session, response)
+
+    def is_null_session(self, obj):
+        return self.inner.is_null_session(obj)
+
+    def make_null_session(self, app):
+        return self.inner.make_null_session(app)
+
+
+metrics = Metrics()
+
+
+@bp.route('/metrics')
+def get_metrics():
+    if not metrics.enabled:
+        return Response("metrics disabled\n", status=404, mimetype='text/plain')
+    response = Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    response.cache_control.no_store = True
+    return response
@@ -1,14 +1,19 @@
+import json
 from datetime import datetime
 from database import db
+import spin_codec
 
 class SpinResult(db.Model):
+    # Ledger of spins written before spin_history partitioning; new spins go
+    # to the monthly spin_results_YYYYMM tables
     __tablename__ = 'spin_results'
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     bet_amount = db.Column(db.Float, nullable=False)
     win_amount = db.Column(db.Float, nullable=False)
-    result_matrix = db.Column(db.String(255), nullable=False)
+    result_codes = db.Column(db.LargeBinary(8), nullable=True)  # spin_codec-packed grid
+    result_matrix = db.Column(db.String(255), nullable=True)  # legacy JSON grid, see spin_codec
     bonus_spins_awarded = db.Column(db.Integer, default=0)
     is_bonus_spin = db.Column(db.Boolean, default=False)
     wild_positions = db.Column(db.String(255), nullable=True)  # JSON string storing wild positions
@@ -16,6 +21,12 @@ class SpinResult(db.Model):
     winning_lines = db.Column(db.Integer, default=0)  # Number of winning lines in this spin
     symbol_counts = db.Column(db.String(255), nullable=True)  # JSON string storing symbol frequencies
 
+    @property
+    def result(self):
+        if self.result_codes is not None:
+            return spin_codec.decode(self.result_codes)
+        return json.loads(self.result_matrix)
+
 class Statistics(db.Model):
     __tablename__ = 'statistics'
     
@@ -27,3 +38,73 @@ class Statistics(db.Model):
     total_bet = db.Column(db.Float, default=0)
     total_won = db.Column(db.Float, default=0)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+
+class _RollupBucket:
+    # Spins recorded with a timestamp in [bucket, bucket + grain), see rollups.py
+    bucket = db.Column(db.DateTime, primary_key=True)
+    spins = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    bonus_spins = db.Column(db.Integer, nullable=False, default=0)
+    total_bet = db.Column(db.Float, nullable=False, default=0)
+    total_won = db.Column(db.Float, nullable=False, default=0)
+    max_win = db.Column(db.Float, nullable=False, default=0)
+
+class MinuteRollup(_RollupBucket, db.Model):
+    __tablename__ = 'stat_rollups_minute'
+
+class HourRollup(_RollupBucket, db.Model):
+    __tablename__ = 'stat_rollups_hour'
+
+class DayRollup(_RollupBucket, db.Model):
+    __tablename__ = 'stat_rollups_day'
+
+class Wallet(db.Model):
+    __tablename__ = 'wallets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    credits = db.Column(db.Float, nullable=False, default=0)
+    bonus_spins = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Derived spins (provenance.py): counters handed out so far and the current seed
+    spin_counter = db.Column(db.BigInteger, nullable=False, default=0)
+    seed_id = db.Column(db.Integer, nullable=True)
+
+class WalletSeed(db.Model):
+    # Used for the wallet's counters from first_counter until the next seed's
+    __tablename__ = 'wallet_seeds'
+
+    id = db.Column(db.Integer, primary_key=True)
+    wallet_id = db.Column(db.Integer, nullable=False, index=True)
+    server_seed = db.Column(db.LargeBinary(32), nullable=False)
+    client_seed = db.Column(db.String(64), nullable=False, default='')
+    first_counter = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revealed_at = db.Column(db.DateTime, nullable=True)
+
+class GameVersion(db.Model):
+    # Definitions that derived spins were played with, by games.Game.version
+    __tablename__ = 'game_versions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    digest = db.Column(db.String(16), nullable=False, unique=True)
+    definition = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RTPReference(db.Model):
+    # Reference figures of rtp_monitor.py per game definition (games.Game.version),
+    # computed by bootstrap so that workers only read them
+    __tablename__ = 'rtp_references'
+    __table_args__ = (db.UniqueConstraint('digest', 'reference_spins'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(16), nullable=False)
+    # RTP_MONITOR_REFERENCE_SPINS when it was computed
+    reference_spins = db.Column(db.Integer, nullable=False)
+    # Spins simulated; NULL when rtp.py solved the game exactly
+    spins = db.Column(db.Integer, nullable=True)
+    rtp = db.Column(db.Float, nullable=False)
+    hit_frequency = db.Column(db.Float, nullable=False)
+    std_dev = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
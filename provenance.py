@@ -0,0 +1,647 @@
+"""
+Seed-and-counter spin provenance.
+
+With ``SPIN_PROVENANCE`` on, a spin's grid is not drawn from the shared
+generator but derived from the player's wallet. Every wallet has a secret
+server seed (``wallet_seeds``) and a spin counter (``wallets.spin_counter``),
+and spin ``n`` is drawn from the keyed stream::
+
+    HMAC-SHA256(server_seed, f"{client_seed}:{game_version}:{n}:{block}")
+
+for ``block`` = 0, 1, ..., read as little-endian 32-bit words by the rejection
+sampling of ``rng.SecureRandom`` through the game's ``SpinEngine`` (its bonus
+reels for free spins). ``game_version`` is ``games.Game.version``, a digest
+of the definition; every definition played is kept in ``game_versions``.
+
+The ledger then stores in ``result_codes`` only a reference (spin codec
+version 15: game version id and counter) next to the bet and the win, and
+``replay`` regenerates grids when they are needed: ``/history``, ``/replay``
+and audits, which re-evaluate every base-game win against the ledger.
+
+Counters are reserved in the transaction of the wallet update that settles
+the spins, so each is used at most once. A free-spin round does not know
+its length up front: it locks the wallet's next counter, plays from there
+and advances the counter by the spins it played before that update. ``/provenance`` shows the SHA-256
+of the current server seed; ``POST /provenance/rotate`` reveals the seed and
+starts a new one (optionally with a client seed chosen by the player), after
+which every spin played with the old seed can be checked offline::
+
+    python provenance.py verify --server-seed HEX --client-seed S --game tropical --counter N
+    python provenance.py audit [--wallet ID] [--month 202610] [--limit N] [--workers N]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import multiprocessing
+import os
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from sqlalchemy import inspect, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+import spin_codec
+from database import db
+from rng import SecureRandom
+
+_BLOCK = struct.Struct('<8I')
+
+# Wallet seeds kept per worker
+SEED_CACHE_SIZE = 4096
+
+MAX_CLIENT_SEED = 64
+
+
+def derivation_message(client_seed, game_version, counter):
+    return f"{client_seed}:{game_version}:{counter}".encode('utf-8')
+
+
+def seed_hash(server_seed):
+    return hashlib.sha256(server_seed).hexdigest()
+
+
+class DerivedRandom(SecureRandom):
+    """The words of one spin's HMAC stream, sampled like ``SecureRandom``."""
+
+    def __init__(self, mac, message):
+        # ``mac`` is an HMAC already keyed with the server seed; it is copied per block
+        self._mac = mac
+        self._message = message + b':'
+        self._words = []
+        self._pos = 0
+        self._block = 0
+
+    def _take(self, k):
+        words, pos = self._words, self._pos
+        while len(words) - pos < k:
+            mac = self._mac.copy()
+            mac.update(self._message + str(self._block).encode('ascii'))
+            self._block += 1
+            words = words[pos:] + list(_BLOCK.unpack(mac.digest()))
+            pos = 0
+        self._words = words
+        self._pos = pos + k
+        return words[pos:pos + k]
+
+
+def keyed_mac(server_seed):
+    return hmac.new(server_seed, digestmod=hashlib.sha256)
+
+
+def derive_grid(game, server_seed, client_seed, counter, bonus=False):
+    """The grid of spin ``counter``, from a revealed seed; no database needed."""
+    engine = game.bonus_engine if bonus else game.engine
+    return engine.spin(DerivedRandom(keyed_mac(server_seed),
+                                     derivation_message(client_seed, game.version, counter)))
+
+
+class Seed:
+    __slots__ = ('id', 'mac', 'client_seed', 'first_counter')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.mac = keyed_mac(row.server_seed)
+        self.client_seed = row.client_seed
+        self.first_counter = row.first_counter
+
+
+class SpinDraws:
+    """Generators and ledger references for a block of reserved counters."""
+
+    __slots__ = ('seed', 'first', 'version_id', 'game_version')
+
+    def __init__(self, seed, first, version_id, game_version):
+        self.seed = seed
+        self.first = first
+        self.version_id = version_id
+        self.game_version = game_version
+
+    def counter(self, i):
+        return self.first + i
+
+    def rng(self, i):
+        return DerivedRandom(self.seed.mac, derivation_message(self.seed.client_seed, self.game_version,
+                                                               self.first + i))
+
+    def reference(self, i):
+        return spin_codec.encode_derived(self.version_id, self.first + i)
+
+
+class SpinProvenance:
+    """Per-wallet seeds and counters, and the replay of derived spins."""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._versions = {}
+        self._games = {}
+        self._seeds = OrderedDict()
+        self._wallet_seeds = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SPIN_PROVENANCE', self.enabled)
+
+    # Schema and game versions
+
+    def prepare_schema(self, engine):
+        """Add the counter and seed columns to a ``wallets`` table created before them."""
+        from models import Wallet
+
+        table = Wallet.__tablename__
+        columns = {column['name'] for column in inspect(engine).get_columns(table)}
+        try:
+            with engine.begin() as conn:
+                if 'spin_counter' not in columns:
+                    column_type = Wallet.__table__.c.spin_counter.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN spin_counter {column_type} "
+                                      f"NOT NULL DEFAULT 0"))
+                if 'seed_id' not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN seed_id INTEGER"))
+        except Exception as e:
+            # Usually another worker applied the same change first
+            print(f"Provenance schema upgrade skipped: {e}")
+
+    def register_games(self):
+        """Record the definition of every loaded game; returns ``{name: version id}``."""
+        from games import game_registry
+
+        return {game.name: self.version_id(game) for game in game_registry}
+
+    def _cache(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            while len(cache) > SEED_CACHE_SIZE:
+                cache.popitem(last=False)
+        return value
+
+    def version_id(self, game):
+        """Id of the game's current definition in ``game_versions``, added on first use."""
+        version_id = self._versions.get(game.version)
+        if version_id is not None:
+            return version_id
+        from models import GameVersion
+
+        version_id = db.session.execute(
+            select(GameVersion.id).where(GameVersion.digest == game.version)).scalar()
+        if version_id is None:
+            db.session.add(GameVersion(name=game.name, digest=game.version,
+                                       definition=json.dumps(game.definition)))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Registered by another worker in the meantime
+                db.session.rollback()
+            version_id = db.session.execute(
+                select(GameVersion.id).where(GameVersion.digest == game.version)).scalar_one()
+        if version_id > spin_codec.MAX_GAME_VERSION:
+            raise ValueError(f"Too many game versions for the spin codec ({version_id})")
+        self._versions[game.version] = version_id
+        return version_id
+
+    async def version_id_async(self, session, game):
+        """``version_id`` on an ``AsyncSession``."""
+        version_id = self._versions.get(game.version)
+        if version_id is not None:
+            return version_id
+        from models import GameVersion
+
+        query = select(GameVersion.id).where(GameVersion.digest == game.version)
+        version_id = (await session.execute(query)).scalar()
+        if version_id is None:
+            session.add(GameVersion(name=game.name, digest=game.version,
+                                    definition=json.dumps(game.definition)))
+            try:
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+            version_id = (await session.execute(query)).scalar_one()
+        self._versions[game.version] = version_id
+        return version_id
+
+    def game_version(self, version_id):
+        """The ``Game`` a derived spin was played with, rebuilt from its stored definition."""
+        game = self._games.get(version_id)
+        if game is None:
+            from games import Game
+            from models import GameVersion
+
+            row = db.session.get(GameVersion, version_id)
+            if row is None:
+                raise KeyError(f"Unknown game version {version_id}")
+            game = self._games[version_id] = Game(json.loads(row.definition),
+                                                  source=f"game version {row.digest}")
+        return game
+
+    # Reserving counters
+
+    def _reserve_statement(self, wallet_id, count):
+        from models import Wallet
+
+        return (update(Wallet).where(Wallet.id == wallet_id)
+                .values(spin_counter=Wallet.spin_counter + count)
+                .returning(Wallet.spin_counter, Wallet.seed_id))
+
+    def _new_seed(self, wallet_id, first_counter=0, client_seed=''):
+        from models import WalletSeed
+
+        return WalletSeed(wallet_id=wallet_id, server_seed=secrets.token_bytes(32),
+                          client_seed=client_seed, first_counter=first_counter)
+
+    def _use_seed_statement(self, wallet_id, seed_id):
+        from models import Wallet
+
+        return update(Wallet).where(Wallet.id == wallet_id).values(seed_id=seed_id)
+
+    def _seed(self, seed_id):
+        seed = self._seeds.get(seed_id)
+        if seed is None:
+            from models import WalletSeed
+
+            seed = self._cache(self._seeds, seed_id, Seed(db.session.get(WalletSeed, seed_id)))
+        return seed
+
+    def reserve(self, wallet_id, game, count=1):
+        """
+        Reserve ``count`` consecutive counters of a wallet for spins of ``game``.
+
+        Returns ``SpinDraws``, or None when provenance is off or the wallet
+        does not exist. The transaction is left open: the wallet update that
+        settles the spins commits the reservation with it. ``count=0`` locks
+        the wallet row and starts the draws at its next counter, for spins
+        handed out afterwards with ``advance``.
+        """
+        if not self.enabled or wallet_id is None:
+            return None
+        version_id = self.version_id(game)
+        row = db.session.execute(self._reserve_statement(wallet_id, count)).first()
+        if row is None:
+            return None
+        seed_id = row.seed_id
+        if seed_id is None:
+            # The wallet's first seed covers every counter from the start; the
+            # row is locked by the reservation, so no other request races us
+            seed = self._new_seed(wallet_id)
+            db.session.add(seed)
+            db.session.flush()
+            db.session.execute(self._use_seed_statement(wallet_id, seed.id))
+            seed_id = seed.id
+        return SpinDraws(self._seed(seed_id), row.spin_counter - count, version_id, game.version)
+
+    def advance(self, wallet_id, draws, count):
+        """Hand out ``count`` counters from ``draws`` (reserved with ``count=0``)."""
+        if draws is not None and count:
+            db.session.execute(self._reserve_statement(wallet_id, count))
+
+    async def reserve_async(self, session, wallet_id, game, count=1):
+        """``reserve`` on an ``AsyncSession``."""
+        if not self.enabled or wallet_id is None:
+            return None
+        version_id = await self.version_id_async(session, game)
+        row = (await session.execute(self._reserve_statement(wallet_id, count))).first()
+        if row is None:
+            return None
+        seed_id = row.seed_id
+        if seed_id is None:
+            new_seed = self._new_seed(wallet_id)
+            session.add(new_seed)
+            await session.flush()
+            await session.execute(self._use_seed_statement(wallet_id, new_seed.id))
+            seed_id = new_seed.id
+        seed = self._seeds.get(seed_id)
+        if seed is None:
+            from models import WalletSeed
+
+            seed = self._cache(self._seeds, seed_id, Seed(await session.get(WalletSeed, seed_id)))
+        return SpinDraws(seed, row.spin_counter - count, version_id, game.version)
+
+    async def advance_async(self, session, wallet_id, draws, count):
+        """``advance`` on an ``AsyncSession``."""
+        if draws is not None and count:
+            await session.execute(self._reserve_statement(wallet_id, count))
+
+    # Player-facing seeds
+
+    def current(self, wallet_id):
+        """Commitment to the wallet's current seed, or None for an unknown wallet."""
+        from models import Wallet, WalletSeed
+
+        wallet = db.session.get(Wallet, wallet_id) if wallet_id is not None else None
+        if wallet is None:
+            return None
+        seed = db.session.get(WalletSeed, wallet.seed_id) if wallet.seed_id is not None else None
+        return {
+            'server_seed_hash': seed_hash(seed.server_seed) if seed else None,
+            'client_seed': seed.client_seed if seed else '',
+            'first_counter': seed.first_counter if seed else 0,
+            'next_counter': wallet.spin_counter,
+        }
+
+    def rotate(self, wallet_id, client_seed=''):
+        """
+        Reveal the wallet's seed and start a new one from its next counter.
+
+        Returns ``{'revealed': ..., 'current': ...}``; ValueError for an
+        unknown wallet or an oversized client seed.
+        """
+        from models import Wallet, WalletSeed
+
+        if len(client_seed) > MAX_CLIENT_SEED:
+            raise ValueError(f"Client seed longer than {MAX_CLIENT_SEED} characters")
+        # Locks the wallet row, so no counter is reserved under the old seed meanwhile
+        row = db.session.execute(
+            update(Wallet).where(Wallet.id == wallet_id)
+            .values(spin_counter=Wallet.spin_counter)
+            .returning(Wallet.spin_counter, Wallet.seed_id)).first()
+        if row is None:
+            db.session.rollback()
+            raise ValueError("Unknown wallet")
+        seed = self._new_seed(wallet_id, row.spin_counter, client_seed)
+        db.session.add(seed)
+        db.session.flush()
+        db.session.execute(self._use_seed_statement(wallet_id, seed.id))
+        revealed = None
+        if row.seed_id is not None:
+            old = db.session.get(WalletSeed, row.seed_id)
+            old.revealed_at = datetime.utcnow()
+            revealed = {
+                'server_seed': old.server_seed.hex(),
+                'server_seed_hash': seed_hash(old.server_seed),
+                'client_seed': old.client_seed,
+                'first_counter': old.first_counter,
+                'last_counter': row.spin_counter - 1,
+            }
+        current = {
+            'server_seed_hash': seed_hash(seed.server_seed),
+            'client_seed': seed.client_seed,
+            'first_counter': seed.first_counter,
+            'next_counter': row.spin_counter,
+        }
+        db.session.commit()
+        with self._lock:
+            self._wallet_seeds.pop(wallet_id, None)
+        return {'revealed': revealed, 'current': current}
+
+    # Replay
+
+    def seed_for(self, wallet_id, counter):
+        """The seed a wallet's spin ``counter`` was derived from."""
+        from models import Wallet, WalletSeed
+
+        entry = self._wallet_seeds.get(wallet_id)
+        # A counter past the ones handed out when the list was loaded may
+        # belong to a seed rotated in since
+        if entry is None or counter >= entry[0]:
+            spin_counter = db.session.execute(
+                select(Wallet.spin_counter).where(Wallet.id == wallet_id)).scalar()
+            seeds = db.session.execute(
+                select(WalletSeed.first_counter, WalletSeed.id)
+                .where(WalletSeed.wallet_id == wallet_id)
+                .order_by(WalletSeed.first_counter)).all()
+            entry = self._cache(self._wallet_seeds, wallet_id, (spin_counter or 0, seeds))
+        seed_id = None
+        for first_counter, candidate in entry[1]:
+            if first_counter > counter:
+                break
+            seed_id = candidate
+        if seed_id is None or counter >= entry[0]:
+            raise KeyError(f"Wallet {wallet_id} has no spin {counter}")
+        return self._seed(seed_id)
+
+    def _derive_codes(self, wallet_id, blob, is_bonus_spin):
+        """``(game, grid of symbol codes)`` of a derived ledger row."""
+        version_id, counter = spin_codec.decode_derived(blob)
+        game = self.game_version(version_id)
+        seed = self.seed_for(wallet_id, counter)
+        engine = game.bonus_engine if is_bonus_spin else game.engine
+        return game, engine.spin_codes(DerivedRandom(seed.mac, derivation_message(seed.client_seed, game.version,
+                                                                                   counter)))
+
+    def regenerate(self, wallet_id, blob, is_bonus_spin=False):
+        """The grid of one ledger row (stored or derived) as symbol names."""
+        if not spin_codec.is_derived(blob):
+            return spin_codec.decode(blob)
+        game, grid = self._derive_codes(wallet_id, blob, is_bonus_spin)
+        symbols = game.symbols
+        return [[symbols[code] for code in reel] for reel in grid]
+
+    def replay(self, rows):
+        """Grids of ledger rows (with ``wallet_id``, ``result_codes``, ``is_bonus_spin``)."""
+        return [self.regenerate(row.wallet_id, row.result_codes, row.is_bonus_spin) for row in rows]
+
+    def replay_counter(self, wallet_id, counter, game_version=None, bonus=False):
+        """
+        Regenerate a wallet's spin from its counter (``/replay``).
+
+        ``game_version`` is a ``Game.version`` digest (default: the default
+        game as loaded now). Only counters already handed out can be replayed.
+        """
+        from games import game_registry
+        from models import GameVersion
+
+        if game_version is None:
+            game_version = game_registry.get().version
+        version_id = self._versions.get(game_version)
+        if version_id is None:
+            version_id = db.session.execute(
+                select(GameVersion.id).where(GameVersion.digest == game_version)).scalar()
+            if version_id is None:
+                raise KeyError(f"Unknown game version {game_version}")
+        game = self.game_version(version_id)
+        seed = self.seed_for(wallet_id, counter)
+        if bonus and game.bonus is None:
+            raise KeyError(f"{game.name} has no free spins")
+        engine = game.bonus_engine if bonus else game.engine
+        return {
+            'counter': counter,
+            'game': game.name,
+            'game_version': game.version,
+            'bonus': bonus,
+            'client_seed': seed.client_seed,
+            'result': engine.spin(DerivedRandom(seed.mac, derivation_message(seed.client_seed, game.version,
+                                                                             counter))),
+        }
+
+    def audit(self, wallet_id=None, month=None, limit=None, workers=None, batch_size=10000):
+        """
+        Regenerate derived spins from the ledger and re-evaluate their wins.
+
+        Every win is compared with ``win_amount``. Free spins are replayed
+        round by round in counter order, since a spin's multiplier follows
+        from the wins before it in the round. The work is split by partition
+        and by ``wallet_id % workers`` across ``workers`` processes (default:
+        all cores); ``limit`` is shared evenly between those parts. Returns
+        counts of ``spins``, ``derived``, ``checked`` and ``mismatches``
+        (plus ``spins_per_sec``).
+        """
+        from spin_history import spin_history
+
+        months = [month] if month else spin_history.months()
+        workers = workers or os.cpu_count() or 1
+        shards = 1 if wallet_id is not None else workers
+        tasks = [(partition_month, wallet_id, shard, shards) for partition_month in months
+                 for shard in range(shards)]
+        share = math.ceil(limit / len(tasks)) if limit is not None and tasks else None
+        tasks = [task + (share, batch_size) for task in tasks]
+
+        started = time.perf_counter()
+        if workers == 1 or len(tasks) < 2:
+            results = [self._audit_part(*task) for task in tasks]
+        else:
+            # Forked workers share this app and open their own connections
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context,
+                                     initializer=_init_audit_worker,
+                                     initargs=(current_app._get_current_object(),)) as pool:
+                results = list(pool.map(_audit_part, tasks))
+        counts = {'spins': 0, 'derived': 0, 'checked': 0, 'mismatches': 0}
+        for part in results:
+            for key, value in part.items():
+                counts[key] += value
+        elapsed = time.perf_counter() - started
+        counts['spins_per_sec'] = round(counts['derived'] / elapsed) if elapsed else 0
+        return counts
+
+    def _audit_part(self, partition_month, wallet_id, shard, shards, limit, batch_size):
+        """
+        Audit the rows of one partition for one wallet or ``wallet_id % shards
+        == shard``; shard 0 also takes the rows without a wallet.
+        """
+        from spin_history import partition_name, spin_history
+
+        table = spin_history._table(partition_name(partition_month))
+        query = select(table.c.id, table.c.timestamp, table.c.wallet_id, table.c.bet_amount,
+                       table.c.win_amount, table.c.result_codes, table.c.is_bonus_spin
+                       ).order_by(table.c.wallet_id, table.c.id)
+        if wallet_id is not None:
+            query = query.where(table.c.wallet_id == wallet_id)
+        elif shards > 1:
+            in_shard = table.c.wallet_id % shards == shard
+            query = query.where(or_(in_shard, table.c.wallet_id.is_(None)) if shard == 0 else in_shard)
+        counts = {'spins': 0, 'derived': 0, 'checked': 0, 'mismatches': 0}
+        # A round's free spins are recorded with one timestamp; they are
+        # replayed once all of the wallet's rows have been read
+        rounds = {}
+        current_wallet = None
+        result = db.session.execute(query.execution_options(yield_per=batch_size))
+        for row in result:
+            if limit is not None and counts['spins'] >= limit:
+                break
+            if row.wallet_id != current_wallet:
+                for round_rows in rounds.values():
+                    self._audit_round(counts, table, round_rows)
+                rounds = {}
+                current_wallet = row.wallet_id
+            counts['spins'] += 1
+            if not spin_codec.is_derived(row.result_codes):
+                continue
+            counts['derived'] += 1
+            if row.is_bonus_spin:
+                rounds.setdefault(row.timestamp, []).append(row)
+                continue
+            game, grid = self._derive_codes(row.wallet_id, row.result_codes, False)
+            winnings = 0
+            for line_win in game.wins_codes(grid, row.bet_amount):
+                if line_win:
+                    winnings += line_win
+            self._check_win(counts, table, row, winnings)
+        result.close()
+        for round_rows in rounds.values():
+            self._audit_round(counts, table, round_rows)
+        return counts
+
+    def _audit_round(self, counts, table, rows):
+        """Replay the free spins of one round in counter order, carrying its multiplier."""
+        from app import MIN_BET
+
+        rows = sorted(rows, key=lambda row: spin_codec.decode_derived(row.result_codes)[1])
+        game = self.game_version(spin_codec.decode_derived(rows[0].result_codes)[0])
+        bonus = game.bonus
+        # A bought round books its price as the first spin's bet; banked
+        # spins play at the minimum bet
+        bet = rows[0].bet_amount / bonus['cost'] if rows[0].bet_amount else MIN_BET
+        multiplier = bonus['multiplier_start']
+        for row in rows:
+            game, grid = self._derive_codes(row.wallet_id, row.result_codes, True)
+            winnings = 0
+            for line_win in game.wins_codes(grid, bet):
+                if line_win:
+                    winnings += line_win
+            winnings *= multiplier
+            self._check_win(counts, table, row, winnings)
+            if winnings and multiplier < bonus['multiplier_max']:
+                multiplier = min(multiplier + bonus['multiplier_step'], bonus['multiplier_max'])
+
+    def _check_win(self, counts, table, row, winnings):
+        counts['checked'] += 1
+        if abs(winnings - row.win_amount) > 1e-9 * max(1.0, abs(winnings)):
+            counts['mismatches'] += 1
+            print(f"Mismatch in {table.name} row {row.id}: ledger {row.win_amount}, replay {winnings}")
+
+
+def _init_audit_worker(app):
+    # Forked: the parent's pooled connections must not be shared
+    app.app_context().push()
+    db.engine.dispose(close=False)
+
+
+def _audit_part(task):
+    return provenance._audit_part(*task)
+
+
+provenance = SpinProvenance()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Derived spin verification and audits")
+    commands = parser.add_subparsers(dest='command', required=True)
+    verify = commands.add_parser('verify', help="regenerate a spin from a revealed seed (no database)")
+    verify.add_argument('--server-seed', required=True, help="revealed server seed (hex)")
+    verify.add_argument('--client-seed', default='')
+    verify.add_argument('--game', help="game name (default: the default game)")
+    verify.add_argument('--game-version', help="expected Game.version digest")
+    verify.add_argument('--counter', type=int, required=True)
+    verify.add_argument('--bonus', action='store_true', help="a free spin")
+    audit = commands.add_parser('audit', help="regenerate ledger spins and check their wins")
+    audit.add_argument('--wallet', type=int)
+    audit.add_argument('--month', help="partition month, YYYYMM")
+    audit.add_argument('--limit', type=int)
+    audit.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        from games import game_registry
+
+        game = game_registry.get(args.game)
+        if args.game_version and args.game_version != game.version:
+            parser.error(f"{game.name} is at version {game.version}, not {args.game_version}")
+        server_seed = bytes.fromhex(args.server_seed)
+        print(f"server seed hash {seed_hash(server_seed)}, game {game.name} {game.version}")
+        grid = derive_grid(game, server_seed, args.client_seed, args.counter, args.bonus)
+        for row in range(game.row_count):
+            print('  '.join(f"{reel[row]:<12}" for reel in grid))
+        return
+
+    from app import create_app
+
+    month = datetime.strptime(args.month, '%Y%m') if args.month else None
+    with create_app().app_context():
+        counts = provenance.audit(args.wallet, month, args.limit, args.workers)
+    print(f"{counts['spins']:,} spins, {counts['derived']:,} derived ({counts['spins_per_sec']:,}/s), "
+          f"{counts['checked']:,} wins checked, {counts['mismatches']:,} mismatches")
+    if counts['mismatches']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Random number sources for the game.
+
+``SecureRandom`` is the production backend: it reads ``os.urandom`` in large
+blocks into a per-thread buffer of 32-bit words and maps words to weighted
+symbol indexes with rejection sampling (words at or above the largest
+multiple of the total weight are discarded, so ``word % total`` is exactly
+uniform). One syscall then covers thousands of symbols. Buffers are dropped
+in a forked child, so gunicorn workers never draw the same bytes.
+
+``SeededRandom`` is ``random.Random`` under another name: deterministic for a
+given seed, for tests, benchmarks and replays. Forked workers share its
+state, so it is never meant for serving.
+
+Both expose the part of the ``random.Random`` API the game uses
+(``choices``, ``random``, ``randrange``), so ``SpinEngine`` works with either.
+``rng_source.generator`` is the one the app draws from, chosen by
+``RNG_BACKEND`` (``secure`` or ``seeded`` with ``RNG_SEED``).
+
+Statistical self-test of the configured reels (chi-square per reel
+position)::
+
+    python rng.py --spins 200000
+    python rng.py --backend seeded --seed 1 --game tropical_25
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import weakref
+from bisect import bisect
+from itertools import accumulate
+
+# Bytes read per os.urandom call
+BLOCK_SIZE = 64 * 1024
+
+_WORD_RANGE = 1 << 32
+
+BACKENDS = ('secure', 'seeded')
+
+_secure_instances = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for instance in list(_secure_instances):
+        instance._local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class SecureRandom:
+    """CSPRNG over buffered ``os.urandom`` blocks; see the module docstring."""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size - block_size % 4
+        self._local = threading.local()
+        _secure_instances.add(self)
+
+    def _block(self):
+        return memoryview(os.urandom(self.block_size)).cast('I').tolist()
+
+    def _take(self, k):
+        """``k`` uniform 32-bit words."""
+        state = self._local
+        try:
+            words, pos = state.words, state.pos
+        except AttributeError:
+            words, pos = [], 0
+        end = pos + k
+        if end > len(words):
+            words = words[pos:]
+            while len(words) < k:
+                words += self._block()
+            state.words = words
+            pos, end = 0, k
+        state.pos = end
+        return words[pos:end]
+
+    def _below(self, words, n):
+        """Map words to uniform integers in ``[0, n)``, redrawing rejected ones."""
+        limit = _WORD_RANGE - _WORD_RANGE % n
+        if limit != _WORD_RANGE and max(words) >= limit:
+            for i, word in enumerate(words):
+                while word >= limit:
+                    word = self._take(1)[0]
+                words[i] = word
+        return [word % n for word in words]
+
+    def randbelow(self, n):
+        if n <= 0:
+            raise ValueError("n must be positive")
+        if n <= _WORD_RANGE:
+            return self._below(self._take(1), n)[0]
+        # Wider ranges: rejection over as many words as needed
+        count = (n.bit_length() + 31) // 32
+        excess = count * 32 - n.bit_length()
+        while True:
+            value = 0
+            for word in self._take(count):
+                value = value << 32 | word
+            value >>= excess
+            if value < n:
+                return value
+
+    def randrange(self, start, stop=None):
+        if stop is None:
+            start, stop = 0, start
+        if stop <= start:
+            raise ValueError("empty range for randrange()")
+        return start + self.randbelow(stop - start)
+
+    def random(self):
+        """Float in ``[0, 1)`` with 53 random bits, like ``random.random``."""
+        a, b = self._take(2)
+        return ((a >> 5) * 67108864 + (b >> 6)) * (1.0 / 9007199254740992)
+
+    def choices(self, population, weights=None, *, cum_weights=None, k=1):
+        """Weighted draws with replacement, as ``random.Random.choices``."""
+        if cum_weights is None:
+            if weights is None:
+                n = len(population)
+                return [population[i] for i in self._below(self._take(k), n)]
+            cum_weights = list(accumulate(weights))
+        elif weights is not None:
+            raise TypeError("Cannot specify both weights and cumulative weights")
+        if len(cum_weights) != len(population):
+            raise ValueError("The number of weights does not match the population")
+        total = cum_weights[-1]
+        hi = len(cum_weights) - 1
+        if isinstance(total, int) and 0 < total <= _WORD_RANGE:
+            # Integer weights: exact, no float rounding
+            draws = self._below(self._take(k), total)
+        else:
+            draws = [self.random() * total for _ in range(k)]
+        return [population[bisect(cum_weights, draw, 0, hi)] for draw in draws]
+
+
+class SeededRandom(random.Random):
+    """Deterministic backend (Mersenne Twister) for tests and replays."""
+
+
+def create_rng(backend='secure', seed=None):
+    if backend == 'secure':
+        return SecureRandom()
+    if backend == 'seeded':
+        return SeededRandom(seed)
+    raise ValueError(f"Unknown RNG backend {backend!r} (expected one of {', '.join(BACKENDS)})")
+
+
+class RNGSource:
+    """The generator the app draws spins from."""
+
+    def __init__(self, app=None):
+        self.backend = 'secure'
+        self.generator = SecureRandom()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('RNG_BACKEND', self.backend)
+        if backend != self.backend or backend == 'seeded':
+            self.generator = create_rng(backend, app.config.get('RNG_SEED'))
+            self.backend = backend
+
+
+rng_source = RNGSource()
+
+
+def chi_square_sf(statistic, dof):
+    """
+    Upper tail of the chi-square distribution (Wilson-Hilferty).
+
+    Accurate to a few percent in the tail for the tens of degrees of freedom
+    of a reel, which is plenty to tell a sound generator from a broken one.
+    """
+    if dof <= 0:
+        return 1.0
+    z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def self_test(engine, rng, spins):
+    """
+    Chi-square test of the symbol frequencies at every reel position.
+
+    Returns ``[(reel, row, statistic, dof, p_value)]`` against the engine's
+    weight tables.
+    """
+    counts = [[[0] * len(engine.symbols) for _ in range(engine.row_count)]
+              for _ in range(engine.reel_count)]
+    for _ in range(spins):
+        for reel_index, reel in enumerate(engine.spin_codes(rng)):
+            reel_counts = counts[reel_index]
+            for row, code in enumerate(reel):
+                reel_counts[row][code] += 1
+
+    results = []
+    for reel_index, weights in enumerate(engine.reel_weights):
+        total = sum(weights)
+        for row in range(engine.row_count):
+            observed = counts[reel_index][row]
+            statistic = 0.0
+            dof = -1
+            for code, weight in enumerate(weights):
+                if weight:
+                    expected = spins * weight / total
+                    statistic += (observed[code] - expected) ** 2 / expected
+                    dof += 1
+                elif observed[code]:
+                    # A symbol that cannot appear on this reel did
+                    statistic, dof = math.inf, max(dof, 1)
+                    break
+            results.append((reel_index, row, statistic, dof, chi_square_sf(statistic, dof)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chi-square self-test of the spin RNG")
+    parser.add_argument('--spins', type=int, default=200_000)
+    parser.add_argument('--backend', choices=BACKENDS, default='secure')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--game', help="game to test (default: the default game)")
+    parser.add_argument('--alpha', type=float, default=0.001,
+                        help="family-wise significance level (default 0.001)")
+    parser.add_argument('--bonus', action='store_true', help="test the free-spin reels")
+    args = parser.parse_args(argv)
+
+    from games import game_registry
+
+    game = game_registry.get(args.game)
+    engine = game.bonus_engine if args.bonus else game.engine
+    results = self_test(engine, create_rng(args.backend, args.seed), args.spins)
+
+    # Bonferroni: every position is tested at alpha / positions
+    threshold = args.alpha / len(results)
+    print(f"{game.name}{' (bonus reels)' if args.bonus else ''}, {args.backend} backend, {args.spins:,} spins")
+    print(f"{'reel':>4}{'row':>5}{'chi2':>12}{'dof':>5}{'p':>10}")
+    failed = 0
+    for reel_index, row, statistic, dof, p_value in results:
+        flag = ''
+        if p_value < threshold:
+            flag = '  FAIL'
+            failed += 1
+        print(f"{reel_index + 1:>4}{row + 1:>5}{statistic:>12.2f}{dof:>5}{p_value:>10.4f}{flag}")
+    if failed:
+        print(f"\nFAILED: {failed} of {len(results)} positions below p = {threshold:.2g}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Per-minute, per-hour and per-day rollups of the spin ledger.
+
+Every ledger flush folds its batch into one row per bucket at each grain
+(``stat_rollups_minute``, ``_hour``, ``_day``) with an ``INSERT ... ON
+CONFLICT DO UPDATE`` that adds to the counters and keeps the larger max win,
+in the same transaction as the spins themselves. A record arriving late only
+adds to the buckets of its own timestamp, so out-of-order flushes from
+several workers merge exactly.
+
+Coarser grains are kept up to date alongside the finer ones, so compaction
+is just dropping fine rows past their retention (minute rows after
+``ROLLUP_MINUTE_RETENTION_HOURS``, hour rows after
+``ROLLUP_HOUR_RETENTION_DAYS``; day rows are kept). A windowed query reads at
+most ``MAX_ROWS`` rows of a single grain through its primary key, whatever
+the size of the ledger. Spins the ledger had to drop are kept with ``add``
+as in-process minute buckets, which the ledger flusher writes with
+``flush``::
+
+    GET /statistics/series?window=1h&step=1m
+    GET /statistics/series?window=30d&step=1d
+
+    python rollups.py compact
+    python rollups.py rebuild   # recompute from the spin partitions
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, select
+
+from database import db
+
+EPOCH = datetime(1970, 1, 1)
+
+UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+_DURATION_RE = re.compile(r'^(\d+)([smhd])$')
+
+# Points in one series, and rollup rows read for it
+MAX_POINTS = 1440
+MAX_ROWS = 5000
+
+COUNTERS = ('spins', 'wins', 'bonus_spins', 'total_bet', 'total_won')
+
+MINUTE = timedelta(minutes=1)
+
+
+def parse_duration(text):
+    """``'15m'`` -> ``timedelta(minutes=15)``; ValueError for anything else."""
+    match = _DURATION_RE.match(text or '')
+    if not match or not int(match.group(1)):
+        raise ValueError(f"Invalid duration {text!r} (expected e.g. 30s, 15m, 1h, 7d)")
+    return timedelta(**{UNITS[match.group(2)]: int(match.group(1))})
+
+
+def floor_time(timestamp, size):
+    return timestamp - (timestamp - EPOCH) % size
+
+
+def _grains():
+    from models import DayRollup, HourRollup, MinuteRollup
+
+    return (
+        ('day', timedelta(days=1), DayRollup),
+        ('hour', timedelta(hours=1), HourRollup),
+        ('minute', timedelta(minutes=1), MinuteRollup),
+    )
+
+
+class StatRollups:
+    """Incremental time-bucketed counters behind ``/statistics/series``."""
+
+    def __init__(self, app=None):
+        self.minute_retention = timedelta(hours=48)
+        self.hour_retention = timedelta(days=90)
+        self.compact_interval = 600.0
+        self._last_compact = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.minute_retention = timedelta(hours=app.config.get('ROLLUP_MINUTE_RETENTION_HOURS', 48))
+        self.hour_retention = timedelta(days=app.config.get('ROLLUP_HOUR_RETENTION_DAYS', 90))
+        # Seconds between compactions run by each ledger flusher
+        self.compact_interval = app.config.get('ROLLUP_COMPACT_INTERVAL', self.compact_interval)
+
+    def _after_fork(self):
+        # Buckets added in the parent are written there
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def retention(self, grain):
+        return {'minute': self.minute_retention, 'hour': self.hour_retention}.get(grain)
+
+    @staticmethod
+    def aggregate(rows, size):
+        """``{bucket: counters}`` of ledger rows for buckets of ``size``."""
+        buckets = {}
+        for row in rows:
+            bucket = floor_time(row['timestamp'], size)
+            counters = buckets.get(bucket)
+            if counters is None:
+                counters = buckets[bucket] = {'bucket': bucket, 'spins': 0, 'wins': 0, 'bonus_spins': 0,
+                                              'total_bet': 0.0, 'total_won': 0.0, 'max_win': 0.0}
+            win = row['win_amount']
+            counters['spins'] += 1
+            counters['total_bet'] += row['bet_amount']
+            counters['total_won'] += win
+            if win > 0:
+                counters['wins'] += 1
+                if win > counters['max_win']:
+                    counters['max_win'] = win
+            if row.get('is_bonus_spin'):
+                counters['bonus_spins'] += 1
+        return buckets
+
+    @staticmethod
+    def _merge(buckets, counters, size):
+        """Add one bucket's counters to ``buckets`` of ``size``."""
+        bucket = floor_time(counters['bucket'], size)
+        merged = buckets.get(bucket)
+        if merged is None:
+            buckets[bucket] = dict(counters, bucket=bucket)
+            return
+        for name in COUNTERS:
+            merged[name] += counters[name]
+        merged['max_win'] = max(merged['max_win'], counters['max_win'])
+
+    def apply(self, rows):
+        """Add ledger rows to every grain in the current session; the caller commits."""
+        if not rows:
+            return
+        for _, size, model in _grains():
+            self._upsert(model, self.aggregate(rows, size))
+
+    def _upsert(self, model, buckets):
+        if db.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        table = model.__table__
+        statement = insert(table).values(list(buckets.values()))
+        excluded = statement.excluded
+        values = {name: table.c[name] + excluded[name] for name in COUNTERS}
+        values['max_win'] = case((excluded.max_win > table.c.max_win, excluded.max_win),
+                                 else_=table.c.max_win)
+        db.session.execute(statement.on_conflict_do_update(index_elements=[table.c.bucket], set_=values))
+
+    def add(self, rows):
+        """Keep rows that will not reach the ledger as minute buckets for ``flush``."""
+        with self._lock:
+            for counters in self.aggregate(rows, MINUTE).values():
+                self._merge(self._pending, counters, MINUTE)
+
+    @property
+    def pending(self):
+        return bool(self._pending)
+
+    def flush(self):
+        """Write the buckets kept by ``add`` to every grain and commit; they are put back on failure."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            for _, size, model in _grains():
+                buckets = {}
+                for counters in pending.values():
+                    self._merge(buckets, counters, size)
+                self._upsert(model, buckets)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error writing statistics rollups: {e}")
+            db.session.rollback()
+            with self._lock:
+                for counters in pending.values():
+                    self._merge(self._pending, counters, MINUTE)
+
+    def compact(self, now=None):
+        """Drop minute and hour rows past their retention; returns ``{grain: rows}``."""
+        now = now or datetime.utcnow()
+        deleted = {}
+        for grain, _, model in _grains():
+            retention = self.retention(grain)
+            if retention is None:
+                continue
+            result = db.session.execute(delete(model).where(model.bucket < now - retention))
+            deleted[grain] = result.rowcount
+        db.session.commit()
+        self._last_compact = time.monotonic()
+        return deleted
+
+    def maybe_compact(self):
+        """Compact at most once per ``compact_interval`` in this process."""
+        if self._last_compact is not None and time.monotonic() - self._last_compact < self.compact_interval:
+            return None
+        return self.compact()
+
+    def series(self, window, step, now=None):
+        """
+        Counters per ``step`` over the last ``window`` (both durations).
+
+        Steps are aligned to multiples of ``step`` since the epoch and the
+        last one holds ``now``. The series reads the coarsest grain that
+        divides ``step``; ValueError when the request does not fit it.
+        """
+        window_size, step_size = parse_duration(window), parse_duration(step)
+        if window_size % step_size:
+            raise ValueError("window must be a multiple of step")
+        points = window_size // step_size
+        if points > MAX_POINTS:
+            raise ValueError(f"At most {MAX_POINTS} points per series")
+        for grain, size, model in _grains():
+            if not step_size % size:
+                break
+        else:
+            raise ValueError("step must be a whole number of minutes")
+        retention = self.retention(grain)
+        if retention is not None and window_size > retention:
+            raise ValueError(f"{grain} rollups are kept for {retention}; use a coarser step")
+        if window_size // size > MAX_ROWS:
+            raise ValueError("window too long for the step")
+
+        now = now or datetime.utcnow()
+        end = floor_time(now, step_size) + step_size
+        start = end - window_size
+        series = [{'start': start + i * step_size, 'spins': 0, 'wins': 0, 'bonus_spins': 0,
+                   'total_bet': 0.0, 'total_won': 0.0, 'max_win': 0.0} for i in range(points)]
+        rows = db.session.execute(
+            select(model).where(model.bucket >= start, model.bucket < end)
+        ).scalars()
+        for row in rows:
+            point = series[(row.bucket - start) // step_size]
+            for name in COUNTERS:
+                point[name] += getattr(row, name)
+            point['max_win'] = max(point['max_win'], row.max_win)
+
+        totals = {name: sum(point[name] for point in series) for name in COUNTERS}
+        totals['max_win'] = max((point['max_win'] for point in series), default=0.0)
+        return {
+            'window': window,
+            'step': step,
+            'grain': grain,
+            'start': _iso(start),
+            'end': _iso(end),
+            'totals': _with_rates(totals),
+            'points': [dict(_with_rates(point), start=_iso(point['start'])) for point in series],
+        }
+
+    def rebuild(self, batch_size=10000):
+        """Recompute every rollup from the spin partitions; returns the spins read."""
+        from spin_history import partition_name, spin_history
+
+        for _, _, model in _grains():
+            db.session.execute(delete(model))
+        read = 0
+        for month in spin_history.months():
+            table = spin_history._table(partition_name(month))
+            columns = (table.c.timestamp, table.c.bet_amount, table.c.win_amount, table.c.is_bonus_spin)
+            result = db.session.execute(select(*columns).execution_options(yield_per=batch_size))
+            for partition in result.partitions():
+                rows = [row._asdict() for row in partition]
+                self.apply(rows)
+                read += len(rows)
+        db.session.commit()
+        return read
+
+
+def _iso(timestamp):
+    return timestamp.isoformat() + 'Z'
+
+
+def _with_rates(counters):
+    # Same rounding as /statistics
+    spins, bet = counters['spins'], counters['total_bet']
+    return dict(counters,
+                win_rate=round(counters['wins'] / spins * 100 if spins > 0 else 0, 2),
+                rtp=round(counters['total_won'] / bet * 100 if bet > 0 else 0, 2))
+
+
+stat_rollups = StatRollups()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistics rollup tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('compact', help="drop minute and hour rows past their retention")
+    commands.add_parser('rebuild', help="recompute all rollups from the spin partitions")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    with create_app().app_context():
+        if args.command == 'compact':
+            for grain, rows in stat_rollups.compact().items():
+                print(f"{grain:<8}{rows:>10,} rows dropped")
+        else:
+            print(f"Rolled up {stat_rollups.rebuild():,} spins")
+
+
+if __name__ == "__main__":
+    main()
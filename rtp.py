@@ -0,0 +1,446 @@
+"""
+Exact RTP / hit-frequency calculator for the reel model used by ``/spin``.
+
+Every cell is drawn independently from its reel's weight table, so the
+probability of any grid is a product of integer weights. Paylines that share
+cells are handled exactly: the shared cells are enumerated jointly (see
+``analyze``) and the cells that belong to a single line are folded in per
+line. All arithmetic is on integers, so the results are exact fractions
+rather than estimates.
+
+RTP, hit frequency, variance and the per-line / per-symbol figures take
+about 0.2 s for the main game (``analyze(distribution=False)``, which the
+RTP monitor, the simulator and the benchmarks use). The full win
+distribution has to enumerate the joint pays of all lines and takes a few
+seconds, still instead of a Monte Carlo run.
+
+Usage::
+
+    python rtp.py              # PAR-sheet style report
+    python rtp.py --summary    # without the win distribution, in a fraction of a second
+    python rtp.py --json       # machine-readable output
+"""
+import argparse
+import copy
+import json
+import sys
+from collections import defaultdict
+from fractions import Fraction
+
+from game_config import PAYLINES, SCATTER_SYMBOL, SYMBOL_VALUES, WILD_MULTIPLIERS
+from spin_engine import engine as spin_engine
+
+# Line state before any base symbol has been seen
+NO_BASE = -1
+
+# Lower edges (bet multiples) of the win ranges shown in the report
+WIN_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 5000)
+
+
+class ReelModel:
+    """Symbol weights, substitution rules and paylines as plain integer tables."""
+
+    def __init__(self, symbols, reel_weights, row_count, paylines, symbol_values,
+                 wild_multipliers, scatter_symbol):
+        self.symbols = tuple(symbols)
+        self.reel_weights = [tuple(weights) for weights in reel_weights]
+        self.row_count = row_count
+        self.paylines = [tuple(line) for line in paylines]
+        self.values = [symbol_values.get(s, 0) for s in self.symbols]
+        self.is_wild = [s.startswith('wild_') for s in self.symbols]
+        self.wild_multiplier = [wild_multipliers.get(s, 1) if wild else 1
+                                for s, wild in zip(self.symbols, self.is_wild)]
+        self.is_base = [not wild and s != scatter_symbol
+                        for s, wild in zip(self.symbols, self.is_wild)]
+
+        for line in self.paylines:
+            if [x for x, _ in line] != list(range(len(self.reel_weights))):
+                raise ValueError(f"Payline {line} must visit every reel once, left to right")
+
+    @classmethod
+    def from_config(cls):
+        return cls(spin_engine.symbols, spin_engine.reel_weights, spin_engine.row_count,
+                   PAYLINES, SYMBOL_VALUES, WILD_MULTIPLIERS, SCATTER_SYMBOL)
+
+    @classmethod
+    def from_game(cls, game):
+        """Model of a ``games.Game``; GameConfigError unless it pays full lines only."""
+        return cls(game.symbols, game.reel_weights, game.row_count, game.paylines,
+                   game.full_line_values(), game.wild_multipliers, game.scatter_symbol)
+
+    def hit_model(self):
+        """Copy in which every winning line pays 1, so joint pays count winning lines."""
+        model = copy.copy(self)
+        model.values = [1 if value > 0 else 0 for value in self.values]
+        model.wild_multiplier = [1] * len(self.symbols)
+        return model
+
+    @property
+    def total_weight(self):
+        total = 1
+        for weights in self.reel_weights:
+            total *= sum(weights) ** self.row_count
+        return total
+
+
+class ParSheet:
+    """Exact results of the analysis, as fractions of one unit bet."""
+
+    def __init__(self, model, line_returns, line_hits, symbol_returns, symbol_hits,
+                 multiplier_hits, hit_weight, second_moment, distribution=None):
+        total = model.total_weight
+        self.model = model
+        # win (bet multiple) -> probability, None unless analysed
+        self.distribution = None
+        if distribution is not None:
+            self.distribution = {win: Fraction(weight, total)
+                                 for win, weight in sorted(distribution.items())}
+        self.line_returns = [Fraction(w, total) for w in line_returns]
+        self.line_hits = [Fraction(w, total) for w in line_hits]
+        self.symbol_returns = {s: Fraction(symbol_returns[code], total)
+                               for code, s in enumerate(model.symbols) if symbol_hits[code]}
+        self.symbol_hits = {s: Fraction(symbol_hits[code], total)
+                            for code, s in enumerate(model.symbols) if symbol_hits[code]}
+        self.multiplier_hits = {m: Fraction(w, total) for m, w in sorted(multiplier_hits.items())}
+
+        self.rtp = sum(self.line_returns, Fraction(0))
+        self.hit_frequency = Fraction(hit_weight, total)
+        self.variance = Fraction(second_moment, total) - self.rtp * self.rtp
+
+    def buckets(self, edges=WIN_BUCKETS):
+        """Probability and RTP share of wins in ``[edges[i], edges[i + 1])``."""
+        rows = []
+        bounds = list(edges) + [None]
+        for low, high in zip(bounds, bounds[1:]):
+            p = sum((q for win, q in self.distribution.items()
+                     if win >= low and (high is None or win < high)), Fraction(0))
+            rtp = sum((win * q for win, q in self.distribution.items()
+                       if win >= low and (high is None or win < high)), Fraction(0))
+            rows.append((low, high, p, rtp))
+        return rows
+
+    @property
+    def std_dev(self):
+        return float(self.variance) ** 0.5
+
+    def to_dict(self):
+        result = {
+            'rtp': float(self.rtp),
+            'hit_frequency': float(self.hit_frequency),
+            'variance': float(self.variance),
+            'std_dev': self.std_dev,
+            'lines': [{'line': index + 1, 'rtp': float(rtp), 'hit_frequency': float(hits)}
+                      for index, (rtp, hits) in enumerate(zip(self.line_returns, self.line_hits))],
+            'symbols': {s: {'rtp': float(self.symbol_returns[s]),
+                            'hits_per_spin': float(self.symbol_hits[s])}
+                        for s in self.symbol_returns},
+            'wild_multipliers': {str(m): float(p) for m, p in self.multiplier_hits.items()},
+        }
+        if self.distribution is not None:
+            result['distribution'] = {str(win): float(p) for win, p in self.distribution.items()}
+        return result
+
+
+def _cell_outcomes(model, reel_index, line_states):
+    """
+    Group the symbols of one cell by their effect on the lines crossing it.
+
+    Returns ``[(weight, new_line_states), ...]`` where symbols with the same
+    effect have their weights summed.
+    """
+    grouped = defaultdict(int)
+    for code, weight in enumerate(model.reel_weights[reel_index]):
+        if not weight:
+            continue
+        if model.is_wild[code]:
+            multiplier = model.wild_multiplier[code]
+            effect = tuple((base, mult * multiplier) for base, mult in line_states)
+        elif not model.is_base[code]:
+            effect = (None,) * len(line_states)
+        else:
+            effect = tuple((code, mult) if base in (NO_BASE, code) else None
+                           for base, mult in line_states)
+        grouped[effect] += weight
+    return [(weight, effect) for effect, weight in grouped.items()]
+
+
+def _cached_outcomes(model, cache, reel_index, line_states):
+    key = (reel_index, line_states)
+    outcomes = cache.get(key)
+    if outcomes is None:
+        outcomes = cache[key] = _cell_outcomes(model, reel_index, line_states)
+    return outcomes
+
+
+def _line_distribution(model, cells, line_state, cache):
+    """Final-state weights of one line over ``cells``."""
+    dist = {line_state: 1}
+    for reel_index, _ in cells:
+        reel_total = sum(model.reel_weights[reel_index])
+        next_dist = defaultdict(int)
+        for state, weight in dist.items():
+            if state is None:
+                next_dist[None] += weight * reel_total
+                continue
+            for cell_weight, (effect,) in _cached_outcomes(model, cache, reel_index, (state,)):
+                next_dist[effect] += weight * cell_weight
+        dist = next_dist
+    return dist
+
+
+def _pair_moment(model, first, second, cache):
+    """
+    Weight of ``pay(first) * pay(second)`` over all grids.
+
+    A pay is linear in its line's multiplier, so the walk tracks only the
+    base symbols of both lines and folds the wild multipliers into the
+    weights. A shared cell is drawn once for both lines, distinct cells
+    independently; a state in which either line is dead adds nothing, so it
+    is dropped as soon as it appears.
+    """
+    start = (NO_BASE, 1)
+    states = {(start, start): 1}
+    visited_weight = 1
+    for (reel_index, row_a), (_, row_b) in zip(first, second):
+        reel_total = sum(model.reel_weights[reel_index])
+        next_states = defaultdict(int)
+        for (a, b), weight in states.items():
+            if row_a == row_b:
+                for cell_weight, (new_a, new_b) in _cached_outcomes(model, cache, reel_index, (a, b)):
+                    if new_a is not None and new_b is not None:
+                        next_states[((new_a[0], 1), (new_b[0], 1))] += weight * cell_weight * new_a[1] * new_b[1]
+                continue
+            outcomes_b = [(cell_weight * new_b[1], (new_b[0], 1))
+                          for cell_weight, (new_b,) in _cached_outcomes(model, cache, reel_index, (b,))
+                          if new_b is not None]
+            for cell_weight, (new_a,) in _cached_outcomes(model, cache, reel_index, (a,)):
+                if new_a is None:
+                    continue
+                weight_a = weight * cell_weight * new_a[1]
+                state_a = (new_a[0], 1)
+                for weight_b, state_b in outcomes_b:
+                    next_states[(state_a, state_b)] += weight_a * weight_b
+        states = next_states
+        visited_weight *= reel_total if row_a == row_b else reel_total * reel_total
+    moment = sum(weight * _line_pay(model, a) * _line_pay(model, b) for (a, b), weight in states.items())
+    return moment * (model.total_weight // visited_weight)
+
+
+def _line_pay(model, line_state):
+    if line_state is None or line_state[0] == NO_BASE:
+        return 0
+    base, mult = line_state
+    return model.values[base] * mult
+
+
+def _joint_distribution(model, cache):
+    """
+    ``{total pay: weight}`` of all paylines together.
+
+    Only cells crossed by two or more paylines couple the lines, so the walk
+    enumerates those shared cells, tracking the joint line states. Given the
+    shared cells the lines are independent: a line without private cells has
+    a fixed pay, which is added to the state as soon as its last shared cell
+    is drawn, and the remaining lines are convolved with their cached
+    private-cell distributions at the end. Shared cells on reels without
+    wilds go first because they break the most lines.
+    """
+    line_count = len(model.paylines)
+
+    cell_lines = defaultdict(list)
+    for l, line in enumerate(model.paylines):
+        for cell in line:
+            cell_lines[cell].append(l)
+    shared = [cell for cell, lines in cell_lines.items() if len(lines) > 1]
+    wild_weight = [sum(w for code, w in enumerate(weights) if model.is_wild[code])
+                   for weights in model.reel_weights]
+    shared.sort(key=lambda cell: (wild_weight[cell[0]] > 0, cell))
+    shared_order = {cell: index for index, cell in enumerate(shared)}
+
+    private = [[cell for cell in line if cell not in shared_order] for line in model.paylines]
+    pending = [l for l in range(line_count) if private[l]]
+    closing = defaultdict(list)
+    for l, line in enumerate(model.paylines):
+        if not private[l]:
+            closing[max(shared_order[cell] for cell in line)].append(l)
+
+    # (line states, fixed pay of the lines already closed) -> weight
+    states = {(((NO_BASE, 1),) * line_count, 0): 1}
+    for index, (reel_index, row) in enumerate(shared):
+        lines = cell_lines[(reel_index, row)]
+        next_states = defaultdict(int)
+        for (state, fixed), state_weight in states.items():
+            alive = [l for l in lines if state[l] is not None]
+            if not alive:
+                next_states[(state, fixed)] += state_weight * sum(model.reel_weights[reel_index])
+                continue
+            outcomes = _cached_outcomes(model, cache, reel_index, tuple(state[l] for l in alive))
+            for cell_weight, effect in outcomes:
+                new_state = list(state)
+                for l, line_state in zip(alive, effect):
+                    new_state[l] = line_state
+                new_fixed = fixed
+                for l in closing[index]:
+                    new_fixed += _line_pay(model, new_state[l])
+                    new_state[l] = None
+                next_states[(tuple(new_state), new_fixed)] += state_weight * cell_weight
+        states = next_states
+
+    # Group by the lines still open and fold their private cells in one line
+    # at a time, merging groups as each line is eliminated
+    groups = defaultdict(lambda: defaultdict(int))
+    for (state, fixed), weight in states.items():
+        groups[tuple(state[l] for l in pending)][fixed] += weight
+
+    for l in reversed(pending):
+        pay_cache = {}
+        folded = defaultdict(lambda: defaultdict(int))
+        for open_states, wins in groups.items():
+            line_state = open_states[-1]
+            pays = pay_cache.get(line_state)
+            if pays is None:
+                pays = defaultdict(int)
+                for final_state, weight in _line_distribution(model, private[l], line_state, cache).items():
+                    pays[_line_pay(model, final_state)] += weight
+                pays = pay_cache[line_state] = list(pays.items())
+            target = folded[open_states[:-1]]
+            for win, weight in wins.items():
+                for pay, pay_weight in pays:
+                    target[win + pay] += weight * pay_weight
+        groups = folded
+    distribution = groups[()]
+
+    # Cells outside every payline still count towards the outcome space
+    covered = set(cell_lines)
+    uncovered_weight = 1
+    for reel_index, weights in enumerate(model.reel_weights):
+        for row in range(model.row_count):
+            if (reel_index, row) not in covered:
+                uncovered_weight *= sum(weights)
+
+    for win in distribution:
+        distribution[win] *= uncovered_weight
+    return distribution
+
+
+def analyze(model=None, distribution=True):
+    """
+    Analyse the reel model exactly and return a ``ParSheet``.
+
+    RTP and the per-line figures are sums over single lines. Hit frequency
+    is the joint walk of ``_joint_distribution`` on ``ReelModel.hit_model``,
+    whose states carry no multipliers, and the second moment adds up
+    ``_pair_moment`` over every pair of lines. ``distribution=False`` skips
+    the full joint win distribution, which costs far more than the rest.
+    """
+    model = model or ReelModel.from_config()
+    line_count = len(model.paylines)
+    cache = {}
+
+    # Per-line figures are linear, so each line is analysed on its own
+    line_returns = [0] * line_count
+    line_hits = [0] * line_count
+    symbol_returns = [0] * len(model.symbols)
+    symbol_hits = [0] * len(model.symbols)
+    multiplier_hits = defaultdict(int)
+    second_moment = 0
+    line_scale = model.total_weight
+    for l, line in enumerate(model.paylines):
+        dist = _line_distribution(model, line, (NO_BASE, 1), cache)
+        scale = line_scale // sum(dist.values())
+        for final_state, weight in dist.items():
+            pay = _line_pay(model, final_state)
+            if not pay:
+                continue
+            base, mult = final_state
+            weight *= scale
+            line_returns[l] += pay * weight
+            line_hits[l] += weight
+            symbol_returns[base] += pay * weight
+            symbol_hits[base] += weight
+            multiplier_hits[mult] += weight
+            second_moment += pay * pay * weight
+
+    for l in range(line_count):
+        for m in range(l + 1, line_count):
+            second_moment += 2 * _pair_moment(model, model.paylines[l], model.paylines[m], cache)
+
+    hit_model = model.hit_model()
+    hit_weight = model.total_weight - _joint_distribution(hit_model, {}).get(0, 0)
+
+    return ParSheet(model, line_returns, line_hits, symbol_returns, symbol_hits, multiplier_hits,
+                    hit_weight, second_moment,
+                    _joint_distribution(model, cache) if distribution else None)
+
+
+def _one_in(p):
+    return f"1 in {1 / float(p):,.1f}" if p else "never"
+
+
+def format_report(sheet):
+    model = sheet.model
+    out = []
+    out.append("=== Tropical Sloth PAR sheet ===")
+    out.append(f"Reels x rows:       {len(model.reel_weights)} x {model.row_count}")
+    out.append(f"Paylines:           {len(model.paylines)}")
+    out.append(f"Outcome space:      {model.total_weight:,} weighted grids")
+    out.append("")
+    out.append(f"RTP:                {float(sheet.rtp):.6%}")
+    out.append(f"Hit frequency:      {float(sheet.hit_frequency):.6%} ({_one_in(sheet.hit_frequency)})")
+    out.append(f"Variance:           {float(sheet.variance):.4f}")
+    out.append(f"Std deviation:      {sheet.std_dev:.4f}")
+    out.append("")
+    out.append("Reel strips (weights)")
+    header = "  symbol        " + "".join(f"{'reel ' + str(r + 1):>9}" for r in range(len(model.reel_weights)))
+    out.append(header)
+    for code, symbol in enumerate(model.symbols):
+        out.append(f"  {symbol:<14}" + "".join(f"{weights[code]:>9}" for weights in model.reel_weights))
+    out.append("  " + "total".ljust(14) + "".join(f"{sum(w):>9}" for w in model.reel_weights))
+    out.append("")
+    out.append("Paylines")
+    out.append(f"  {'line':<6}{'cells':<42}{'RTP':>12}{'hit freq':>14}")
+    for index, line in enumerate(model.paylines):
+        cells = " ".join(f"{x},{y}" for x, y in line)
+        out.append(f"  {index + 1:<6}{cells:<42}{float(sheet.line_returns[index]):>12.6%}"
+                   f"{float(sheet.line_hits[index]):>14.6%}")
+    out.append("")
+    out.append("Symbols")
+    out.append(f"  {'symbol':<14}{'pays':>6}{'RTP':>12}{'hits/spin':>14}")
+    for symbol in sheet.symbol_returns:
+        pays = model.values[model.symbols.index(symbol)]
+        out.append(f"  {symbol:<14}{pays:>6}{float(sheet.symbol_returns[symbol]):>12.6%}"
+                   f"{float(sheet.symbol_hits[symbol]):>14.8f}")
+    out.append("")
+    out.append("Wild multipliers on winning lines")
+    for mult, p in sheet.multiplier_hits.items():
+        out.append(f"  x{mult:<5}{float(p):>14.8f} per spin")
+    if sheet.distribution is None:
+        return "\n".join(out)
+    out.append("")
+    out.append("Win distribution (bet multiples)")
+    out.append(f"  {'range':<14}{'probability':>16}{'odds':>22}{'RTP share':>12}")
+    for low, high, p, rtp in sheet.buckets():
+        label = f"{low}" if low == 0 else (f"{low}-{high}" if high else f"{low}+")
+        share = rtp / sheet.rtp if sheet.rtp else 0
+        out.append(f"  {label:<14}{float(p):>16.10f}{_one_in(p):>22}{float(share):>12.4%}")
+    out.append(f"  distinct win amounts: {len(sheet.distribution):,}, "
+               f"top award {max(sheet.distribution)}x ({_one_in(sheet.distribution[max(sheet.distribution)])})")
+    return "\n".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exact RTP and hit frequency for the reel model")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    parser.add_argument('--summary', action='store_true', help="skip the win distribution")
+    args = parser.parse_args(argv)
+
+    sheet = analyze(distribution=not args.summary)
+    if args.json:
+        json.dump(sheet.to_dict(), sys.stdout, indent=2)
+        print()
+    else:
+        print(format_report(sheet))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+Streaming check of the live RTP and hit rate against the reel model.
+
+Every resolved base-game spin (``/spin``, ``/spin_batch``) adds its return per
+unit bet ``x = winnings / bet`` to four counters labelled by game and bet
+level: spins, hits, ``sum(x)`` and ``sum((x - 1)**2)``. These are the
+shifted-data form of the running mean and variance: the squares are taken
+around one bet, close to the mean return, so the variance
+``(sum((x - 1)**2) - n * (mean - 1)**2) / (n - 1)`` keeps its precision
+without a per-spin division, and unlike Welford's ``(n, mean, M2)`` the
+state of two workers merges by plain addition. The counters live in the
+``metrics`` registry, so an update is a few float additions and the
+``/metrics`` worker files merge them across workers and restarts for free.
+``METRICS_ENABLED=0`` therefore disables the monitor too.
+
+A check compares each series (per game, and per game and bet level) with
+the exact RTP, hit frequency and standard deviation of ``rtp.py``. Games it
+cannot solve (partial-line pays, ways) use a seeded simulation of
+``RTP_MONITOR_REFERENCE_SPINS`` spins instead, and their band is widened by
+the simulation's own error. A series alerts when its observed RTP or hit
+rate lies more than ``RTP_MONITOR_Z`` standard errors from the reference,
+once it has ``RTP_MONITOR_MIN_SPINS`` spins. A simulated reference takes
+seconds of CPU, so references are computed once per game definition by
+``bootstrap`` (or ``python rtp_monitor.py --references``) and stored in
+``rtp_references``; workers only read them, and report a series whose game
+has none yet as ``reference_pending``.
+
+One worker (whoever holds ``rtp-monitor.lock`` in ``METRICS_DIR``) runs the
+check every ``RTP_MONITOR_CHECK_INTERVAL`` seconds and prints a line when an
+alert is raised or cleared; callables in ``rtp_monitor.alert_hooks`` get the
+same events. ``GET /rtp_monitor`` runs the check on demand::
+
+    python rtp_monitor.py
+    python rtp_monitor.py --references
+"""
+import argparse
+import bisect
+import fcntl
+import json
+import math
+import os
+import threading
+
+from flask import Blueprint, jsonify
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from metrics import metrics
+
+# Lower edges of the bet levels (credits)
+BET_LEVELS = (0.2, 0.5, 1, 2, 5, 10, 20, 50)
+_LEVEL_LABELS = tuple(f"{level:g}" for level in BET_LEVELS)
+
+# Returns are squared around one bet
+SHIFT = 1.0
+
+LOCK_NAME = 'rtp-monitor.lock'
+
+# Placeholder of a reference not stored yet
+_PENDING = object()
+
+bp = Blueprint('rtp_monitor', __name__)
+
+
+def bet_level(bet):
+    return _LEVEL_LABELS[max(bisect.bisect_right(BET_LEVELS, bet) - 1, 0)]
+
+
+class Moments:
+    """Spins, hits and shifted sums of the return per unit bet of one series."""
+
+    __slots__ = ('spins', 'returns', 'squares', 'hits')
+
+    def __init__(self, spins=0.0, returns=0.0, squares=0.0, hits=0.0):
+        self.spins = spins
+        self.returns = returns
+        self.squares = squares
+        self.hits = hits
+
+    def merge(self, other):
+        return Moments(self.spins + other.spins, self.returns + other.returns,
+                       self.squares + other.squares, self.hits + other.hits)
+
+    @property
+    def mean(self):
+        return self.returns / self.spins if self.spins else 0.0
+
+    @property
+    def variance(self):
+        if self.spins < 2:
+            return 0.0
+        m2 = self.squares - self.spins * (self.mean - SHIFT) ** 2
+        return max(m2, 0.0) / (self.spins - 1)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.spins if self.spins else 0.0
+
+
+def exact_reference(game):
+    """RTP, hit frequency and standard deviation from ``rtp.py``; GameConfigError if unsupported."""
+    from rtp import ReelModel, analyze
+
+    sheet = analyze(ReelModel.from_game(game), distribution=False)
+    return {'rtp': float(sheet.rtp), 'hit_frequency': float(sheet.hit_frequency),
+            'std_dev': sheet.std_dev, 'spins': None}
+
+
+def simulated_reference(game, spins, seed=0):
+    """The same figures estimated from ``spins`` seeded spins."""
+    from rng import SeededRandom
+
+    rng = SeededRandom(seed)
+    moments = Moments()
+    for _ in range(spins):
+        x = 0.0
+        for line_win in game.wins(game.engine.spin(rng), 1.0):
+            if line_win:
+                x += line_win
+        moments.spins += 1
+        moments.returns += x
+        moments.squares += (x - SHIFT) ** 2
+        if x > 0:
+            moments.hits += 1
+    return {'rtp': moments.mean, 'hit_frequency': moments.hit_rate,
+            'std_dev': math.sqrt(moments.variance), 'spins': spins}
+
+
+class RTPMonitor:
+    """Per-game, per-bet-level return counters and the checks run on them."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.z = 4.0
+        self.min_spins = 10000
+        self.check_interval = 60.0
+        self.reference_spins = 200_000
+        self.alert_hooks = []
+        self.families = (
+            metrics.counter('slot_rtp_spins_total', 'Base-game spins by game and bet level.',
+                            ('game', 'bet_level')),
+            metrics.counter('slot_rtp_return_total', 'Sum of winnings per unit bet.',
+                            ('game', 'bet_level')),
+            metrics.counter('slot_rtp_return_squares_total',
+                            'Sum of squared (winnings per unit bet - 1).', ('game', 'bet_level')),
+            metrics.counter('slot_rtp_hits_total', 'Base-game spins that won.', ('game', 'bet_level')),
+        )
+        self._series = {}
+        self._references = {}
+        self._active = {}
+        self._missing = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._lock_fd = None
+        self._stopping = threading.Event()
+        os.register_at_fork(after_in_child=self._after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.z = app.config.get('RTP_MONITOR_Z', self.z)
+        self.min_spins = app.config.get('RTP_MONITOR_MIN_SPINS', self.min_spins)
+        self.check_interval = app.config.get('RTP_MONITOR_CHECK_INTERVAL', self.check_interval)
+        self.reference_spins = app.config.get('RTP_MONITOR_REFERENCE_SPINS', self.reference_spins)
+        app.register_blueprint(bp)
+
+    def _after_fork(self):
+        # The lock is shared with the parent's descriptor; the child competes on its own
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+        self._lock_fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.check_interval and metrics.enabled:
+                self._stopping.clear()
+                threading.Thread(target=self._run, name='rtp-monitor', daemon=True).start()
+
+    # Recording
+
+    def observe(self, game, bet, winnings):
+        """Count one base-game spin of ``game`` (a name) at ``bet``."""
+        self._ensure_started()
+        level = bet_level(bet)
+        series = self._series.get((game, level))
+        if series is None:
+            series = self._series[(game, level)] = tuple(family.labels(game, level)
+                                                          for family in self.families)
+        spins, returns, squares, hits = series
+        x = winnings / bet
+        spins.inc()
+        returns.inc(x)
+        squares.inc((x - SHIFT) ** 2)
+        if winnings > 0:
+            hits.inc()
+
+    # Checking
+
+    def collect(self):
+        """``{(game, bet_level): Moments}`` summed over all workers."""
+        index = {family.name: i for i, family in enumerate(self.families)}
+        values = {}
+        for key, value in metrics.collect().items():
+            name, _, labels = json.loads(key)
+            i = index.get(name)
+            if i is None:
+                continue
+            labels = dict(labels)
+            values.setdefault((labels['game'], labels['bet_level']), [0.0] * 4)[i] += value
+        return {key: Moments(*sums) for key, sums in values.items()}
+
+    def reference(self, name, wait=True):
+        """
+        Reference figures of a game from ``rtp_references``; None if the game
+        is unknown. A reference not stored yet is computed and stored with
+        ``wait=True`` and returned as ``_PENDING`` otherwise.
+        """
+        reference = self._references.get(name, _PENDING)
+        if reference is not _PENDING:
+            return reference
+        from games import game_registry
+
+        try:
+            game = game_registry.get(name)
+        except KeyError:
+            reference = None
+        else:
+            reference = self._load_reference(game)
+            if reference is _PENDING:
+                if not wait:
+                    return _PENDING
+                reference = self.store_reference(game)
+        self._references[name] = reference
+        return reference
+
+    def _load_reference(self, game):
+        from models import RTPReference
+
+        row = db.session.execute(
+            select(RTPReference).where(RTPReference.digest == game.version,
+                                       RTPReference.reference_spins == self.reference_spins)).scalar()
+        if row is None:
+            return _PENDING
+        return {'rtp': row.rtp, 'hit_frequency': row.hit_frequency, 'std_dev': row.std_dev, 'spins': row.spins}
+
+    def compute_reference(self, game):
+        """Exact figures from ``rtp.py``, or a seeded simulation for games it cannot solve."""
+        from games import GameConfigError
+
+        try:
+            return exact_reference(game)
+        except GameConfigError:
+            return simulated_reference(game, self.reference_spins)
+
+    def store_reference(self, game):
+        """Compute a game's reference and save it to ``rtp_references``."""
+        from models import RTPReference
+
+        reference = self.compute_reference(game)
+        db.session.add(RTPReference(digest=game.version, reference_spins=self.reference_spins, **reference))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Stored by another process meanwhile; the figures are the same
+            db.session.rollback()
+        return reference
+
+    def store_references(self):
+        """Store the references missing for the loaded games (a bootstrap step); returns how many."""
+        from games import game_registry
+
+        if not metrics.enabled:
+            return 0
+        stored = 0
+        for game in game_registry:
+            if self._load_reference(game) is _PENDING:
+                self.store_reference(game)
+                stored += 1
+        return stored
+
+    def evaluate(self, game, level, moments, reference):
+        """Observed figures, confidence intervals and bands of one series against ``reference``."""
+        n = moments.spins
+        std_dev = math.sqrt(moments.variance)
+        hit_rate = moments.hit_rate
+        report = {
+            'game': game,
+            'bet_level': level,
+            'spins': int(n),
+            'rtp': _percent(moments.mean),
+            'rtp_ci': _interval(moments.mean, self.z * std_dev / math.sqrt(n) if n else 0.0),
+            'hit_rate': _percent(hit_rate),
+            'hit_rate_ci': _interval(hit_rate, self.z * math.sqrt(hit_rate * (1 - hit_rate) / n) if n else 0.0,
+                                     upper=1.0),
+            'std_dev': round(std_dev, 4),
+            'alerts': [],
+        }
+        if reference is _PENDING:
+            report['status'] = 'reference_pending'
+            return report
+        if reference is None:
+            report['status'] = 'no_reference'
+            return report
+
+        # Standard error of the live mean, plus that of a simulated reference
+        scale = 1 / n if n else 0.0
+        if reference['spins']:
+            scale += 1 / reference['spins']
+        p = reference['hit_frequency']
+        rtp_band = self.z * reference['std_dev'] * math.sqrt(scale)
+        hit_band = self.z * math.sqrt(p * (1 - p) * scale)
+        report.update(
+            expected_rtp=_percent(reference['rtp']),
+            rtp_band=_interval(reference['rtp'], rtp_band),
+            expected_hit_rate=_percent(p),
+            hit_rate_band=_interval(p, hit_band, upper=1.0),
+            reference='simulated' if reference['spins'] else 'exact',
+        )
+        if n < self.min_spins:
+            report['status'] = 'warming_up'
+            return report
+        if abs(moments.mean - reference['rtp']) > rtp_band:
+            report['alerts'].append('rtp_high' if moments.mean > reference['rtp'] else 'rtp_low')
+        if abs(hit_rate - p) > hit_band:
+            report['alerts'].append('hit_rate_high' if hit_rate > p else 'hit_rate_low')
+        report['status'] = 'alert' if report['alerts'] else 'ok'
+        return report
+
+    def check(self, wait=True):
+        """
+        Evaluate every series and notify about alerts raised or cleared since
+        the last check in this process. Returns the report served by
+        ``/rtp_monitor``; with ``wait=False`` a game without a stored
+        reference is left pending instead of being computed here.
+        """
+        by_level = self.collect()
+        by_game = {}
+        for (game, _), moments in by_level.items():
+            by_game[game] = by_game.get(game, Moments()).merge(moments)
+
+        references = {game: self.reference(game, wait) for game in by_game}
+        series = [self.evaluate(game, None, moments, references[game])
+                  for game, moments in sorted(by_game.items())]
+        for game, level in sorted(by_level, key=lambda key: (key[0], float(key[1]))):
+            series.append(self.evaluate(game, level, by_level[(game, level)], references[game]))
+
+        active = {(s['game'], s['bet_level'], alert): s for s in series for alert in s['alerts']}
+        for key in active.keys() - self._active.keys():
+            self._notify('raised', key[2], active[key])
+        for key in self._active.keys() - active.keys():
+            self._notify('cleared', key[2], self._active[key])
+        self._active = active
+
+        return {
+            'z': self.z,
+            'min_spins': self.min_spins,
+            'alerts': [dict(s, alert=alert) for (_, _, alert), s in active.items()],
+            'series': series,
+        }
+
+    def _notify(self, event, alert, series):
+        level = f" at bet level {series['bet_level']}" if series['bet_level'] else ''
+        observed, band = (('rtp', 'rtp_band') if alert.startswith('rtp')
+                          else ('hit_rate', 'hit_rate_band'))
+        print(f"RTP monitor: {alert} {event} for {series['game']}{level}: "
+              f"{observed} {series[observed]}% outside {series[band]} over {series['spins']:,} spins")
+        for hook in self.alert_hooks:
+            try:
+                hook(event, alert, series)
+            except Exception as e:
+                print(f"Error in RTP alert hook: {e}")
+
+    def _run(self):
+        while not self._stopping.wait(self.check_interval):
+            try:
+                if self._lead():
+                    with self.app.app_context():
+                        report = self.check(wait=False)
+                    self._report_missing(report)
+            except Exception as e:
+                print(f"Error checking RTP: {e}")
+
+    def _report_missing(self, report):
+        for s in report['series']:
+            if s['status'] == 'reference_pending' and s['game'] not in self._missing:
+                self._missing.add(s['game'])
+                print(f"RTP monitor: no stored reference for {s['game']}; "
+                      f"run python bootstrap.py or python rtp_monitor.py --references")
+
+    def _lead(self):
+        """Whether this worker runs the periodic check; the lock is held until it exits."""
+        if self._lock_fd is not None:
+            return True
+        os.makedirs(metrics.directory, exist_ok=True)
+        fd = os.open(os.path.join(metrics.directory, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+
+def _percent(value):
+    return round(value * 100, 3)
+
+
+def _interval(center, half_width, upper=None):
+    """``center +- half_width`` in percent; neither a return nor a rate goes below 0."""
+    high = center + half_width
+    if upper is not None:
+        high = min(high, upper)
+    return [_percent(max(center - half_width, 0.0)), _percent(high)]
+
+
+rtp_monitor = RTPMonitor()
+
+
+@bp.route('/rtp_monitor')
+def get_rtp_monitor():
+    if not metrics.enabled:
+        return jsonify({'error': 'metrics disabled'}), 404
+    return jsonify(rtp_monitor.check(wait=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live RTP and hit rate against the reel model")
+    parser.add_argument('--json', action='store_true', help="print the full report as JSON")
+    parser.add_argument('--references', action='store_true',
+                        help="compute and store the missing references of the loaded games, then exit")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    with create_app().app_context():
+        if args.references:
+            print(f"Stored {rtp_monitor.store_references()} RTP references")
+            return
+        report = rtp_monitor.check()
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'game':<16}{'bet':>6}{'spins':>12}{'rtp %':>10}{'expected':>10}{'hit %':>9}{'expected':>10}  status")
+    for s in report['series']:
+        print(f"{s['game']:<16}{s['bet_level'] or 'all':>6}{s['spins']:>12,}{s['rtp']:>10.2f}"
+              f"{s.get('expected_rtp', float('nan')):>10.2f}{s['hit_rate']:>9.2f}"
+              f"{s.get('expected_hit_rate', float('nan')):>10.2f}  {s['status']}"
+              + (f" ({', '.join(s['alerts'])})" if s['alerts'] else ''))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Multi-core Monte Carlo simulator for the reel and payout logic of ``/spin``.
+
+The run is cut into fixed-size chunks. Chunk ``i`` always draws from the
+stream ``SeedSequence(seed, spawn_key=(i,))``, so a run is reproducible for a
+given seed and chunk size regardless of how many workers execute it or in
+which order the chunks finish. Each chunk produces a compact ``SimulationStats``
+histogram; histograms merge by addition, which is what makes checkpointing
+and resuming cheap.
+
+Usage::
+
+    python simulate.py --spins 1e9 --seed 42 --checkpoint sim.json
+    python simulate.py --spins 1e9 --seed 42 --checkpoint sim.json   # resumes
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from evaluator import evaluator
+from rtp import WIN_BUCKETS
+from spin_engine import engine as spin_engine
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# Grids drawn and scored at once inside a chunk
+BATCH_SIZE = 1 << 16
+
+CHECKPOINT_VERSION = 1
+
+
+class SimulationStats:
+    """Mergeable histograms of a simulation run, in bet multiples."""
+
+    def __init__(self, symbol_count=None, line_count=None):
+        symbol_count = len(spin_engine.symbols) if symbol_count is None else symbol_count
+        line_count = evaluator.line_count if line_count is None else line_count
+        self.spins = 0
+        self.total_win = 0
+        self.total_win_sq = 0
+        self.hits = 0
+        self.win_buckets = [0] * len(WIN_BUCKETS)
+        self.symbol_hits = [0] * symbol_count
+        self.symbol_wins = [0] * symbol_count
+        self.line_hits = [0] * line_count
+        self.line_wins = [0] * line_count
+        self.multiplier_hits = {}
+        self.cpu_seconds = 0.0
+
+    def add_batch(self, grids):
+        base, multiplier, pays = evaluator.line_outcomes(grids)
+        wins = pays.sum(axis=1)
+
+        self.spins += len(grids)
+        self.total_win += int(wins.sum())
+        self.total_win_sq += int((wins * wins).sum())
+        self.hits += int(np.count_nonzero(wins))
+        bucket = np.searchsorted(WIN_BUCKETS, wins, side='right') - 1
+        for index, count in enumerate(np.bincount(bucket, minlength=len(WIN_BUCKETS))):
+            self.win_buckets[index] += int(count)
+
+        won = pays > 0
+        for line, (hits, total) in enumerate(zip(won.sum(axis=0), pays.sum(axis=0))):
+            self.line_hits[line] += int(hits)
+            self.line_wins[line] += int(total)
+
+        won_base = base[won]
+        symbol_count = len(self.symbol_hits)
+        hits = np.bincount(won_base, minlength=symbol_count)
+        totals = np.bincount(won_base, weights=pays[won], minlength=symbol_count)
+        for code in range(symbol_count):
+            self.symbol_hits[code] += int(hits[code])
+            self.symbol_wins[code] += int(totals[code])
+
+        values, counts = np.unique(multiplier[won], return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.multiplier_hits[value] = self.multiplier_hits.get(value, 0) + count
+
+    def merge(self, other):
+        self.spins += other.spins
+        self.total_win += other.total_win
+        self.total_win_sq += other.total_win_sq
+        self.hits += other.hits
+        for name in ('win_buckets', 'symbol_hits', 'symbol_wins', 'line_hits', 'line_wins'):
+            ours = getattr(self, name)
+            for index, value in enumerate(getattr(other, name)):
+                ours[index] += value
+        for value, count in other.multiplier_hits.items():
+            self.multiplier_hits[value] = self.multiplier_hits.get(value, 0) + count
+        self.cpu_seconds += other.cpu_seconds
+        return self
+
+    @property
+    def rtp(self):
+        return self.total_win / self.spins if self.spins else 0.0
+
+    @property
+    def hit_frequency(self):
+        return self.hits / self.spins if self.spins else 0.0
+
+    @property
+    def variance(self):
+        if not self.spins:
+            return 0.0
+        mean = self.rtp
+        return self.total_win_sq / self.spins - mean * mean
+
+    @property
+    def standard_error(self):
+        return (self.variance / self.spins) ** 0.5 if self.spins else 0.0
+
+    @property
+    def spins_per_core_second(self):
+        return self.spins / self.cpu_seconds if self.cpu_seconds else 0.0
+
+    def to_dict(self):
+        data = dict(vars(self))
+        data['multiplier_hits'] = {str(k): v for k, v in sorted(self.multiplier_hits.items())}
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(len(data['symbol_hits']), len(data['line_hits']))
+        for name, value in data.items():
+            setattr(stats, name, value)
+        stats.multiplier_hits = {int(k): v for k, v in data['multiplier_hits'].items()}
+        return stats
+
+
+def run_chunk(seed, chunk_index, spins):
+    """Simulate one chunk in a worker process."""
+    started = time.process_time()
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+    stats = SimulationStats()
+    remaining = spins
+    while remaining:
+        count = min(BATCH_SIZE, remaining)
+        stats.add_batch(spin_engine.draw_codes(count, rng))
+        remaining -= count
+    stats.cpu_seconds = time.process_time() - started
+    return chunk_index, stats
+
+
+def chunk_sizes(spins, chunk_size):
+    full, rest = divmod(spins, chunk_size)
+    return [chunk_size] * full + ([rest] if rest else [])
+
+
+def load_checkpoint(path, params):
+    if not path or not os.path.exists(path):
+        return set(), SimulationStats()
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != CHECKPOINT_VERSION or data.get('params') != params:
+        raise ValueError(f"Checkpoint {path} was written for a different run: {data.get('params')}")
+    return set(data['completed']), SimulationStats.from_dict(data['stats'])
+
+
+def save_checkpoint(path, params, completed, stats):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': CHECKPOINT_VERSION,
+            'params': params,
+            'completed': sorted(completed),
+            'stats': stats.to_dict(),
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def simulate(spins, seed, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint=None,
+             checkpoint_interval=30.0, progress=None):
+    """
+    Run ``spins`` spins across ``workers`` processes and return
+    ``(stats, wall_seconds)``.
+
+    With ``checkpoint`` set, merged results are written there at most every
+    ``checkpoint_interval`` seconds and a later call with the same parameters
+    resumes from them.
+    """
+    workers = workers or os.cpu_count() or 1
+    params = {'spins': spins, 'seed': seed, 'chunk_size': chunk_size,
+              'symbols': list(spin_engine.symbols), 'reel_weights': spin_engine.reel_weights}
+    params = json.loads(json.dumps(params))
+    completed, stats = load_checkpoint(checkpoint, params)
+    pending = [(index, size) for index, size in enumerate(chunk_sizes(spins, chunk_size))
+               if index not in completed]
+
+    started = time.perf_counter()
+    last_saved = started
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            queue = iter(pending)
+            running = set()
+            # Keep a bounded number of chunks in flight so memory stays flat
+            for index, size in queue:
+                running.add(pool.submit(run_chunk, seed, index, size))
+                if len(running) >= workers * 2:
+                    break
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, chunk_stats = future.result()
+                    stats.merge(chunk_stats)
+                    completed.add(index)
+                    next_chunk = next(queue, None)
+                    if next_chunk:
+                        running.add(pool.submit(run_chunk, seed, *next_chunk))
+                now = time.perf_counter()
+                if checkpoint and (now - last_saved >= checkpoint_interval or not running):
+                    save_checkpoint(checkpoint, params, completed, stats)
+                    last_saved = now
+                if progress:
+                    progress(stats, now - started)
+    except KeyboardInterrupt:
+        # Keep whatever finished so the run can be resumed
+        if checkpoint:
+            save_checkpoint(checkpoint, params, completed, stats)
+        raise
+    return stats, time.perf_counter() - started
+
+
+def format_report(stats, wall_seconds, workers, theoretical=None):
+    out = []
+    out.append("=== Monte Carlo simulation ===")
+    out.append(f"Spins:              {stats.spins:,}")
+    out.append(f"RTP:                {stats.rtp:.6%} +/- {1.96 * stats.standard_error:.6%} (95%)")
+    if theoretical is not None:
+        z = (stats.rtp - float(theoretical.rtp)) / stats.standard_error if stats.standard_error else 0.0
+        out.append(f"Theoretical RTP:    {float(theoretical.rtp):.6%} (z = {z:+.2f})")
+    out.append(f"Hit frequency:      {stats.hit_frequency:.6%}")
+    out.append(f"Variance:           {stats.variance:.4f}")
+    out.append("")
+    per_core = stats.spins_per_core_second
+    out.append(f"Wall time:          {wall_seconds:.2f}s with {workers} workers")
+    if wall_seconds:
+        wall_rate = stats.spins / wall_seconds
+        out.append(f"Throughput:         {wall_rate:,.0f} spins/sec")
+        if per_core:
+            out.append(f"Per core:           {per_core:,.0f} spins/sec")
+            out.append(f"Scaling efficiency: {wall_rate / (per_core * workers):.1%}")
+    out.append("")
+    out.append("Paylines")
+    for line, (hits, total) in enumerate(zip(stats.line_hits, stats.line_wins)):
+        out.append(f"  {line + 1:<4}{hits / stats.spins:>14.6%} hit{total / stats.spins:>14.6%} RTP")
+    out.append("")
+    out.append("Symbols")
+    for code, symbol in enumerate(spin_engine.symbols):
+        if stats.symbol_hits[code]:
+            out.append(f"  {symbol:<14}{stats.symbol_hits[code]:>14,} hits"
+                       f"{stats.symbol_wins[code] / stats.spins:>14.6%} RTP")
+    out.append("")
+    out.append("Wild multipliers on winning lines")
+    for value, count in sorted(stats.multiplier_hits.items()):
+        out.append(f"  x{value:<5}{count:>14,}")
+    out.append("")
+    out.append("Win distribution (bet multiples)")
+    bounds = list(WIN_BUCKETS) + [None]
+    for (low, high), count in zip(zip(bounds, bounds[1:]), stats.win_buckets):
+        label = f"{low}" if low == 0 else (f"{low}-{high}" if high else f"{low}+")
+        out.append(f"  {label:<14}{count:>16,}{count / stats.spins:>16.10f}")
+    return "\n".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the slot math")
+    parser.add_argument('--spins', type=float, default=10_000_000, help="number of spins (e.g. 1e9)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--checkpoint', help="checkpoint file to write and resume from")
+    parser.add_argument('--checkpoint-interval', type=float, default=30.0)
+    parser.add_argument('--compare', action='store_true', help="compare with the exact RTP from rtp.py")
+    parser.add_argument('--json', action='store_true', help="print the merged stats as JSON")
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+
+    def progress(stats, elapsed):
+        print(f"\r{stats.spins:,} spins, {stats.spins / elapsed:,.0f}/s, RTP {stats.rtp:.4%}",
+              end='', file=sys.stderr, flush=True)
+
+    stats, wall_seconds = simulate(int(args.spins), args.seed, workers, args.chunk_size,
+                                   args.checkpoint, args.checkpoint_interval, progress)
+    print(file=sys.stderr)
+
+    if args.json:
+        json.dump(dict(stats.to_dict(), wall_seconds=wall_seconds, workers=workers), sys.stdout, indent=2)
+        print()
+        return
+
+    theoretical = None
+    if args.compare:
+        from rtp import analyze
+        theoretical = analyze(distribution=False)
+    print(format_report(stats, wall_seconds, workers, theoretical))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+TTL cache for read-mostly JSON snapshots such as ``/statistics``.
+
+Each worker keeps the last snapshot in memory and calls the loader again only
+once it is older than ``ttl``; concurrent misses wait for the one refresh in
+flight instead of each running the query. With ``shared_path`` set, workers
+also publish snapshots to that file and pick up a fresh one from it before
+loading their own, so a pool of workers usually runs one query per TTL.
+
+``get_async`` is the same for an event loop, with a coroutine loader.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class Snapshot:
+    """A loaded payload plus the metadata used for conditional GETs."""
+
+    def __init__(self, data, last_modified=None, fetched_at=None):
+        self.data = data
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.last_modified = last_modified or datetime.fromtimestamp(self.fetched_at, timezone.utc)
+        # Derived from the content, so an unchanged payload keeps its ETag
+        # across refreshes and across workers
+        canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+        self.version = hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def age(self):
+        return max(0.0, time.time() - self.fetched_at)
+
+    def to_dict(self):
+        return {
+            'data': self.data,
+            'last_modified': self.last_modified.timestamp(),
+            'fetched_at': self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        last_modified = datetime.fromtimestamp(payload['last_modified'], timezone.utc)
+        return cls(payload['data'], last_modified, payload['fetched_at'])
+
+
+class SnapshotCache:
+    """Single-flight TTL cache around ``loader() -> (data, last_modified)``."""
+
+    def __init__(self, loader, ttl=2.0, shared_path=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.shared_path = shared_path
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._async_lock = None
+        self.hits = 0
+        self.loads = 0
+
+    def _fresh(self, snapshot):
+        return snapshot is not None and snapshot.age < self.ttl
+
+    def get(self):
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            self.hits += 1
+            return snapshot
+        with self._lock:
+            # Whoever held the lock may have refreshed it already
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                self.hits += 1
+                return snapshot
+            snapshot = self._read_shared()
+            if not self._fresh(snapshot):
+                data, last_modified = self.loader()
+                snapshot = Snapshot(data, last_modified)
+                self.loads += 1
+                self._write_shared(snapshot)
+            self._snapshot = snapshot
+            return snapshot
+
+    async def get_async(self, loader):
+        """``get`` with ``await loader()`` in place of ``self.loader()``."""
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            self.hits += 1
+            return snapshot
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                self.hits += 1
+                return snapshot
+            snapshot = self._read_shared()
+            if not self._fresh(snapshot):
+                data, last_modified = await loader()
+                snapshot = Snapshot(data, last_modified)
+                self.loads += 1
+                self._write_shared(snapshot)
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _read_shared(self):
+        if not self.shared_path:
+            return None
+        try:
+            with open(self.shared_path, encoding='utf-8') as f:
+                return Snapshot.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_shared(self, snapshot):
+        if not self.shared_path:
+            return
+        tmp_path = f"{self.shared_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot.to_dict(), f, default=str)
+            os.replace(tmp_path, self.shared_path)
+        except OSError as e:
+            print(f"Error writing shared snapshot {self.shared_path}: {e}")
@@ -0,0 +1,307 @@
+"""
+Compact binary encoding of spin grids.
+
+A 5x3 grid is packed into one big-endian 64-bit word (8 bytes): the top
+nibble holds the codec version and the remaining fifteen nibbles hold the
+cells in reel-major order (``grid[0][0]``, ``grid[0][1]``, ...), each as an
+index into that version's symbol dictionary. Wild positions and symbol counts
+are derived from the grid on decode instead of being stored.
+
+Dictionaries are frozen per version: adding or reordering symbols means a new
+version, so rows written earlier still decode with the dictionary they were
+written with.
+
+Version 15 is reserved for derived spins (``provenance.py``): instead of
+cells, the word holds a game version id (16 bits) and the wallet's spin
+counter (44 bits), from which the grid is regenerated on demand.
+
+Backfill existing rows (and optionally drop their JSON copies) with the
+app stopped::
+
+    python spin_codec.py migrate [--drop-json]
+"""
+import argparse
+import json
+from collections import Counter
+
+from sqlalchemy import inspect, text
+
+CODEC_VERSION = 1
+
+SYMBOL_DICTIONARIES = {
+    1: (
+        'wooden_a', 'wooden_k', 'wooden_arch', 'snake', 'gorilla', 'jaguar', 'crocodile',
+        'gator', 'leopard', 'dragon', 'sloth', 'wild_2x', 'wild_3x', 'wild_5x',
+    ),
+}
+
+DERIVED_VERSION = 0xF
+COUNTER_BITS = 44
+MAX_GAME_VERSION = 0xFFFF
+MAX_COUNTER = (1 << COUNTER_BITS) - 1
+
+REEL_COUNT = 5
+ROW_COUNT = 3
+CELL_COUNT = REEL_COUNT * ROW_COUNT
+VERSION_SHIFT = 4 * CELL_COUNT
+
+_CODES = {version: {symbol: code for code, symbol in enumerate(symbols)}
+          for version, symbols in SYMBOL_DICTIONARIES.items()}
+
+
+def encode_codes(grid, version=CODEC_VERSION):
+    """Pack a reel-major grid of symbol codes into 8 bytes."""
+    word = version
+    for reel in grid:
+        for code in reel:
+            word = (word << 4) | code
+    return word.to_bytes(8, 'big')
+
+
+def encode(result, version=CODEC_VERSION):
+    """Pack a reel-major grid of symbol names (as returned by ``/spin``)."""
+    codes = _CODES[version]
+    return encode_codes([[codes[symbol] for symbol in reel] for reel in result], version)
+
+
+def encode_derived(game_version, counter):
+    """Pack the reference of a derived spin into 8 bytes."""
+    if not 0 <= game_version <= MAX_GAME_VERSION or not 0 <= counter <= MAX_COUNTER:
+        raise ValueError(f"Derived spin reference out of range: {game_version}/{counter}")
+    word = (DERIVED_VERSION << VERSION_SHIFT) | (game_version << COUNTER_BITS) | counter
+    return word.to_bytes(8, 'big')
+
+
+def is_derived(blob):
+    return blob[0] >> 4 == DERIVED_VERSION
+
+
+def decode_derived(blob):
+    """Return ``(game_version, counter)`` of a derived spin."""
+    word = int.from_bytes(blob, 'big')
+    if word >> VERSION_SHIFT != DERIVED_VERSION:
+        raise ValueError("Not a derived spin")
+    return (word >> COUNTER_BITS) & MAX_GAME_VERSION, word & MAX_COUNTER
+
+
+def decode_codes(blob):
+    """Return ``(version, grid)`` with the grid as symbol codes."""
+    word = int.from_bytes(blob, 'big')
+    version = word >> VERSION_SHIFT
+    if version == DERIVED_VERSION:
+        raise ValueError("Derived spin: regenerate the grid with provenance.replay")
+    if version not in SYMBOL_DICTIONARIES:
+        raise ValueError(f"Unknown spin codec version {version}")
+    cells = [(word >> (4 * (CELL_COUNT - 1 - i))) & 0xF for i in range(CELL_COUNT)]
+    return version, [cells[x * ROW_COUNT:(x + 1) * ROW_COUNT] for x in range(REEL_COUNT)]
+
+
+def decode(blob):
+    """Unpack 8 bytes into a reel-major grid of symbol names."""
+    version, grid = decode_codes(blob)
+    symbols = SYMBOL_DICTIONARIES[version]
+    return [[symbols[code] for code in reel] for reel in grid]
+
+
+def _shifts():
+    import numpy as np
+
+    # Bit offset of every cell, reel-major, first cell in the highest nibble
+    return np.arange(CELL_COUNT - 1, -1, -1, dtype=np.uint64) * np.uint64(4)
+
+
+def encode_many(grids, version=CODEC_VERSION):
+    """Pack an ``(N, 5, 3)`` array of symbol codes into an ``(N,)`` ``>u8`` array."""
+    import numpy as np
+
+    cells = np.asarray(grids, dtype=np.uint64).reshape(-1, CELL_COUNT)
+    words = np.bitwise_or.reduce(cells << _shifts(), axis=1)
+    words |= np.uint64(version) << np.uint64(VERSION_SHIFT)
+    return words.astype('>u8')
+
+
+def decode_many(blobs):
+    """
+    Unpack a sequence of 8-byte values (or a ``>u8`` array).
+
+    Returns ``(versions, grids)``: an ``(N,)`` array of codec versions and an
+    ``(N, 5, 3)`` uint8 array of symbol codes.
+    """
+    import numpy as np
+
+    if isinstance(blobs, np.ndarray):
+        words = blobs.astype(np.uint64)
+    else:
+        words = np.frombuffer(b''.join(blobs), dtype='>u8').astype(np.uint64)
+    versions = (words >> np.uint64(VERSION_SHIFT)).astype(np.uint8)
+    unknown = set(np.unique(versions).tolist()) - set(SYMBOL_DICTIONARIES)
+    if unknown:
+        raise ValueError(f"Unknown spin codec versions {sorted(unknown)}")
+    cells = (words[:, None] >> _shifts()) & np.uint64(0xF)
+    return versions, cells.astype(np.uint8).reshape(-1, REEL_COUNT, ROW_COUNT)
+
+
+def to_bytes(words):
+    """Split a ``>u8`` array from ``encode_many`` into per-row byte strings."""
+    import numpy as np
+
+    raw = np.asarray(words, dtype='>u8').tobytes()
+    return [raw[i:i + 8] for i in range(0, len(raw), 8)]
+
+
+def wild_positions(result):
+    return [[x, y] for x, reel in enumerate(result)
+            for y, symbol in enumerate(reel) if symbol.startswith('wild_')]
+
+
+def symbol_counts(result):
+    return dict(Counter(symbol for reel in result for symbol in reel))
+
+
+def json_columns(blob):
+    """The legacy JSON columns of ``SpinResult`` for an encoded grid."""
+    result = decode(blob)
+    return {
+        'result_matrix': json.dumps(result, separators=(',', ':')),
+        'wild_positions': json.dumps(wild_positions(result), separators=(',', ':')),
+        'symbol_counts': json.dumps(symbol_counts(result), separators=(',', ':')),
+    }
+
+
+def prepare_schema(engine):
+    """
+    Bring an existing ``spin_results`` table up to the binary layout.
+
+    Adds the ``result_codes`` column when it is missing and, on PostgreSQL,
+    relaxes NOT NULL on ``result_matrix``. Returns False while new rows still
+    have to carry the JSON columns (a SQLite table created before the codec,
+    until ``migrate --drop-json`` rebuilds it).
+    """
+    from models import SpinResult
+
+    inspector = inspect(engine)
+    if not inspector.has_table(SpinResult.__tablename__):
+        return True
+    columns = {column['name']: column for column in inspector.get_columns(SpinResult.__tablename__)}
+    json_optional = columns['result_matrix']['nullable']
+    try:
+        with engine.begin() as conn:
+            if 'result_codes' not in columns:
+                column_type = SpinResult.__table__.c.result_codes.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {SpinResult.__tablename__} "
+                                  f"ADD COLUMN result_codes {column_type}"))
+            if not json_optional and engine.dialect.name == 'postgresql':
+                conn.execute(text(f"ALTER TABLE {SpinResult.__tablename__} "
+                                  f"ALTER COLUMN result_matrix DROP NOT NULL"))
+                json_optional = True
+    except Exception as e:
+        # Usually another worker applied the same change first
+        print(f"Spin codec schema upgrade skipped: {e}")
+        return _json_optional(engine)
+    return json_optional
+
+
+def _json_optional(engine):
+    from models import SpinResult
+
+    columns = {column['name']: column
+               for column in inspect(engine).get_columns(SpinResult.__tablename__)}
+    return 'result_codes' in columns and columns['result_matrix']['nullable']
+
+
+def backfill(batch_size=5000):
+    """Encode ``result_matrix`` into ``result_codes`` for rows that lack it."""
+    from sqlalchemy import select, update
+
+    from database import db
+    from models import SpinResult
+
+    codes = _CODES[CODEC_VERSION]
+    last_id = 0
+    converted = skipped = 0
+    while True:
+        rows = db.session.execute(
+            select(SpinResult.id, SpinResult.result_matrix)
+            .where(SpinResult.id > last_id,
+                   SpinResult.result_codes.is_(None),
+                   SpinResult.result_matrix.is_not(None))
+            .order_by(SpinResult.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        ids, grids = [], []
+        for row in rows:
+            try:
+                grid = [[codes[symbol] for symbol in reel] for reel in json.loads(row.result_matrix)]
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            if len(grid) != REEL_COUNT or any(len(reel) != ROW_COUNT for reel in grid):
+                skipped += 1
+                continue
+            ids.append(row.id)
+            grids.append(grid)
+        if ids:
+            blobs = to_bytes(encode_many(grids))
+            db.session.execute(update(SpinResult),
+                               [{'id': i, 'result_codes': b} for i, b in zip(ids, blobs)])
+            db.session.commit()
+            converted += len(ids)
+        print(f"\rBackfilled {converted:,} rows (skipped {skipped:,})", end='', flush=True)
+    print()
+    return converted, skipped
+
+
+def drop_json(engine):
+    """Make the JSON columns optional and clear them where codes exist."""
+    from database import db
+    from models import SpinResult
+
+    table = SpinResult.__table__
+    if not prepare_schema(engine):
+        # SQLite cannot drop NOT NULL in place; rebuild the table from the model
+        existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+        names = ', '.join(column.name for column in table.columns if column.name in existing)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {table.name}_legacy"))
+            table.create(conn)
+            conn.execute(text(f"INSERT INTO {table.name} ({names}) "
+                              f"SELECT {names} FROM {table.name}_legacy"))
+            conn.execute(text(f"DROP TABLE {table.name}_legacy"))
+    cleared = db.session.execute(
+        text(f"UPDATE {table.name} SET result_matrix = NULL, wild_positions = NULL, "
+             f"symbol_counts = NULL WHERE result_codes IS NOT NULL AND result_matrix IS NOT NULL")
+    ).rowcount
+    db.session.commit()
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT').execute(text("VACUUM"))
+    else:
+        print(f"Run VACUUM (FULL) {table.name} to return the freed space to the OS")
+    return cleared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spin result codec tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help="backfill result_codes for existing rows")
+    migrate.add_argument('--batch-size', type=int, default=5000)
+    migrate.add_argument('--drop-json', action='store_true',
+                         help="clear the JSON columns once their rows are encoded")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    from database import db
+
+    with create_app().app_context():
+        converted, skipped = backfill(args.batch_size)
+        print(f"Encoded {converted:,} rows, {skipped:,} could not be parsed")
+        if args.drop_json:
+            cleared = drop_json(db.engine)
+            print(f"Cleared JSON columns on {cleared:,} rows")
+
+
+if __name__ == "__main__":
+    main()
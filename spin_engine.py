@@ -0,0 +1,75 @@
+from itertools import accumulate
+
+import game_config
+from rng import rng_source
+
+
+class SpinEngine:
+    """
+    Draws reel grids from cumulative weight tables compiled once per worker.
+
+    Symbols are handled as integer codes (their index in ``symbols``); names
+    are only materialized for the JSON response.
+    """
+
+    def __init__(self, symbols, reel_weights, row_count):
+        self.symbols = tuple(symbols)
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        self.reel_count = len(reel_weights)
+        self.row_count = row_count
+        self.reel_weights = [tuple(weights) for weights in reel_weights]
+
+        # Reels sharing a weight table are drawn together in one batch
+        groups = {}
+        for reel_index, weights in enumerate(self.reel_weights):
+            groups.setdefault(weights, []).append(reel_index)
+        self._code_range = range(len(self.symbols))
+        self._draw_groups = [
+            (list(accumulate(weights)), reel_indexes, len(reel_indexes) * row_count)
+            for weights, reel_indexes in groups.items()
+        ]
+
+    @classmethod
+    def from_game(cls, game):
+        return cls(game.symbols, game.reel_weights, game.row_count)
+
+    def spin_codes(self, rng=None):
+        """
+        Return a reel-major grid (``grid[reel][row]``) of symbol codes.
+
+        Draws from ``rng`` (anything with ``random.Random.choices``), by
+        default the app's configured generator.
+        """
+        if rng is None:
+            rng = rng_source.generator
+        grid = [None] * self.reel_count
+        rows = self.row_count
+        for cum_weights, reel_indexes, count in self._draw_groups:
+            drawn = rng.choices(self._code_range, cum_weights=cum_weights, k=count)
+            for offset, reel_index in enumerate(reel_indexes):
+                grid[reel_index] = drawn[offset * rows:(offset + 1) * rows]
+        return grid
+
+    def spin(self, rng=None):
+        """Return a reel-major grid of symbol names, as sent to the client."""
+        symbols = self.symbols
+        return [[symbols[code] for code in reel] for reel in self.spin_codes(rng)]
+
+    def draw_codes(self, count, rng):
+        """
+        Draw ``count`` grids at once with a NumPy ``Generator``.
+
+        Returns a ``(count, reels, rows)`` uint8 array of symbol codes, drawn
+        from the same integer weight tables as ``spin_codes``.
+        """
+        import numpy as np
+
+        grids = np.empty((count, self.reel_count, self.row_count), dtype=np.uint8)
+        for reel_index, weights in enumerate(self.reel_weights):
+            cum_weights = np.cumsum(weights)
+            draws = rng.integers(0, cum_weights[-1], size=(count, self.row_count))
+            grids[:, reel_index, :] = np.searchsorted(cum_weights, draws, side='right')
+        return grids
+
+
+engine = game_config.GAME.engine
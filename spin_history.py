@@ -0,0 +1,340 @@
+"""
+Time-partitioned spin ledger and keyset-paginated history reads.
+
+Spins are stored in one table per calendar month (UTC), ``spin_results_YYYYMM``.
+On PostgreSQL these are native range partitions of ``spin_results_log``, so
+inserts go to the parent and are routed by the server; on SQLite they are
+plain tables and the ledger routes each row itself. Either way a history read
+walks the months newest-first and pages inside each one by the
+``(timestamp, id)`` keyset on a composite index, so the cost of a page does
+not depend on how deep into the history it is.
+
+Dropping whole months implements retention. It happens at startup and
+when the first spin of a new month is written, or on demand with::
+
+    python spin_history.py maintain
+    python spin_history.py import-legacy [--delete]   # copy rows from spin_results
+    python spin_history.py history --wallet 42         # any wallet's spins (admin)
+"""
+import argparse
+import base64
+import re
+import threading
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    Identity,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    PrimaryKeyConstraint,
+    Table,
+    inspect,
+    literal_column,
+    select,
+    text,
+    tuple_,
+)
+
+from database import db
+
+PARENT_TABLE = 'spin_results_log'
+PARTITION_PREFIX = 'spin_results_'
+_PARTITION_RE = re.compile(r'^spin_results_(\d{4})(\d{2})$')
+
+HISTORY_COLUMNS = ('id', 'timestamp', 'wallet_id', 'bet_amount', 'win_amount', 'result_codes',
+                   'winning_lines', 'is_bonus_spin')
+
+
+def month_start(timestamp):
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def encode_cursor(timestamp, spin_id):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{spin_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(timestamp, id)``; raises ValueError for a malformed cursor."""
+    try:
+        timestamp, spin_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(spin_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}") from None
+
+
+class SpinHistory:
+    """Monthly partitions of the spin ledger: creation, routing, retention, reads."""
+
+    def __init__(self, app=None):
+        self.retention_months = 12
+        self._metadata = MetaData()
+        self._tables = {}
+        self._months = None
+        # Month of the newest row routed so far; a change triggers maintenance
+        self._current = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 0 keeps every month
+        self.retention_months = app.config.get('LEDGER_RETENTION_MONTHS', self.retention_months)
+
+    @property
+    def _native(self):
+        return db.engine.dialect.name == 'postgresql'
+
+    def _columns(self):
+        return [
+            Column('timestamp', DateTime, nullable=False, default=datetime.utcnow),
+            Column('wallet_id', Integer, nullable=True),
+            Column('bet_amount', Float, nullable=False),
+            Column('win_amount', Float, nullable=False),
+            Column('result_codes', LargeBinary(8), nullable=False),
+            Column('bonus_spins_awarded', Integer, default=0),
+            Column('is_bonus_spin', Boolean, default=False),
+            Column('is_respin', Boolean, default=False),
+            Column('winning_lines', Integer, default=0),
+        ]
+
+    def _indexes(self, table):
+        name = table.name
+        return [
+            Index(f"ix_{name}_ts", table.c.timestamp, table.c.id),
+            Index(f"ix_{name}_wallet", table.c.wallet_id, table.c.timestamp, table.c.id),
+            # Partial index for win-only pages
+            Index(f"ix_{name}_wins", table.c.timestamp, table.c.id,
+                  sqlite_where=table.c.win_amount > literal_column('0'),
+                  postgresql_where=table.c.win_amount > literal_column('0')),
+        ]
+
+    def _table(self, name):
+        table = self._tables.get(name)
+        if table is not None:
+            return table
+        if name == PARENT_TABLE:
+            # Partition key has to be part of the primary key
+            table = Table(name, self._metadata,
+                          Column('id', BigInteger, Identity(), nullable=False),
+                          *self._columns(),
+                          PrimaryKeyConstraint('id', 'timestamp'),
+                          postgresql_partition_by='RANGE (timestamp)')
+            self._indexes(table)
+        elif self._native:
+            # Partitions inherit columns and indexes from the parent; this copy
+            # is only used to address one month directly in queries
+            table = Table(name, self._metadata,
+                          Column('id', BigInteger, primary_key=True), *self._columns())
+        else:
+            table = Table(name, self._metadata,
+                          Column('id', Integer, primary_key=True), *self._columns())
+            self._indexes(table)
+        self._tables[name] = table
+        return table
+
+    def months(self):
+        """Months that have a partition, newest first."""
+        if self._months is None:
+            with self._lock:
+                if self._months is None:
+                    found = set()
+                    for name in inspect(db.engine).get_table_names():
+                        match = _PARTITION_RE.match(name)
+                        if match:
+                            found.add(datetime(int(match.group(1)), int(match.group(2)), 1))
+                    self._months = found
+        return sorted(self._months, reverse=True)
+
+    def ensure_month(self, month):
+        """Create the partition for ``month`` if it does not exist yet."""
+        if month in self.months():
+            return False
+        name = partition_name(month)
+        try:
+            with db.engine.begin() as conn:
+                if self._native:
+                    self._table(PARENT_TABLE).create(conn, checkfirst=True)
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"))
+                else:
+                    self._table(name).create(conn, checkfirst=True)
+        except Exception:
+            # Another worker may have created it between the check and the CREATE
+            if not inspect(db.engine).has_table(name):
+                raise
+        self._months.add(month)
+        return True
+
+    def prune(self, now=None):
+        """Drop partitions older than the retention window; returns their names."""
+        if not self.retention_months:
+            return []
+        cutoff = month_start(now or datetime.utcnow())
+        for _ in range(self.retention_months - 1):
+            cutoff = datetime(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1)
+        dropped = []
+        for month in self.months():
+            if month < cutoff:
+                name = partition_name(month)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                self._months.discard(month)
+                self._tables.pop(name, None)
+                dropped.append(name)
+        if dropped:
+            print(f"Dropped expired spin partitions: {', '.join(dropped)}")
+        return dropped
+
+    def maintain(self, now=None):
+        """Create this month's and next month's partitions and apply retention."""
+        self._months = None
+        month = month_start(now or datetime.utcnow())
+        self._current = month
+        self.ensure_month(month)
+        self.ensure_month(next_month(month))
+        return self.prune(now)
+
+    def route(self, rows):
+        """Group ledger rows by the table they have to be inserted into."""
+        newest = month_start(max(row['timestamp'] for row in rows))
+        if self._current is None or newest > self._current:
+            self.maintain(newest)
+        if self._native:
+            for month in {month_start(row['timestamp']) for row in rows}:
+                self.ensure_month(month)
+            return {self._table(PARENT_TABLE): rows}
+        routed = {}
+        for row in rows:
+            month = month_start(row['timestamp'])
+            routed.setdefault(month, []).append(row)
+        for month in routed:
+            self.ensure_month(month)
+        return {self._table(partition_name(month)): batch for month, batch in routed.items()}
+
+    def page(self, limit=50, cursor=None, wallet_id=None, min_bet=None, max_bet=None,
+             wins_only=False):
+        """
+        Return ``(rows, next_cursor)``, newest spins first.
+
+        ``cursor`` is the ``next_cursor`` of the previous page; it is None on
+        the last page.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        rows = []
+        for month in self.months():
+            if after and month > after[0]:
+                continue
+            table = self._table(partition_name(month))
+            query = (select(*(table.c[name] for name in HISTORY_COLUMNS))
+                     .order_by(table.c.timestamp.desc(), table.c.id.desc())
+                     .limit(limit + 1 - len(rows)))
+            if after:
+                query = query.where(tuple_(table.c.timestamp, table.c.id) < tuple_(*after))
+            if wallet_id is not None:
+                query = query.where(table.c.wallet_id == wallet_id)
+            if min_bet is not None:
+                query = query.where(table.c.bet_amount >= min_bet)
+            if max_bet is not None:
+                query = query.where(table.c.bet_amount <= max_bet)
+            if wins_only:
+                query = query.where(table.c.win_amount > literal_column('0'))
+            rows.extend(db.session.execute(query).all())
+            if len(rows) > limit:
+                break
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+    def import_legacy(self, batch_size=5000, delete=False):
+        """Copy rows of the unpartitioned ``spin_results`` table into partitions."""
+        from sqlalchemy import delete as sql_delete, insert
+
+        import spin_codec
+        from models import SpinResult
+
+        last_id = 0
+        copied = 0
+        while True:
+            legacy = db.session.execute(
+                select(SpinResult).where(SpinResult.id > last_id).order_by(SpinResult.id).limit(batch_size)
+            ).scalars().all()
+            if not legacy:
+                break
+            last_id = legacy[-1].id
+            rows = [{
+                'timestamp': spin.timestamp or datetime.utcnow(),
+                'wallet_id': None,
+                'bet_amount': spin.bet_amount,
+                'win_amount': spin.win_amount,
+                'result_codes': spin.result_codes or spin_codec.encode(spin.result),
+                'bonus_spins_awarded': spin.bonus_spins_awarded,
+                'is_bonus_spin': spin.is_bonus_spin,
+                'is_respin': spin.is_respin,
+                'winning_lines': spin.winning_lines,
+            } for spin in legacy]
+            for table, batch in self.route(rows).items():
+                db.session.execute(insert(table), batch)
+            if delete:
+                db.session.execute(sql_delete(SpinResult).where(SpinResult.id <= last_id))
+            db.session.commit()
+            copied += len(rows)
+            print(f"\rCopied {copied:,} rows", end='', flush=True)
+        print()
+        return copied
+
+
+spin_history = SpinHistory()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spin ledger partition tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('maintain', help="create upcoming partitions and drop expired ones")
+    legacy = commands.add_parser('import-legacy', help="move spin_results rows into partitions")
+    legacy.add_argument('--batch-size', type=int, default=5000)
+    legacy.add_argument('--delete', action='store_true', help="delete rows once copied")
+    history = commands.add_parser('history', help="print a page of spins of any wallet")
+    history.add_argument('--wallet', type=int, help="wallet id (default: every wallet)")
+    history.add_argument('--limit', type=int, default=50)
+    history.add_argument('--cursor', help="next_cursor of the previous page")
+    history.add_argument('--wins-only', action='store_true')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    with create_app().app_context():
+        if args.command == 'maintain':
+            spin_history.maintain()
+            print(f"Partitions: {', '.join(partition_name(m) for m in spin_history.months())}")
+        elif args.command == 'history':
+            rows, next_cursor = spin_history.page(args.limit, args.cursor, args.wallet, wins_only=args.wins_only)
+            for row in rows:
+                print(f"{row.timestamp:%Y-%m-%d %H:%M:%S}  wallet {row.wallet_id or '-':>8}  "
+                      f"bet {row.bet_amount:>8.2f}  win {row.win_amount:>10.2f}"
+                      f"{'  bonus' if row.is_bonus_spin else ''}")
+            if next_cursor:
+                print(f"next cursor: {next_cursor}")
+        else:
+            copied = spin_history.import_legacy(args.batch_size, args.delete)
+            print(f"Copied {copied:,} legacy rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold-start timing: how long a worker spends in each phase before it serves.
+
+Kept free of third-party imports so it can be imported before anything else
+and measure the imports themselves.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+
+def _process_age():
+    """Seconds since this process started (Linux only, else None)."""
+    try:
+        with open('/proc/self/stat', encoding='ascii') as f:
+            # Field 22 (starttime) follows the parenthesised command name
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', encoding='ascii') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+
+
+class StartupTimer:
+    """Records named startup phases and the first request of a worker."""
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        # Time between process start and this module being imported
+        age = _process_age()
+        self.interpreter_ms = age * 1000 if age is not None else None
+        self.phases = []
+        self.first_request_ms = None
+        self.ready_ms = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - started) * 1000))
+
+    def install(self, app):
+        """Time the first request served by ``app`` and log the report after it."""
+        state = {}
+
+        @app.before_request
+        def _first_request_started():
+            if self.first_request_ms is None and 'started' not in state:
+                state['started'] = time.perf_counter()
+
+        @app.teardown_request
+        def _first_request_finished(exc=None):
+            if self.first_request_ms is None and 'started' in state:
+                now = time.perf_counter()
+                self.first_request_ms = (now - state['started']) * 1000
+                self.ready_ms = (state['started'] - self.created) * 1000
+                print(f"Cold start: {self.summary()}")
+
+    def report(self):
+        return {
+            'pid': os.getpid(),
+            'interpreter_ms': round(self.interpreter_ms, 1) if self.interpreter_ms is not None else None,
+            'phases_ms': {name: round(ms, 1) for name, ms in self.phases},
+            'until_first_request_ms': round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            'first_request_ms': round(self.first_request_ms, 1) if self.first_request_ms is not None else None,
+        }
+
+    def summary(self):
+        parts = []
+        if self.interpreter_ms is not None:
+            parts.append(f"interpreter {self.interpreter_ms:.0f}ms")
+        parts += [f"{name} {ms:.0f}ms" for name, ms in self.phases]
+        if self.ready_ms is not None:
+            parts.append(f"idle until first request {self.ready_ms - sum(ms for _, ms in self.phases):.0f}ms")
+        if self.first_request_ms is not None:
+            parts.append(f"first request {self.first_request_ms:.0f}ms")
+        return ", ".join(parts)
+
+
+startup_timer = StartupTimer()
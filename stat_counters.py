@@ -0,0 +1,172 @@
+"""
+Sharded, contention-free counters behind ``/statistics``.
+
+The totals live in ``STAT_SHARDS`` rows of the ``statistics`` table (ids
+``1..STAT_SHARDS``). A process always writes to the shard picked by its pid,
+so concurrent gunicorn workers update different rows, and every write is a
+single ``UPDATE ... SET x = x + :delta`` (``biggest_win`` takes the max), which
+is atomic on both SQLite and PostgreSQL. Readers sum the shards.
+
+Increments made with ``add`` are accumulated in-process and written by a
+background thread every ``STAT_FLUSH_INTERVAL`` seconds; callers that already
+hold a transaction (the spin ledger) use ``apply`` to write them inline.
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+
+# Summed across shards
+SUM_FIELDS = ('total_spins', 'total_wins', 'total_bonus_games', 'total_bet', 'total_won')
+# Merged with max()
+MAX_FIELDS = ('biggest_win',)
+
+
+class StatCounters:
+    """In-process accumulator flushed as atomic increments to a sharded row."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.shards = 8
+        self.flush_interval = 1.0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._deltas = {}
+        self._maxima = {}
+        self._thread = None
+        self._stopping = threading.Event()
+        self.flushes = 0
+        self.failed_flushes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.shards = app.config.get('STAT_SHARDS', self.shards)
+        self.flush_interval = app.config.get('STAT_FLUSH_INTERVAL', self.flush_interval)
+        atexit.register(self.shutdown)
+
+    @property
+    def shard_id(self):
+        return os.getpid() % self.shards + 1
+
+    def ensure_shards(self):
+        """Create any missing shard rows; returns how many were added."""
+        from models import Statistics
+
+        existing = set(db.session.scalars(select(Statistics.id)))
+        missing = [shard for shard in range(1, self.shards + 1) if shard not in existing]
+        if not missing:
+            return 0
+        try:
+            db.session.add_all(Statistics(id=shard) for shard in missing)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created them first
+            db.session.rollback()
+            return 0
+        return len(missing)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Increments inherited from the parent were flushed (or belong) there
+            self._deltas = {}
+            self._maxima = {}
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='stat-counters', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def add(self, maxima=None, **deltas):
+        """Accumulate increments (and max-merged values) for the next flush."""
+        self._ensure_started()
+        with self._lock:
+            for name, delta in deltas.items():
+                self._deltas[name] = self._deltas.get(name, 0) + delta
+            for name, value in (maxima or {}).items():
+                self._maxima[name] = max(self._maxima.get(name, value), value)
+
+    def apply(self, deltas, maxima=None):
+        """
+        Write increments to this process's shard in the current session.
+
+        The caller commits; used by writers that already have a transaction
+        open so their rows and counters land together.
+        """
+        from models import Statistics
+
+        values = {name: func.coalesce(getattr(Statistics, name), 0) + delta
+                  for name, delta in deltas.items() if delta}
+        for name, value in (maxima or {}).items():
+            column = func.coalesce(getattr(Statistics, name), 0)
+            values[name] = case((column < value, value), else_=column)
+        if not values:
+            return
+        values['last_updated'] = datetime.utcnow()
+
+        statement = update(Statistics).where(Statistics.id == self.shard_id).values(**values)
+        if db.session.execute(statement).rowcount == 0:
+            # Shard count was raised since startup
+            db.session.add(Statistics(id=self.shard_id))
+            db.session.flush()
+            db.session.execute(statement)
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            maxima, self._maxima = self._maxima, {}
+        if not deltas and not maxima:
+            return
+        try:
+            with self.app.app_context():
+                self.apply(deltas, maxima)
+                db.session.commit()
+            self.flushes += 1
+        except Exception as e:
+            print(f"Error flushing statistics counters: {e}")
+            self.failed_flushes += 1
+            with self.app.app_context():
+                db.session.rollback()
+            # Put them back so the next flush retries
+            self.add(maxima, **deltas)
+
+    def shutdown(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def totals(self):
+        """Merge all shards into one row of totals."""
+        return db.session.execute(self._totals_statement()).one()._asdict()
+
+    async def totals_async(self, session):
+        """``totals`` on an ``AsyncSession``."""
+        return (await session.execute(self._totals_statement())).one()._asdict()
+
+    def _totals_statement(self):
+        from models import Statistics
+
+        columns = [func.coalesce(func.sum(getattr(Statistics, name)), 0).label(name)
+                   for name in SUM_FIELDS]
+        columns += [func.coalesce(func.max(getattr(Statistics, name)), 0).label(name)
+                    for name in MAX_FIELDS]
+        columns.append(func.max(Statistics.last_updated).label('last_updated'))
+        return select(*columns)
+
+
+stat_counters = StatCounters()
@@ -1,3 +1,9 @@
+// Fingerprinted URLs written by build_assets.py and injected by index.html
+function assetUrl(path) {
+    const urls = window.ASSET_URLS || {};
+    return urls[path] || `/static/${path}`;
+}
+
 class LoadingManager {
     constructor() {
         console.log('LoadingManager: Constructor called');
@@ -72,6 +78,7 @@ class SlotMachine {
             this.symbolImages = new Map();
             this.spinning = false;
             this.currentBet = 10;
+            this.AUTOPLAY_SPINS = 25;
 
             // Initialize canvas
             this.canvas = document.getElementById('slotCanvas');
@@ -87,32 +94,36 @@ class SlotMachine {
             // Define available symbols with actual paths
             const symbols = [
                 // Basic symbols
-                { name: 'wooden_a', path: '/static/images/symbols/wooden_a.png' },
-                { name: 'wooden_k', path: '/static/images/symbols/wooden_k.png' },
-                { name: 'wooden_arch', path: '/static/images/symbols/wooden_arch.png' },
+                { name: 'wooden_a', path: assetUrl('images/symbols/wooden_a.png') },
+                { name: 'wooden_k', path: assetUrl('images/symbols/wooden_k.png') },
+                { name: 'wooden_arch', path: assetUrl('images/symbols/wooden_arch.png') },
 
                 // Animal symbols
-                { name: 'snake', path: '/static/images/symbols/snake.png' },
-                { name: 'gorilla', path: '/static/images/symbols/gorilla.png' },
-                { name: 'jaguar', path: '/static/images/symbols/jaguar.png' },
-                { name: 'crocodile', path: '/static/images/symbols/crocodile.png' },
-                { name: 'gator', path: '/static/images/symbols/gator.png' },
-                { name: 'leopard', path: '/static/images/symbols/leopard.png' },
-                { name: 'dragon', path: '/static/images/symbols/dragon.png' },
+                { name: 'snake', path: assetUrl('images/symbols/snake.png') },
+                { name: 'gorilla', path: assetUrl('images/symbols/gorilla.png') },
+                { name: 'jaguar', path: assetUrl('images/symbols/jaguar.png') },
+                { name: 'crocodile', path: assetUrl('images/symbols/crocodile.png') },
+                { name: 'gator', path: assetUrl('images/symbols/gator.png') },
+                { name: 'leopard', path: assetUrl('images/symbols/leopard.png') },
+                { name: 'dragon', path: assetUrl('images/symbols/dragon.png') },
 
                 // Special symbols
-                { name: 'sloth', path: '/static/images/symbols/Picsart_25-02-25_16-45-12-270.png' },
-                { name: 'wild_2x', path: '/static/images/symbols/Picsart_25-02-25_16-49-31-091.png' },
-                { name: 'wild_3x', path: '/static/images/symbols/Picsart_25-02-25_18-10-53-970.png' },
-                { name: 'wild_5x', path: '/static/images/symbols/Picsart_25-02-25_18-12-23-513.png' }
+                { name: 'sloth', path: assetUrl('images/symbols/Picsart_25-02-25_16-45-12-270.png') },
+                { name: 'wild_2x', path: assetUrl('images/symbols/Picsart_25-02-25_16-49-31-091.png') },
+                { name: 'wild_3x', path: assetUrl('images/symbols/Picsart_25-02-25_18-10-53-970.png') },
+                { name: 'wild_5x', path: assetUrl('images/symbols/Picsart_25-02-25_18-12-23-513.png') }
             ];
 
             // Set total assets
             this.loadingManager.totalAssets = symbols.length;
-            console.log(`SlotMachine: Will load ${symbols.length} symbols`);
 
-            // Load all symbols
-            for (const symbol of symbols) {
+            // Prefer the sprite atlas; only symbols missing from it load one by one
+            const fromAtlas = await this.loadSpriteAtlas(symbols);
+            const remaining = symbols.filter(symbol => !fromAtlas.has(symbol.name));
+            console.log(`SlotMachine: ${fromAtlas.size} symbols from atlas, will load ${remaining.length} symbols`);
+
+            // Load remaining symbols
+            for (const symbol of remaining) {
                 try {
                     console.log(`SlotMachine: Loading symbol ${symbol.name} from ${symbol.path}`);
                     const img = await this.loadingManager.loadImage(symbol.path);
@@ -139,6 +150,60 @@ class SlotMachine {
         }
     }
 
+    async loadSpriteAtlas(symbols) {
+        // Atlases are produced by build_sprites.py; without them nothing changes
+        let manifest;
+        try {
+            const response = await fetch(assetUrl('sprites/manifest.json'));
+            if (!response.ok) return new Set();
+            manifest = await response.json();
+        } catch (error) {
+            console.warn('SlotMachine: No sprite manifest, loading symbols individually');
+            return new Set();
+        }
+
+        // Smallest tier that covers the drawn size on this screen
+        const wanted = this.SYMBOL_SIZE * (window.devicePixelRatio || 1);
+        const tiers = Object.values(manifest.tiers).sort((a, b) => a.size - b.size);
+        const tier = tiers.find(t => t.size >= wanted) || tiers[tiers.length - 1];
+        if (!tier) return new Set();
+
+        const missing = symbols.filter(symbol => !(symbol.name in tier.frames)).length;
+        this.loadingManager.totalAssets = missing + 1;
+
+        // Formats are listed best first (avif, webp, png); fall through on decode errors
+        let atlas = null;
+        for (const format of manifest.formats) {
+            try {
+                atlas = await this.loadingManager.loadImage(assetUrl(`sprites/${tier.files[format]}`));
+                break;
+            } catch (error) {
+                console.warn(`SlotMachine: ${format} atlas not usable, trying next format`);
+            }
+        }
+        if (!atlas) {
+            this.loadingManager.totalAssets = symbols.length;
+            return new Set();
+        }
+
+        // Cut the atlas into one image per symbol so the drawing code stays unchanged
+        const loaded = new Set();
+        await Promise.all(Object.entries(tier.frames).map(([name, frame]) => new Promise(resolve => {
+            const canvas = document.createElement('canvas');
+            canvas.width = frame.w;
+            canvas.height = frame.h;
+            canvas.getContext('2d').drawImage(atlas, frame.x, frame.y, frame.w, frame.h, 0, 0, frame.w, frame.h);
+
+            const img = new Image();
+            img.onload = resolve;
+            img.onerror = resolve;
+            img.src = canvas.toDataURL();
+            this.symbolImages.set(name, img);
+            loaded.add(name);
+        })));
+        return loaded;
+    }
+
     createFallbackSymbol(symbol) {
         console.log(`SlotMachine: Creating fallback for ${symbol}`);
         const canvas = document.createElement('canvas');
@@ -222,6 +287,75 @@ class SlotMachine {
         if (spinButton) {
             spinButton.addEventListener('click', () => this.spin());
         }
+
+        const autoplayButton = document.getElementById('autoplayButton');
+        if (autoplayButton) {
+            autoplayButton.addEventListener('click', () => this.autoplay(this.AUTOPLAY_SPINS));
+        }
+    }
+
+    async autoplay(count) {
+        if (this.spinning) return;
+        this.spinning = true;
+
+        const buttons = ['spinButton', 'autoplayButton'].map(id => document.getElementById(id));
+        buttons.forEach(button => { if (button) button.disabled = true; });
+
+        try {
+            // Весь автоплей разрешается сервером одним запросом, результаты приходят потоком NDJSON
+            const body = new URLSearchParams({
+                bet: this.currentBet,
+                count: count,
+                stop_on_bonus: '1'
+            });
+            const response = await fetch('/spin_batch', { method: 'POST', body });
+            if (!response.ok) {
+                const error = await response.json();
+                throw new Error(error.error);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                for (const line of lines) {
+                    if (!line) continue;
+                    const spinResult = JSON.parse(line);
+                    if (spinResult.done) {
+                        console.log(`Autoplay stopped after ${spinResult.spins} spins: ${spinResult.stop_reason}`);
+                        this.updateCredits(spinResult.credits);
+                        continue;
+                    }
+                    await this.showServerSpin(spinResult);
+                }
+            }
+        } catch (error) {
+            console.error('Autoplay failed:', error);
+        }
+
+        buttons.forEach(button => { if (button) button.disabled = false; });
+        this.spinning = false;
+    }
+
+    async showServerSpin(spinResult) {
+        await this.animateSpin(spinResult.result);
+        this.reels = spinResult.result;
+        this.draw();
+        this.updateCredits(spinResult.credits);
+        if (spinResult.winnings > 0) {
+            this.showWinPopup(spinResult.winnings);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
+    updateCredits(credits) {
+        const creditDisplay = document.getElementById('creditDisplay');
+        if (creditDisplay) creditDisplay.textContent = credits.toFixed(2);
     }
 
     async spin() {
@@ -0,0 +1,43 @@
+"""``BatchEvaluator`` against ``calculate_winnings``, the per-spin payout path."""
+import random
+
+import pytest
+
+from app import calculate_winnings
+from evaluator import BatchEvaluator, evaluator
+
+GRIDS = 20000
+
+
+def wild_heavy_grids(seed, count, wild_share=0.4):
+    """Seeded 5x3 grids where about ``wild_share`` of the cells are wilds."""
+    rng = random.Random(seed)
+    wilds = [symbol for symbol in evaluator.symbols if symbol.startswith('wild_')]
+
+    def cell():
+        return rng.choice(wilds) if rng.random() < wild_share else rng.choice(evaluator.symbols)
+
+    return [[[cell() for _ in range(3)] for _ in range(5)] for _ in range(count)]
+
+
+@pytest.mark.parametrize('bet', [0.2, 1.0, 3.7, 100.0])
+def test_batch_matches_calculate_winnings(bet):
+    grids = wild_heavy_grids(7, GRIDS)
+    batch = evaluator.evaluate(evaluator.encode(grids), bet)
+    mismatches = [(grid, win) for grid, win in zip(grids, batch) if calculate_winnings(grid, bet) != win]
+    assert not mismatches
+    # The grids must actually exercise wins and multiplied wilds
+    assert sum(1 for win in batch if win) > GRIDS // 4
+
+
+def test_per_grid_bets_match():
+    grids = wild_heavy_grids(11, 2000)
+    bets = [0.2 + (i % 50) * 0.7 for i in range(len(grids))]
+    batch = evaluator.evaluate(evaluator.encode(grids), bets)
+    assert [calculate_winnings(grid, bet) for grid, bet in zip(grids, bets)] == list(batch)
+
+
+def test_all_wild_line_pays_nothing():
+    evaluator_ = BatchEvaluator.from_config()
+    grid = [['wild_2x'] * 3 for _ in range(5)]
+    assert evaluator_.evaluate(evaluator_.encode([grid]))[0] == calculate_winnings(grid, 1.0) == 0
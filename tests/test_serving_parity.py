@@ -0,0 +1,177 @@
+"""
+``main:app`` and ``asgi:app`` must give the same bodies and wallet effects.
+
+Each mode runs in its own process (the extensions are module-level
+singletons) on its own SQLite file with ``RNG_BACKEND=seeded``, plays the
+same requests and reports the responses, the wallet row and the ledger rows.
+Run directly, this file is that driver: ``python test_serving_parity.py
+sync|asgi``.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REQUESTS = [
+    ('GET', '/', None),
+    ('POST', '/spin', {'bet': '1'}),
+    ('POST', '/spin', {'bet': '2.5'}),
+    ('POST', '/spin', {'bet': '0.1'}),
+    ('POST', '/spin', {'bet': '1', 'game': 'tropical_25'}),
+    ('POST', '/spin', {'bet': '1', 'game': 'nope'}),
+    ('POST', '/spin_batch', {'bet': '1', 'count': '20'}),
+    ('POST', '/spin_batch', {'bet': '1', 'count': '50', 'loss_limit': '5'}),
+    ('POST', '/spin_batch', {'bet': '1', 'count': '0'}),
+    ('POST', '/buy_freespins', {'bet': '1'}),
+    ('POST', '/bonus_round', {}),
+    # The driver banks free spins in the wallet before this one
+    ('POST', '/bonus_round', {}),
+    ('POST', '/spin', {'bet': '1'}),
+]
+BANK_BEFORE = 11
+BANKED_SPINS = 50
+
+
+def decode(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        # NDJSON from /spin_batch, or the HTML page
+        lines = body.splitlines()
+        try:
+            return [json.loads(line) for line in lines]
+        except ValueError:
+            return None
+
+
+def bank_free_spins(path):
+    with sqlite3.connect(path) as con:
+        con.execute('UPDATE wallets SET bonus_spins = ?', (BANKED_SPINS,))
+
+
+def effects(path):
+    from ledger import ledger
+
+    ledger.shutdown()
+    with sqlite3.connect(path) as con:
+        wallets = con.execute('SELECT credits, bonus_spins, spin_counter FROM wallets ORDER BY id').fetchall()
+        tables = [name for name, in con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'spin_results_%' ORDER BY name")]
+        rows = []
+        for table in tables:
+            rows += con.execute(f'SELECT bet_amount, win_amount, hex(result_codes), is_bonus_spin, '
+                                f'bonus_spins_awarded, winning_lines, wallet_id FROM {table} ORDER BY id').fetchall()
+    return {'wallets': wallets, 'ledger': rows}
+
+
+def drive_sync(path):
+    from app import create_app
+    from bootstrap import bootstrap
+
+    app = create_app()
+    bootstrap(app)
+    client = app.test_client()
+    responses = []
+    for i, (method, url, form) in enumerate(REQUESTS):
+        if i == BANK_BEFORE:
+            bank_free_spins(path)
+        response = client.open(url, method=method, data=form)
+        responses.append((response.status_code, decode(response.get_data(as_text=True))))
+    return responses
+
+
+def drive_asgi(path):
+    import asyncio
+    from urllib.parse import urlencode
+
+    from asgi import app
+    from bootstrap import bootstrap
+
+    bootstrap(app.flask_app)
+    cookies = {}
+
+    async def call(method, url, form):
+        body = urlencode(form or {}).encode()
+        headers = [(b'host', b'localhost'), (b'content-type', b'application/x-www-form-urlencoded'),
+                   (b'content-length', str(len(body)).encode())]
+        if cookies:
+            headers.append((b'cookie', '; '.join(f"{k}={v}" for k, v in cookies.items()).encode()))
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': url, 'raw_path': url.encode(), 'query_string': b'',
+                 'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 1),
+                 'server': ('localhost', 80)}
+        sent = False
+        status, chunks = None, []
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {'type': 'http.disconnect'}
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                for name, value in message.get('headers', []):
+                    if name.lower() == b'set-cookie':
+                        cookie = value.decode().split(';', 1)[0]
+                        key, _, cookie_value = cookie.partition('=')
+                        cookies[key] = cookie_value
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await app(scope, receive, send)
+        return status, b''.join(chunks).decode()
+
+    async def run():
+        await app.quart_app.startup()
+        try:
+            responses = []
+            for i, (method, url, form) in enumerate(REQUESTS):
+                if i == BANK_BEFORE:
+                    bank_free_spins(path)
+                status, body = await call(method, url, form)
+                responses.append((status, decode(body)))
+            return responses
+        finally:
+            await app.quart_app.shutdown()
+
+    return asyncio.run(run())
+
+
+def run_mode(mode, tmp_path):
+    path = str(tmp_path / f"{mode}.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", RNG_BACKEND='seeded', RNG_SEED='1',
+               METRICS_ENABLED='0', SPIN_PROVENANCE='0', STATS_CACHE_TTL='0', SESSION_SECRET='parity',
+               PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), mode, path], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_sync_and_asgi_agree(tmp_path):
+    pytest.importorskip('quart')
+    sync, asgi = run_mode('sync', tmp_path), run_mode('asgi', tmp_path)
+    for request, sync_response, asgi_response in zip(REQUESTS, sync['responses'], asgi['responses']):
+        assert sync_response == asgi_response, request
+    assert sync['wallets'] == asgi['wallets']
+    assert sync['ledger'] == asgi['ledger']
+    # The script reaches the paths it is meant to compare
+    statuses = [status for status, _ in sync['responses']]
+    assert statuses.count(200) >= 9
+    # ... including free spins that win, where the bet and multiplier matter
+    assert any(row[3] and row[1] for row in sync['ledger'])
+
+
+if __name__ == '__main__':
+    mode, path = sys.argv[1], sys.argv[2]
+    responses = drive_sync(path) if mode == 'sync' else drive_asgi(path)
+    print(json.dumps({'responses': responses, **effects(path)}))
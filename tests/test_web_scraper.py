@@ -0,0 +1,81 @@
+"""``web_scraper`` against a stand-in HTTP server on 127.0.0.1."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from web_scraper import get_slot_standards
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    ``/etag`` revalidates with 304, ``/plain`` serves the same bytes without
+    validators, ``/flaky`` answers 503 once ``broken`` is set and ``/down``
+    always does.
+    """
+
+    broken = False
+
+    def do_GET(self):
+        if self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.reply(b'<p>etag page</p>', {'ETag': '"v1"'})
+        elif self.path == '/plain':
+            self.reply(b'<p>plain page</p>')
+        elif self.path == '/flaky' and not self.broken:
+            self.reply(b'<p>flaky page</p>')
+        else:
+            self.send_response(503)
+            self.end_headers()
+
+    def reply(self, body, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandIn.broken = False
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_rerun_revalidates_and_keeps_cached_text(server, tmp_path):
+    urls = [f"{server}/{path}" for path in ('etag', 'plain', 'flaky', 'down')]
+    extracted = []
+
+    def extract(html):
+        extracted.append(html)
+        return html.replace('<p>', '').replace('</p>', '')
+
+    def run():
+        return get_slot_standards(urls, output_path=str(tmp_path / 'out.txt'), cache_dir=str(tmp_path / 'cache'),
+                                  timeout=5, min_interval=0, extract=extract, extractor_name='test')
+
+    first = run()
+    assert [first[url] for url in urls] == ['extracted', 'extracted', 'extracted', 'failed']
+    assert len(extracted) == 3
+
+    StandIn.broken = True
+    second = run()
+    assert [second[url] for url in urls] == ['not_modified', 'unchanged', 'stale', 'failed']
+    # Nothing was extracted again
+    assert len(extracted) == 3
+    output = (tmp_path / 'out.txt').read_text(encoding='utf-8')
+    for text in ('etag page', 'plain page', 'flaky page'):
+        assert text in output
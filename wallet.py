@@ -0,0 +1,162 @@
+"""
+Server-side player wallets.
+
+Balances live in the ``wallets`` table and the session only carries the
+wallet id. Every balance change is one conditional ``UPDATE ... WHERE
+credits >= :required RETURNING credits, bonus_spins``: it either applies
+atomically and returns the new balance, or matches no row and changes
+nothing. Concurrent requests for the same wallet therefore cannot
+overdraw it or overwrite each other, across workers and nodes.
+
+Plain reads go through a small per-worker LRU cache with a short TTL; the
+cache is refreshed from the values each update returns.
+
+The ``*_async`` methods run the same statements on an SQLAlchemy
+``AsyncSession`` for the ASGI mode (``asgi.py``) and share the cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from database import db
+
+STARTING_CREDITS = 1000
+
+
+class WalletStore:
+    """Atomic debit/credit on wallet rows plus a read-through LRU cache."""
+
+    def __init__(self, app=None):
+        self.cache_size = 1024
+        self.cache_ttl = 1.0
+        self.starting_credits = STARTING_CREDITS
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache_size = app.config.get('WALLET_CACHE_SIZE', self.cache_size)
+        self.cache_ttl = app.config.get('WALLET_CACHE_TTL', self.cache_ttl)
+        self.starting_credits = app.config.get('WALLET_STARTING_CREDITS', self.starting_credits)
+
+    def _remember(self, wallet_id, balance):
+        with self._lock:
+            self._cache[wallet_id] = (time.monotonic() + self.cache_ttl, balance)
+            self._cache.move_to_end(wallet_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cached(self, wallet_id):
+        with self._lock:
+            entry = self._cache.get(wallet_id)
+            if entry is None:
+                return None
+            expires, balance = entry
+            if expires < time.monotonic():
+                del self._cache[wallet_id]
+                return None
+            self._cache.move_to_end(wallet_id)
+            return balance
+
+    def create(self, credits=None, bonus_spins=0):
+        """Open a wallet and return its id."""
+        from models import Wallet
+
+        wallet = Wallet(credits=self.starting_credits if credits is None else credits,
+                        bonus_spins=bonus_spins)
+        db.session.add(wallet)
+        db.session.commit()
+        self._remember(wallet.id, {'credits': wallet.credits, 'bonus_spins': wallet.bonus_spins})
+        return wallet.id
+
+    def get(self, wallet_id, fresh=False):
+        """Return ``{'credits', 'bonus_spins'}`` or None for an unknown wallet."""
+        if wallet_id is None:
+            return None
+        if not fresh:
+            balance = self._cached(wallet_id)
+            if balance is not None:
+                return balance
+        row = db.session.execute(self._select_statement(wallet_id)).first()
+        return self._loaded(wallet_id, row)
+
+    def _select_statement(self, wallet_id):
+        from models import Wallet
+
+        return select(Wallet.credits, Wallet.bonus_spins).where(Wallet.id == wallet_id)
+
+    def _adjust_statement(self, wallet_id, credits, bonus_spins, required):
+        from models import Wallet
+
+        required = max(required, -credits)
+        return (
+            update(Wallet)
+            .where(Wallet.id == wallet_id,
+                   Wallet.credits >= required,
+                   Wallet.bonus_spins + bonus_spins >= 0)
+            .values(credits=Wallet.credits + credits,
+                    bonus_spins=Wallet.bonus_spins + bonus_spins,
+                    updated_at=datetime.utcnow())
+            .returning(Wallet.credits, Wallet.bonus_spins)
+        )
+
+    def _loaded(self, wallet_id, row):
+        if row is None:
+            return None
+        balance = {'credits': row.credits, 'bonus_spins': row.bonus_spins}
+        self._remember(wallet_id, balance)
+        return balance
+
+    def adjust(self, wallet_id, credits=0, bonus_spins=0, required=0):
+        """
+        Atomically add ``credits`` and ``bonus_spins`` to a wallet.
+
+        The change applies only if the wallet holds at least ``required``
+        credits (and the deltas keep both balances non-negative). Returns the
+        new balance, or None when the condition failed or the wallet does not
+        exist. A failed update rolls the transaction back, so whatever the
+        caller did in it (a counter reservation) is undone too.
+        """
+        statement = self._adjust_statement(wallet_id, credits, bonus_spins, required)
+        try:
+            row = db.session.execute(statement).first()
+            if row is None:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return self._loaded(wallet_id, row)
+
+    async def get_async(self, session, wallet_id, fresh=False):
+        """``get`` on an ``AsyncSession``."""
+        if wallet_id is None:
+            return None
+        if not fresh:
+            balance = self._cached(wallet_id)
+            if balance is not None:
+                return balance
+        row = (await session.execute(self._select_statement(wallet_id))).first()
+        return self._loaded(wallet_id, row)
+
+    async def adjust_async(self, session, wallet_id, credits=0, bonus_spins=0, required=0):
+        """``adjust`` on an ``AsyncSession``."""
+        statement = self._adjust_statement(wallet_id, credits, bonus_spins, required)
+        try:
+            row = (await session.execute(statement)).first()
+            if row is None:
+                await session.rollback()
+            else:
+                await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        return self._loaded(wallet_id, row)
+
+
+wallets = WalletStore()
@@ -1,31 +1,55 @@
-import trafilatura
+"""
+Scrape slot machine design standards into ``slot_standards.txt``.
 
-def get_slot_standards():
-    """
-    Scrape information about slot machine standards from various sources
-    """
-    urls = [
-        "https://slotgator.com/resources/slot-design",
-        "https://igamingbusiness.com/casino/slots/standard-slot-design",
-        "https://www.gambling.com/online-casinos/strategy/slots/layout-explained",
-        "https://www.casinoslotsonline.com/slots/how-slots-work",
-        "https://www.slotsup.com/blog/online-slots-interface-design"
-    ]
-
-    content = []
-    for url in urls:
-        try:
-            downloaded = trafilatura.fetch_url(url)
-            if downloaded:
-                text = trafilatura.extract(downloaded)
-                if text:
-                    content.append(f"\nSource: {url}\n{text}")
-            print(f"Successfully scraped {url}")
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
+Sources are fetched concurrently on a bounded thread pool, with a timeout per
+request and a minimum interval between requests to the same host. Responses
+are cached on disk per URL together with their ``ETag``/``Last-Modified``
+validators. A re-run sends conditional requests, and a source that answers
+``304 Not Modified`` (or returns the same bytes) reuses the cached text
+without extracting it again, so a run over unchanged sources costs only the
+revalidation round trips. A source that cannot be fetched (timeout, network
+error, HTTP error) keeps its cached text, marked ``stale``, so an outage does
+not drop a section from the output. Each section is written to the output as
+soon as its source completes.
+
+The extractor is injectable (``trafilatura.extract`` by default), as are the
+URLs, so the pipeline runs against a local stand-in server::
+
+    python web_scraper.py
+    python web_scraper.py --workers 8 --timeout 5 --min-interval 0.5
+    python web_scraper.py --url http://127.0.0.1:8000/a --url http://127.0.0.1:8000/b
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+URLS = [
+    "https://slotgator.com/resources/slot-design",
+    "https://igamingbusiness.com/casino/slots/standard-slot-design",
+    "https://www.gambling.com/online-casinos/strategy/slots/layout-explained",
+    "https://www.casinoslotsonline.com/slots/how-slots-work",
+    "https://www.slotsup.com/blog/online-slots-interface-design"
+]
+
+OUTPUT_PATH = 'slot_standards.txt'
+CACHE_DIR = '.scrape_cache'
+
+DEFAULT_WORKERS = 4
+# Seconds per request, and between two requests to the same host
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_MIN_INTERVAL = 1.0
+
+USER_AGENT = 'tropical-slot-research/1.0'
 
-    # Add common industry standards manually if scraping fails
-    industry_standards = """
+# Appended to the scraped sources on every run
+INDUSTRY_STANDARDS = """
 Standard Slot Machine Interface Guidelines:
 
 1. Display Dimensions:
@@ -56,14 +80,191 @@ Standard Slot Machine Interface Guidelines:
 - Tablet breakpoint: 1024px
 - Desktop optimization: 1440px
 """
-    content.append(industry_standards)
 
-    with open('slot_standards.txt', 'w', encoding='utf-8') as f:
-        f.write("\n=== Slot Machine Standards Research ===\n")
-        f.write("\n".join(content))
 
-    print("\nResearch has been saved to slot_standards.txt")
+def trafilatura_extract(html):
+    # Heavy import, only needed when a page actually has to be extracted
+    import trafilatura
+
+    return trafilatura.extract(html)
+
+
+class ResponseCache:
+    """One JSON file per URL: validators, a hash of the body and the extracted text."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def put(self, url, entry):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(entry, url=url), f)
+        os.replace(tmp_path, path)
+
+
+class HostRateLimiter:
+    """Spaces out the start of requests to the same host by ``min_interval`` seconds."""
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def fetch(url, cache, limiter, timeout=DEFAULT_TIMEOUT, extract=trafilatura_extract,
+          extractor_name='trafilatura'):
+    """
+    Fetch and extract one source; returns ``(status, text)``.
+
+    ``status`` is ``extracted``, ``not_modified`` (304), ``unchanged`` (same
+    body as cached), ``stale`` (the fetch failed, cached text returned) or
+    ``failed``; text is None when nothing was extracted.
+    """
+    cached = entry = cache.get(url)
+    # Text extracted by another extractor is no use; fetch it unconditionally
+    if entry is not None and entry.get('extractor') != extractor_name:
+        entry = None
+
+    def fallback():
+        # Whatever extractor produced it, the last good text beats a missing section
+        if cached is not None and cached.get('text'):
+            return 'stale', cached['text']
+        return 'failed', None
+
+    headers = {'User-Agent': USER_AGENT}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    limiter.wait(url)
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+            body = response.read()
+            charset = response.headers.get_content_charset() or 'utf-8'
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    except HTTPError as e:
+        if e.code == 304 and entry is not None:
+            return 'not_modified', entry.get('text')
+        print(f"Error scraping {url}: HTTP {e.code}")
+        return fallback()
+    except (URLError, OSError) as e:
+        print(f"Error scraping {url}: {e}")
+        return fallback()
+
+    body_hash = hashlib.sha256(body).hexdigest()
+    if entry is not None and entry.get('body_hash') == body_hash:
+        status, text = 'unchanged', entry.get('text')
+    else:
+        try:
+            status, text = 'extracted', extract(body.decode(charset, errors='replace'))
+        except Exception as e:
+            print(f"Error extracting {url}: {e}")
+            return fallback()
+    cache.put(url, {
+        'etag': etag,
+        'last_modified': last_modified,
+        'body_hash': body_hash,
+        'extractor': extractor_name,
+        'text': text,
+        'fetched_at': time.time(),
+    })
+    return status, text
+
+
+def get_slot_standards(urls=None, output_path=OUTPUT_PATH, cache_dir=CACHE_DIR, workers=DEFAULT_WORKERS,
+                       timeout=DEFAULT_TIMEOUT, min_interval=DEFAULT_MIN_INTERVAL, extract=None,
+                       extractor_name=None):
+    """
+    Scrape information about slot machine standards from various sources.
+
+    Sections are appended to ``output_path`` in completion order. Pass
+    ``cache_dir=None`` to disable the cache, and ``extract`` (a function of
+    the page HTML returning text or None) to replace trafilatura; give a
+    matching ``extractor_name`` so cached texts are not mixed up. Returns
+    ``{url: status}``.
+    """
+    urls = URLS if urls is None else urls
+    if extract is None:
+        extract, extractor_name = trafilatura_extract, 'trafilatura'
+    extractor_name = extractor_name or getattr(extract, '__qualname__', 'custom')
+    cache = ResponseCache(cache_dir)
+    limiter = HostRateLimiter(min_interval)
+
+    statuses = {}
+    with open(output_path, 'w', encoding='utf-8') as out:
+        out.write("\n=== Slot Machine Standards Research ===\n")
+        out.flush()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(fetch, url, cache, limiter, timeout, extract, extractor_name): url
+                       for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                status, text = future.result()
+                statuses[url] = status
+                if text:
+                    out.write(f"\nSource: {url}\n{text}\n")
+                    out.flush()
+                if status == 'stale':
+                    print(f"Using the cached copy of {url}")
+                elif status != 'failed':
+                    print(f"Successfully scraped {url} ({status.replace('_', ' ')})")
+        out.write(INDUSTRY_STANDARDS)
+
+    print(f"\nResearch has been saved to {output_path}")
+    return statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape slot machine design standards")
+    parser.add_argument('--url', action='append', help="source URL (repeatable; default: the built-in list)")
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true', help="fetch and extract everything again")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="seconds per request")
+    parser.add_argument('--min-interval', type=float, default=DEFAULT_MIN_INTERVAL,
+                        help="seconds between requests to the same host")
+    args = parser.parse_args(argv)
 
-if __name__ == "__main__":
     print("Starting research on slot machine standards...")
-    get_slot_standards()
\ No newline at end of file
+    started = time.perf_counter()
+    statuses = get_slot_standards(args.url, args.output, None if args.no_cache else args.cache_dir,
+                                  args.workers, args.timeout, args.min_interval)
+    counts = {}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(f"{len(statuses)} sources in {time.perf_counter() - started:.2f}s: "
+          + ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in sorted(counts.items())))
+
+
+if __name__ == "__main__":
+    main()